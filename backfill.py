@@ -0,0 +1,55 @@
+"""
+Command-line backfill of historical device readings.
+
+Usage:
+    python backfill.py --device-id 12 readings.csv
+    python backfill.py --device-id 12 --format ndjson readings.ndjson
+
+CSV files need a header row with created_at and any of field1..field15.
+On PostgreSQL the rows are streamed with COPY; otherwise batched INSERTs are used.
+"""
+
+import argparse
+import sys
+import time
+from utils.database_config import SessionLocal, create_all_tables
+from utils.devicedata_loader import load_device_data, iter_csv_rows, iter_ndjson_rows, BACKFILL_BATCH_SIZE
+from models.device import Devices
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Backfill historical readings into devicedata.")
+    parser.add_argument("path", help="CSV or NDJSON file ('-' for stdin)")
+    parser.add_argument("--device-id", type=int, required=True, help="Target deviceID")
+    parser.add_argument("--format", choices=["csv", "ndjson"], help="Input format (default: from file extension)")
+    parser.add_argument("--batch-size", type=int, default=BACKFILL_BATCH_SIZE, help="Rows per batch")
+    args = parser.parse_args(argv)
+
+    data_format = args.format or ("ndjson" if args.path.endswith((".ndjson", ".jsonl")) else "csv")
+    create_all_tables()
+
+    db = SessionLocal()
+    source = sys.stdin if args.path == "-" else open(args.path, newline="", encoding="utf-8")
+    try:
+        if not db.query(Devices).filter_by(deviceID=args.device_id).first():
+            print(f"❌ Device {args.device_id} not found")
+            return 1
+        rows = iter_csv_rows(source) if data_format == "csv" else iter_ndjson_rows(source)
+        started = time.perf_counter()
+        count = load_device_data(db, args.device_id, rows, args.batch_size)
+        db.commit()
+        elapsed = time.perf_counter() - started
+        print(f"✅ Loaded {count} readings for device {args.device_id} in {elapsed:.1f}s")
+        return 0
+    except ValueError as e:
+        db.rollback()
+        print(f"❌ Backfill failed, nothing was written: {e}")
+        return 1
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        db.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,45 +1,22 @@
 import random
 import string
 from fastapi import HTTPException
-from sqlalchemy.orm import Session
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session, aliased
 from models.device import Devices
 from models.firmware import Firmware
 from models.profile import Profiles
-from models.devicedata_value import DeviceData
 from models.config_value import ConfigValues
 from models.metadata_value import MetadataValues
+from models.device_shadow import DeviceShadow
 from schemas.status import DeviceStatus, FirmwareDownload
+from utils.device_status import build_device_status
+from utils import device_shadow, aggregation, rollups, partitioning
+from utils.devicedata_writer import DEVICEDATA_FIELDS
 import uuid
 from datetime import datetime
-from fastapi import HTTPException
 
 class DeviceController:
-    @staticmethod
-    def build_device_status(db: Session, device: Devices, latest_config) -> dict:
-        """Build standardized status structure for device responses"""
-        # Get firmware information for the target firmware version
-        firmware_version = "unknown"
-        firmware_crc = "0x00000000"
-        firmware_bin_size = 0
-        
-        if device.targetFirmwareVersion:
-            firmware = db.query(Firmware).filter_by(id=device.targetFirmwareVersion).first()
-            if firmware:
-                firmware_version = firmware.firmware_version
-                firmware_crc = firmware.crc32 or "0x00000000"
-                firmware_bin_size = firmware.firmware_bin_size
-        
-        return {
-            "config_updated": latest_config.config_updated if latest_config else False,
-            "fileDownloadState": device.fileDownloadState,
-            "firmwareDownload": {
-                "firmwareDownloadState": device.firmwareDownloadState,
-                "version": firmware_version,
-                "fwcrc": firmware_crc,
-                "firmware_size": firmware_bin_size
-            }
-        }
-
     @staticmethod
     def create_device(db: Session, organisation_id, device_data):
         # Check for duplicate name, readkey, writekey, deviceID
@@ -89,40 +66,163 @@ class DeviceController:
         return new_device
 
     @staticmethod
-    def get_devices(db: Session, organisation_id):
-        # Get devices that belong to profiles in the user's organization
-        devices = db.query(Devices).join(Profiles).filter(Profiles.organisation_id == organisation_id).all()
-        devices_list = []
-        for device in devices:
-            currentFirmware = db.query(Firmware).filter_by(id=device.currentFirmwareVersion).first()
-            previousFirmware = db.query(Firmware).filter_by(id=device.previousFirmwareVersion).first()
-            targetFirmware = db.query(Firmware).filter_by(id=device.targetFirmwareVersion).first()
-            currentFirmwareVersion = currentFirmware.firmware_version if currentFirmware else None
-            previousFirmwareVersion = previousFirmware.firmware_version if previousFirmware else currentFirmwareVersion
-            targetFirmwareVersion = targetFirmware.firmware_version if targetFirmware else currentFirmwareVersion
-            profile = db.query(Profiles).filter_by(id=device.profile).first()
-            profile_name = profile.name if profile else None
-            last_metadata_entry = db.query(DeviceData).filter_by(deviceID=device.deviceID).order_by(DeviceData.created_at.desc()).first()
-            last_posted_time = last_metadata_entry.created_at if last_metadata_entry else None
-            device_dict = {
-                'id': device.id,
-                'name': device.name,
-                'readkey': device.readkey,
-                'writekey': device.writekey,
-                'deviceID': device.deviceID,
-                'networkID': device.networkID,
-                'currentFirmwareVersion': currentFirmwareVersion,
-                'previousFirmwareVersion': previousFirmwareVersion,
-                'targetFirmwareVersion': targetFirmwareVersion,
-                'fileDownloadState': device.fileDownloadState,
-                'profile': device.profile,
-                'profile_name': profile_name,
-                'last_posted_time': last_posted_time,
-                'created_at': device.created_at,
-                'firmwareDownloadState': device.firmwareDownloadState,
-            }
-            devices_list.append(device_dict)
-        return devices_list
+    def device_list_columns(db: Session) -> dict:
+        """Response key -> SQL expression for the device list; firmware ids are resolved to versions."""
+        current = aliased(Firmware)
+        previous = aliased(Firmware)
+        target = aliased(Firmware)
+        # Readings from before the shadow table existed fall back to an indexed MAX() per device
+        source = partitioning.source_for_range(db)
+        last_reading = (
+            select(func.max(source.c.created_at))
+            .where(source.c.deviceID == Devices.deviceID)
+            .correlate(Devices)
+            .scalar_subquery()
+        )
+        columns = {
+            'id': Devices.id,
+            'name': Devices.name,
+            'readkey': Devices.readkey,
+            'writekey': Devices.writekey,
+            'deviceID': Devices.deviceID,
+            'networkID': Devices.networkID,
+            'currentFirmwareVersion': current.firmware_version,
+            'previousFirmwareVersion': func.coalesce(previous.firmware_version, current.firmware_version),
+            'targetFirmwareVersion': func.coalesce(target.firmware_version, current.firmware_version),
+            'fileDownloadState': Devices.fileDownloadState,
+            'profile': Devices.profile,
+            'profile_name': Profiles.name,
+            'last_posted_time': func.coalesce(DeviceShadow.data_at, last_reading),
+            'created_at': Devices.created_at,
+            'firmwareDownloadState': Devices.firmwareDownloadState,
+        }
+        joins = [
+            (current, current.id == Devices.currentFirmwareVersion),
+            (previous, previous.id == Devices.previousFirmwareVersion),
+            (target, target.id == Devices.targetFirmwareVersion),
+            (DeviceShadow, DeviceShadow.deviceID == Devices.deviceID),
+        ]
+        return columns, joins
+
+    @staticmethod
+    def get_devices(db: Session, organisation_id, after: int = None, limit: int = None, fields: list = None):
+        """
+        Devices in the organisation ordered by deviceID, in one query.
+
+        `after`/`limit` page through the list by deviceID (keyset pagination);
+        `fields` restricts the returned keys (deviceID is always included).
+        """
+        columns, joins = DeviceController.device_list_columns(db)
+        if fields:
+            unknown = [field for field in fields if field not in columns]
+            if unknown:
+                raise HTTPException(status_code=400, detail=f"Unknown device fields: {', '.join(unknown)}")
+            columns = {key: columns[key] for key in ['deviceID', *fields]}
+
+        query = db.query(*[expression.label(key) for key, expression in columns.items()]).select_from(Devices).join(
+            Profiles, Profiles.id == Devices.profile
+        )
+        for table, condition in joins:
+            query = query.outerjoin(table, condition)
+        query = query.filter(Profiles.organisation_id == organisation_id).order_by(Devices.deviceID)
+        if after is not None:
+            query = query.filter(Devices.deviceID > after)
+        if limit is not None:
+            query = query.limit(limit)
+        return [dict(row._mapping) for row in query]
+
+    @staticmethod
+    def resolve_data_fields(db: Session, organisation_id, deviceID: int, fields: list = None):
+        """Check the device belongs to the organisation; return its profile's field labels and the
+        fieldN columns to read (validated, defaulting to the labelled ones)."""
+        profile = db.query(Profiles).join(Devices, Devices.profile == Profiles.id).filter(
+            Devices.deviceID == deviceID,
+            Profiles.organisation_id == organisation_id
+        ).first()
+        if not profile:
+            raise HTTPException(status_code=404, detail="Device not found!")
+
+        labels = {f'field{i}': getattr(profile, f'field{i}') for i in range(1, 16) if getattr(profile, f'field{i}')}
+        if fields:
+            unknown = [field for field in fields if field not in DEVICEDATA_FIELDS]
+            if unknown:
+                raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+        else:
+            fields = list(labels) or DEVICEDATA_FIELDS
+        return labels, fields
+
+    @staticmethod
+    def get_device_data(db: Session, organisation_id, deviceID: int, start: datetime = None, end: datetime = None,
+                        fields: list = None, after_entry: int = None, limit: int = 1000) -> dict:
+        """
+        Readings for one device in entryID order as columnar JSON: one array per column.
+
+        Pages are keyed on (deviceID, entryID) - pass the returned next_after_entry as
+        after_entry to continue - so every page is an index range scan, never an OFFSET.
+        Only the requested fieldN columns are read (default: the fields the profile labels).
+        """
+        labels, fields = DeviceController.resolve_data_fields(db, organisation_id, deviceID, fields)
+
+        source = partitioning.source_for_range(db, start, end)
+        query = select(source.c.entryID, source.c.created_at, *[source.c[field] for field in fields]).where(
+            source.c.deviceID == deviceID
+        )
+        if after_entry is not None:
+            query = query.where(source.c.entryID > after_entry)
+        if start is not None:
+            query = query.where(source.c.created_at >= start)
+        if end is not None:
+            query = query.where(source.c.created_at < end)
+        rows = db.execute(query.order_by(source.c.entryID).limit(limit)).all()
+
+        column_names = ['entryID', 'created_at', *fields]
+        columns = {name: list(values) for name, values in zip(column_names, zip(*rows))} if rows else {name: [] for name in column_names}
+        return {
+            'deviceID': deviceID,
+            'count': len(rows),
+            'labels': {field: labels[field] for field in fields if field in labels},
+            'columns': columns,
+            'next_after_entry': rows[-1][0] if len(rows) == limit else None,
+        }
+
+    @staticmethod
+    def aggregate_device_data(db: Session, organisation_id, deviceID: int, bucket: str = '1h', stats: list = None,
+                              fields: list = None, start: datetime = None, end: datetime = None) -> dict:
+        """Bucketed statistics (count/sum/min/max/mean/std/median/pNN) per field, as arrays aligned on bucket_start."""
+        try:
+            bucket_seconds = aggregation.parse_bucket(bucket)
+            stats = aggregation.parse_stats(stats or ['mean'])
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        if start is not None and end is not None and (end - start).total_seconds() / bucket_seconds > aggregation.AGGREGATE_MAX_BUCKETS:
+            raise HTTPException(status_code=400, detail=f"Window spans more than {aggregation.AGGREGATE_MAX_BUCKETS} buckets; use a larger bucket")
+        labels, fields = DeviceController.resolve_data_fields(db, organisation_id, deviceID, fields)
+
+        times, columns, unparseable = aggregation.load_window(db, deviceID, fields, start, end)
+        result = aggregation.aggregate(times, columns, bucket_seconds, stats)
+        return {
+            'deviceID': deviceID,
+            'bucket': bucket,
+            'labels': {field: labels[field] for field in fields if field in labels},
+            'readings': int(len(times)),
+            'unparseable': unparseable,
+            **result,
+        }
+
+    @staticmethod
+    def get_device_rollups(db: Session, organisation_id, deviceID: int, resolution: str = 'auto', fields: list = None,
+                           start: datetime = None, end: datetime = None) -> dict:
+        """Pre-computed 1m/1h/1d rollups per field; 'auto' picks the finest resolution that fits the window."""
+        if resolution != 'auto' and resolution not in rollups.ROLLUPS:
+            raise HTTPException(status_code=400, detail=f"Unknown resolution '{resolution}', expected auto, {', '.join(rollups.ROLLUPS)}")
+        labels, fields = DeviceController.resolve_data_fields(db, organisation_id, deviceID, fields)
+        if resolution == 'auto':
+            resolution = rollups.pick_resolution(start, end)
+        return {
+            'deviceID': deviceID,
+            'labels': {field: labels[field] for field in fields if field in labels},
+            **rollups.read_rollups(db, deviceID, resolution, fields, start, end),
+        }
 
     @staticmethod
     def get_device(db: Session, organisation_id, deviceID):
@@ -159,7 +259,10 @@ class DeviceController:
                 if config_val:
                     config_names[f'config{i}'] = config_val
         
-        device_data = db.query(DeviceData).filter_by(deviceID=deviceID).order_by(DeviceData.created_at.desc()).limit(100).all()
+        source = partitioning.source_for_range(db)
+        device_data = db.execute(
+            select(source).where(source.c.deviceID == deviceID).order_by(source.c.created_at.desc()).limit(100)
+        ).all()
         config_data = db.query(ConfigValues).filter_by(deviceID=deviceID).order_by(ConfigValues.created_at.desc()).limit(100).all()
         meta_data = db.query(MetadataValues).filter_by(deviceID=deviceID).order_by(MetadataValues.created_at.desc()).limit(100).all()
         device_data_list = []
@@ -271,7 +374,7 @@ class DeviceController:
             return {'message': 'Device not found!'}, 404
         try:
             profile = db.query(Profiles).filter_by(id=device.profile).first()
-            latest_config = db.query(ConfigValues).filter_by(deviceID=device.deviceID).order_by(ConfigValues.created_at.desc()).first()
+            latest_config = device_shadow.latest_config(db, device.deviceID)
             
             # Update config_updated to True since device is fetching its configuration
             if latest_config:
@@ -284,7 +387,7 @@ class DeviceController:
                 'networkID': device.networkID,
                 'writekey': device.writekey,
                 'readkey': device.readkey,
-                'status': DeviceController.build_device_status(db, device, latest_config),
+                'status': build_device_status(db, device, latest_config),
                 'configs': {}
             }
             if profile and latest_config:
@@ -1,108 +1,213 @@
+from sqlalchemy import func
 from sqlalchemy.orm import Session
 from models.device import Devices
 from models.profile import Profiles
 from models.devicedata_value import DeviceData
 from models.metadata_value import MetadataValues
 from models.config_value import ConfigValues
-from models.firmware import Firmware
 from schemas.device_data import DeviceDataCreate, MetadataValuesCreate, ConfigValuesCreate
 from datetime import datetime, timedelta
 from fastapi import HTTPException
-import uuid
+from utils.entry_id_allocator import entry_id_allocator
+from utils.devicedata_writer import parse_timestamps, build_device_data_row, write_device_data_rows
+from utils.devicedata_loader import load_device_data, iter_csv_rows, iter_ndjson_rows, BACKFILL_BATCH_SIZE
+from utils.ingest_buffer import ingest_buffer, BufferFull
+from utils.cache import device_key_cache, firmware_descriptor_cache, apply_mask
+from controllers.user_org import OrganisationController
+from utils.config_notify import config_notifier
+from utils import device_shadow
+from utils.device_shadow import record_metadata, record_configs, config_row
+from utils.uuid7 import uuid7
+from utils import binary_ingest
+import io
+from itertools import islice
 
 # Import new status schemas
 from schemas.status import DeviceStatus, FirmwareDownload
+from utils.device_status import build_device_status
 
 class DeviceDataController:
-    @staticmethod
-    def build_device_status(db: Session, device: Devices, latest_config) -> dict:
-        """Build standardized status structure for device responses"""
-        # Get firmware information for the target firmware version
-        firmware_version = "unknown"
-        firmware_crc = "0x00000000"
-        firmware_bin_size = 0
-        
-        if device.targetFirmwareVersion:
-            firmware = db.query(Firmware).filter_by(id=device.targetFirmwareVersion).first()
-            if firmware:
-                firmware_version = firmware.firmware_version
-                firmware_crc = firmware.crc32 or "0x00000000"
-                firmware_bin_size = firmware.firmware_bin_size
-        
-        return {
-            "config_updated": latest_config.config_updated if latest_config else False,
-            "fileDownloadState": device.fileDownloadState,
-            "firmwareDownload": {
-                "firmwareDownloadState": device.firmwareDownloadState,
-                "version": firmware_version,
-                "fwcrc": firmware_crc,
-                "firmware_size": firmware_bin_size
-            }
-        }
-
     @staticmethod
     def update_device_data(db: Session, writekey: str, fields: dict):
-        device = db.query(Devices).filter_by(writekey=writekey).first()
-        if not device:
+        device_key = device_key_cache.get(db, writekey)
+        if not device_key:
             raise HTTPException(status_code=403, detail="Invalid API key!")
-        profile = db.query(Profiles).filter_by(id=device.profile).first()
-        field_label = {f'field{i}': getattr(profile, f'field{i}', None) for i in range(1, 16)}
-        data_fields = {}
-        for i in range(1, 16):
-            key = f'field{i}'
-            data_fields[key] = fields.get(key) if field_label[key] else None
-        entryID = DeviceData.get_next_entry_id(db, device.deviceID)
-        new_entry = DeviceData(
-            created_at=datetime.now(),
-            deviceID=device.deviceID,
-            entryID=entryID,
-            **data_fields
-        )
-        db.add(new_entry)
+        # Only keep the fields the device's profile has enabled
+        data_fields = apply_mask(fields, 'field', device_key.field_mask)
+        entryID = entry_id_allocator.allocate(db, device_key.deviceID)[0]
+        row = build_device_data_row(device_key.deviceID, entryID, datetime.now(), data_fields)
+        if ingest_buffer.enabled:
+            # Write-behind: acknowledge now, the background flusher writes it with its batch
+            try:
+                ingest_buffer.put(row)
+            except BufferFull:
+                raise HTTPException(status_code=503, detail="Ingest buffer is full, retry later.")
+            return row
+        write_device_data_rows(db, [row])
         db.commit()
-        return new_entry
+        return row
 
     @staticmethod
-    def bulk_update(db: Session, deviceID: int, updates: list):
+    def binary_update(db: Session, payload: bytes, org_token: str = None):
+        """
+        Store a batch of readings sent in the compact binary format (utils/binary_ingest.py).
+
+        Payloads keyed by writekey authenticate like /device_data/update; payloads keyed
+        by deviceID are for gateways and need the device's organisation token.
+        """
+        try:
+            readings = binary_ingest.decode(payload)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        if readings.writekey is not None:
+            device_key = device_key_cache.get(db, readings.writekey)
+        else:
+            if not org_token:
+                raise HTTPException(status_code=403, detail="org_token is required for payloads keyed by deviceID!")
+            organisation_id = OrganisationController.get_organisation_id_by_token(db, org_token)
+            if not organisation_id:
+                raise HTTPException(status_code=404, detail="Invalid organization token!")
+            device = db.query(Devices.writekey, Devices.profile).filter_by(deviceID=readings.deviceID).first()
+            if not device:
+                raise HTTPException(status_code=404, detail="Device not found!")
+            if not OrganisationController.device_belongs_to_organisation(db, device, organisation_id):
+                raise HTTPException(status_code=403, detail="Device does not belong to your organization!")
+            device_key = device_key_cache.get(db, device.writekey)
+        if not device_key:
+            raise HTTPException(status_code=403, detail="Invalid API key!")
+
+        entry_ids = entry_id_allocator.allocate(db, device_key.deviceID, readings.count)
+        # Only keep the fields the device's profile has enabled
+        rows = readings.rows(device_key.deviceID, entry_ids, datetime.now(), device_key.field_mask)
+
+        if ingest_buffer.enabled:
+            try:
+                for row in rows:
+                    ingest_buffer.put(row)
+            except BufferFull:
+                raise HTTPException(status_code=503, detail="Ingest buffer is full, retry later.")
+        else:
+            write_device_data_rows(db, rows)
+            db.commit()
+        return {"message": "success", "deviceID": device_key.deviceID, "count": len(rows), "last_entry_id": entry_ids[-1]}
+
+    @staticmethod
+    def bulk_update(db: Session, deviceID: int, updates, batch_size: int = BACKFILL_BATCH_SIZE):
+        """
+        Store a batch of readings. `updates` is any iterable of reading dicts (the
+        route passes iter_json_rows over the uploaded body), written batch_size at
+        a time in one transaction; any bad reading fails the whole upload with 400.
+        """
         device = db.query(Devices).filter_by(deviceID=deviceID).first()
         if not device:
             raise HTTPException(status_code=404, detail="Device not found!")
-        for update in updates:
-            created_at = update.get('created_at')
-            if created_at:
-                created_at = datetime.strptime(created_at, '%Y-%m-%d %H:%M:%S')
-            else:
-                created_at = datetime.now()
-            fields = {f'field{i}': update.get(f'field{i}', None) for i in range(1, 16)}
-            entryID = DeviceData.get_next_entry_id(db, device.deviceID)
-            new_entry = DeviceData(
-                deviceID=device.deviceID,
-                created_at=created_at,
-                entryID=entryID,
-                **fields
-            )
-            db.add(new_entry)
+        updates = iter(updates)
+        written = 0
+        try:
+            while batch := list(islice(updates, batch_size)):
+                if not all(isinstance(update, dict) for update in batch):
+                    raise ValueError("Each update must be an object.")
+                timestamps = parse_timestamps([update.get('created_at') for update in batch], start=written)
+                # Reserve entryIDs for the whole batch up front instead of one MAX() query per row
+                if written and db.get_bind().dialect.name == 'sqlite':
+                    # The session already holds the SQLite write lock, so reserve ids in the same transaction
+                    entry_ids = entry_id_allocator.reserve_in_transaction(db.connection(), device.deviceID, len(batch))
+                else:
+                    entry_ids = entry_id_allocator.allocate(db, device.deviceID, len(batch))
+                rows = [
+                    build_device_data_row(device.deviceID, entryID, created_at, update)
+                    for update, entryID, created_at in zip(batch, entry_ids, timestamps)
+                ]
+                write_device_data_rows(db, rows)
+                written += len(batch)
+        except (ValueError, UnicodeDecodeError) as e:
+            db.rollback()
+            raise HTTPException(status_code=400, detail=str(e))
         db.commit()
         return {"message": "success"}
 
+    @staticmethod
+    def backfill(db: Session, organisation_id, deviceID: int, stream, data_format: str = "csv"):
+        """Load historical readings from a CSV or NDJSON byte stream (COPY on PostgreSQL)."""
+        device = db.query(Devices).join(Profiles).filter(
+            Devices.deviceID == deviceID,
+            Profiles.organisation_id == organisation_id
+        ).first()
+        if not device:
+            raise HTTPException(status_code=404, detail="Device not found!")
+        if data_format not in ("csv", "ndjson"):
+            raise HTTPException(status_code=400, detail="format must be 'csv' or 'ndjson'.")
+        text_stream = io.TextIOWrapper(stream, encoding="utf-8", newline="")
+        rows = iter_csv_rows(text_stream) if data_format == "csv" else iter_ndjson_rows(text_stream)
+        try:
+            count = load_device_data(db, device.deviceID, rows)
+            db.commit()
+        except (ValueError, UnicodeDecodeError) as e:
+            db.rollback()
+            raise HTTPException(status_code=400, detail=str(e))
+        return {"message": "success", "rows": count}
+
+    @staticmethod
+    def checkin(db: Session, writekey: str, fields: dict = None, metadata: dict = None):
+        """
+        Store a reading and/or metadata and return status plus any pending config, acknowledging it.
+
+        Everything happens in one transaction. With warm caches this is two SELECTs
+        (device, latest config via device_shadow), up to five writes (reading and
+        metadata, each with its shadow upsert, and the config ack) and the commit.
+        """
+        device_key = device_key_cache.get(db, writekey)
+        if not device_key:
+            raise HTTPException(status_code=403, detail="Invalid API key!")
+        device = db.query(Devices).filter_by(deviceID=device_key.deviceID).first()
+        if not device:
+            raise HTTPException(status_code=403, detail="Invalid API key!")
+
+        now = datetime.now()
+        if fields:
+            # Written directly rather than through the write-behind buffer so the reading shares this transaction
+            entryID = entry_id_allocator.allocate(db, device.deviceID)[0]
+            data_fields = apply_mask(fields, 'field', device_key.field_mask)
+            write_device_data_rows(db, [build_device_data_row(device.deviceID, entryID, now, data_fields)])
+        if metadata:
+            data_metadatas = apply_mask(metadata, 'metadata', device_key.metadata_mask)
+            db.add(MetadataValues(created_at=now, deviceID=device.deviceID, **data_metadatas))
+            record_metadata(db, [{'deviceID': device.deviceID, 'created_at': now, **data_metadatas}])
+
+        latest_config = device_shadow.latest_config(db, device.deviceID)
+        response = {
+            "message": "success",
+            "deviceID": device.deviceID,
+            "status": build_device_status(db, device, latest_config),
+        }
+        if latest_config is None:
+            response["status"]["config_updated"] = None
+        elif latest_config.config_updated == False:
+            # Deliver the pending config and acknowledge it in the same commit
+            response["configs"] = {
+                f'config{i}': getattr(latest_config, f'config{i}')
+                for i in range(1, 11)
+                if getattr(latest_config, f'config{i}') is not None
+            }
+            response["status"]["config_updated"] = True
+            latest_config.config_updated = True
+        db.commit()
+        return response
+
 class MetadataValuesController:
     @staticmethod
     def update_metadata(db: Session, writekey: str, metadatas: dict):
-        device = db.query(Devices).filter_by(writekey=writekey).first()
-        if not device:
+        device_key = device_key_cache.get(db, writekey)
+        if not device_key:
             raise HTTPException(status_code=403, detail="Invalid API key!")
-        profile = db.query(Profiles).filter_by(id=device.profile).first()
-        metadata_label = {f'metadata{i}': getattr(profile, f'metadata{i}', None) for i in range(1, 16)}
-        data_metadatas = {}
-        for i in range(1, 16):
-            key = f'metadata{i}'
-            data_metadatas[key] = metadatas.get(key) if metadata_label[key] else None
+        data_metadatas = apply_mask(metadatas, 'metadata', device_key.metadata_mask)
         new_entry = MetadataValues(
             created_at=datetime.now(),
-            deviceID=device.deviceID,
+            deviceID=device_key.deviceID,
             **data_metadatas
         )
         db.add(new_entry)
+        record_metadata(db, [{'deviceID': device_key.deviceID, 'created_at': new_entry.created_at, **data_metadatas}])
         db.commit()
         return new_entry
 
@@ -122,21 +227,26 @@ class MetadataValuesController:
             if not device:
                 raise HTTPException(status_code=404, detail="Device not found!")
             
-            # Get the device's profile and check if it belongs to the organization
-            profile = db.query(Profiles).filter_by(id=device.profile).first()
-            if not profile or str(profile.organisation_id) != organisation_id:
+            # Check the device's profile belongs to the organization
+            if not OrganisationController.device_belongs_to_organisation(db, device, organisation_id):
                 raise HTTPException(status_code=403, detail="Device does not belong to your organization!")
             
             # Get the latest metadata entry
-            latest_metadata = db.query(MetadataValues).filter_by(deviceID=deviceID).order_by(MetadataValues.created_at.desc()).first()
+            shadow = device_shadow.get_shadows(db, [deviceID]).get(deviceID)
+            if shadow and shadow.meta_at:
+                latest_metadata = MetadataValues(created_at=shadow.meta_at, deviceID=deviceID, **{
+                    f'metadata{i}': shadow.meta.get(f'metadata{i}') for i in range(1, 16)
+                })
+            else:
+                latest_metadata = db.query(MetadataValues).filter_by(deviceID=deviceID).order_by(MetadataValues.created_at.desc()).first()
             
             # Get the latest config for config_updated status
-            latest_config = db.query(ConfigValues).filter_by(deviceID=deviceID).order_by(ConfigValues.created_at.desc()).first()
+            latest_config = device_shadow.latest_config(db, deviceID)
             
             # Prepare the response with status information
             metadata_response = {
                 "deviceID": deviceID,
-                "status": DeviceDataController.build_device_status(db, device, latest_config),
+                "status": build_device_status(db, device, latest_config),
                 "metadata": {},
                 "created_at": latest_metadata.created_at if latest_metadata else None
             }
@@ -200,9 +310,8 @@ class MetadataValuesController:
                     }
                 }
             
-            # Get the device's profile and check if it belongs to the organization
-            profile = db.query(Profiles).filter_by(id=device.profile).first()
-            if not profile or str(profile.organisation_id) != organisation_id:
+            # Check the device's profile belongs to the organization
+            if not OrganisationController.device_belongs_to_organisation(db, device, organisation_id):
                 return {
                     "message": "failure",
                     "reason": "Device does not belong to your organization",
@@ -235,14 +344,15 @@ class MetadataValuesController:
                 **data_metadata
             )
             db.add(new_entry)
+            record_metadata(db, [{'deviceID': device.deviceID, 'created_at': new_entry.created_at, **data_metadata}])
             db.commit()
             
             # Get latest config for status
-            latest_config = db.query(ConfigValues).filter_by(deviceID=deviceID).order_by(ConfigValues.created_at.desc()).first()
+            latest_config = device_shadow.latest_config(db, deviceID)
             
             return {
                 "message": "success",
-                "status": DeviceDataController.build_device_status(db, device, latest_config)
+                "status": build_device_status(db, device, latest_config)
             }
             
         except Exception as e:
@@ -270,7 +380,7 @@ class ConfigValuesController:
         if not device:
             raise HTTPException(status_code=404, detail="Device not found!")
         profile = db.query(Profiles).filter_by(id=device.profile).first()
-        latest_config = db.query(ConfigValues).filter_by(deviceID=deviceID).order_by(ConfigValues.created_at.desc()).first()
+        latest_config = device_shadow.latest_config(db, deviceID)
         config_data = {}
         for i in range(1, 11):
             key = f'config{i}'
@@ -282,17 +392,17 @@ class ConfigValuesController:
             **config_data
         )
         db.add(new_entry)
+        db.flush()
+        record_configs(db, [config_row(new_entry)])
+        config_notifier.publish(db, [deviceID])
         db.commit()
         db.refresh(new_entry)
         
-        # Get latest config for status
-        latest_config = db.query(ConfigValues).filter_by(deviceID=device.deviceID).order_by(ConfigValues.created_at.desc()).first()
-        
         # Return configuration in same format as get_config_data
         configuration = {
             "deviceID": device.deviceID,
             "fileDownloadState": device.fileDownloadState,
-            "status": DeviceDataController.build_device_status(db, device, latest_config),
+            "status": build_device_status(db, device, new_entry),
             "configs": {}
         }
         for i in range(1, 11):
@@ -301,51 +411,58 @@ class ConfigValuesController:
                 configuration["configs"][f'config{i}'] = config_value
         return configuration
 
+    @staticmethod
+    def latest_configs(db: Session, device_ids) -> dict:
+        """deviceID -> latest ConfigValues row for each device that has one (served from device_shadow)."""
+        return device_shadow.latest_configs(db, device_ids)
+
     @staticmethod
     def mass_edit_config_data(db: Session, device_ids: list, config_values: dict):
         results = {'success': [], 'failed': []}
+        wanted = []
         for device_id in device_ids:
             try:
-                device = db.query(Devices).filter_by(deviceID=device_id).first()
-                if not device:
-                    results['failed'].append({'deviceID': device_id, 'error': 'Device not found'})
-                    continue
-                latest_config = db.query(ConfigValues).filter_by(deviceID=device_id).order_by(ConfigValues.created_at.desc()).first()
-                configs = {}
-                for i in range(1, 11):
-                    key = f'config{i}'
-                    new_value = config_values.get(key)
-                    if new_value == "":
-                        configs[key] = getattr(latest_config, key, None) if latest_config else None
-                    else:
-                        configs[key] = new_value
-                new_config = ConfigValues(
-                    created_at=datetime.now(),
-                    deviceID=device_id,
-                    **configs
-                )
-                db.add(new_config)
-                db.flush()  # Flush to get the new config data
-                db.refresh(new_config)
-                
-                # Get latest config for status
-                latest_config = db.query(ConfigValues).filter_by(deviceID=device.deviceID).order_by(ConfigValues.created_at.desc()).first()
-                
-                # Create config response with status field
-                device_config = {
-                    "deviceID": device.deviceID,
-                    "fileDownloadState": device.fileDownloadState,
-                    "status": DeviceDataController.build_device_status(db, device, latest_config),
-                    "configs": {}
-                }
-                for i in range(1, 11):
-                    config_value = getattr(new_config, f'config{i}', None)
-                    if config_value is not None:
-                        device_config["configs"][f'config{i}'] = config_value
-                
-                results['success'].append(device_config)
-            except Exception as e:
-                results['failed'].append({'deviceID': device_id, 'error': str(e)})
+                device_id = int(device_id)
+            except (TypeError, ValueError):
+                results['failed'].append({'deviceID': device_id, 'error': 'Invalid deviceID'})
+                continue
+            if device_id not in wanted:
+                wanted.append(device_id)
+
+        # Load everything up front: devices, their latest configs and target firmware
+        devices = {device.deviceID: device for device in db.query(Devices).filter(Devices.deviceID.in_(wanted))} if wanted else {}
+        latest_configs = ConfigValuesController.latest_configs(db, list(devices))
+        firmware_descriptor_cache.prime(db, [device.targetFirmwareVersion for device in devices.values()])
+
+        created_at = datetime.now()
+        new_rows = []
+        for device_id in wanted:
+            device = devices.get(device_id)
+            if not device:
+                results['failed'].append({'deviceID': device_id, 'error': 'Device not found'})
+                continue
+            latest_config = latest_configs.get(device_id)
+            configs = {}
+            for i in range(1, 11):
+                key = f'config{i}'
+                new_value = config_values.get(key)
+                if new_value == "":
+                    configs[key] = getattr(latest_config, key, None) if latest_config else None
+                else:
+                    configs[key] = new_value
+            new_rows.append({'id': uuid7(), 'created_at': created_at, 'deviceID': device_id, 'config_updated': False, **configs})
+            # The new row is now the latest config and starts with config_updated=False
+            results['success'].append({
+                "deviceID": device.deviceID,
+                "fileDownloadState": device.fileDownloadState,
+                "status": build_device_status(db, device, None),
+                "configs": {key: value for key, value in configs.items() if value is not None}
+            })
+
+        if new_rows:
+            db.execute(ConfigValues.__table__.insert(), new_rows)
+            record_configs(db, new_rows)
+        config_notifier.publish(db, [config['deviceID'] for config in results['success']])
         db.commit()
         return results
 
@@ -354,13 +471,13 @@ class ConfigValuesController:
         device = db.query(Devices).filter_by(deviceID=deviceID).first()
         if not device:
             raise HTTPException(status_code=404, detail="Device not found!")
-        config_data = db.query(ConfigValues).filter_by(deviceID=deviceID).order_by(ConfigValues.created_at.desc()).first()
+        config_data = device_shadow.latest_config(db, deviceID)
         if not config_data:
             raise HTTPException(status_code=404, detail="No config data found for this device!")
         configuration = {
             "deviceID": device.deviceID,
             "fileDownloadState": device.fileDownloadState,
-            "status": DeviceDataController.build_device_status(db, device, config_data),
+            "status": build_device_status(db, device, config_data),
             "configs": {}
         }
         for i in range(1, 11):
@@ -384,13 +501,12 @@ class ConfigValuesController:
         if not device:
             raise HTTPException(status_code=404, detail="Device not found!")
         
-        # Get the device's profile and check if it belongs to the organization
-        profile = db.query(Profiles).filter_by(id=device.profile).first()
-        if not profile or str(profile.organisation_id) != organisation_id:
+        # Check the device's profile belongs to the organization
+        if not OrganisationController.device_belongs_to_organisation(db, device, organisation_id):
             raise HTTPException(status_code=403, detail="Device does not belong to your organization!")
         
         # Get the latest config to preserve existing values
-        latest_config = db.query(ConfigValues).filter_by(deviceID=deviceID).order_by(ConfigValues.created_at.desc()).first()
+        latest_config = device_shadow.latest_config(db, deviceID)
         
         # Prepare config data, preserving existing values if new ones aren't provided
         config_data = {}
@@ -410,6 +526,9 @@ class ConfigValuesController:
         )
         
         db.add(new_config)
+        db.flush()
+        record_configs(db, [config_row(new_config)])
+        config_notifier.publish(db, [deviceID])
         db.commit()
         db.refresh(new_config)
         
@@ -417,7 +536,7 @@ class ConfigValuesController:
         configuration = {
             "deviceID": device.deviceID,
             "fileDownloadState": device.fileDownloadState,
-            "status": DeviceDataController.build_device_status(db, device, new_config),
+            "status": build_device_status(db, device, new_config),
             "configs": {}
         }
         
@@ -444,18 +563,17 @@ class ConfigValuesController:
             if not device:
                 raise HTTPException(status_code=404, detail="Device not found!")
             
-            # Get the device's profile and check if it belongs to the organization
-            profile = db.query(Profiles).filter_by(id=device.profile).first()
-            if not profile or str(profile.organisation_id) != organisation_id:
+            # Check the device's profile belongs to the organization
+            if not OrganisationController.device_belongs_to_organisation(db, device, organisation_id):
                 raise HTTPException(status_code=403, detail="Device does not belong to your organization!")
             
             # Get the latest config
-            latest_config = db.query(ConfigValues).filter_by(deviceID=deviceID).order_by(ConfigValues.created_at.desc()).first()
+            latest_config = device_shadow.latest_config(db, deviceID)
             
             if not latest_config:
                 # No config exists yet
                 # Build status with None config_updated
-                status = DeviceDataController.build_device_status(db, device, None)
+                status = build_device_status(db, device, None)
                 status["config_updated"] = None  # Override to show no config exists
                 
                 return {
@@ -470,7 +588,7 @@ class ConfigValuesController:
                 configuration = {
                     "deviceID": device.deviceID,
                     "fileDownloadState": device.fileDownloadState,
-                    "status": DeviceDataController.build_device_status(db, device, latest_config),
+                    "status": build_device_status(db, device, latest_config),
                     "configs": {}
                 }
                 # Override config_updated to True since device is now getting the config
@@ -490,7 +608,7 @@ class ConfigValuesController:
                 # Return just updated status when config_updated is True
                 return {
                     "deviceID": deviceID,
-                    "status": DeviceDataController.build_device_status(db, device, latest_config),
+                    "status": build_device_status(db, device, latest_config),
                     "message": "Configuration is up to date"
                 }
         except Exception as e:
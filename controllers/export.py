@@ -0,0 +1,94 @@
+from fastapi import HTTPException
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from models.device import Devices
+from models.profile import Profiles
+from models.devicedata_value import DeviceData
+from models.metadata_value import MetadataValues
+from models.config_value import ConfigValues
+from utils.partitioning import source_for_range
+from utils.export_stream import EXPORT_CHUNK_SIZE, EXPORT_FORMATS, stream_partitions, encode_ndjson, encode_csv, gzip_stream
+from datetime import datetime
+from collections import Counter
+
+# table name in the URL -> (model, value column prefix, number of value columns)
+EXPORT_TABLES = {
+    'data': (DeviceData, 'field', 15),
+    'metadata': (MetadataValues, 'metadata', 15),
+    'config': (ConfigValues, 'config', 10),
+}
+
+
+class ExportController:
+    @staticmethod
+    def export(db: Session, organisation_id, table: str, device_ids: list = None, start: datetime = None,
+               end: datetime = None, format: str = 'ndjson', compress: bool = False, chunk_size: int = EXPORT_CHUNK_SIZE):
+        """
+        Validate an export request and return an iterator of encoded byte chunks.
+
+        Covers the given devices, or every device of the organisation. Only value
+        columns labelled on at least one of the devices' profiles are exported, and
+        a column is headed by its profile label when the profiles agree on it (see
+        value_header for labels that collide).
+        """
+        if table not in EXPORT_TABLES:
+            raise HTTPException(status_code=400, detail=f"Unknown table '{table}', expected one of: {', '.join(EXPORT_TABLES)}")
+        if format not in EXPORT_FORMATS:
+            raise HTTPException(status_code=400, detail=f"Unknown format '{format}', expected one of: {', '.join(EXPORT_FORMATS)}")
+        model, prefix, count = EXPORT_TABLES[table]
+
+        query = db.query(Devices.deviceID, Profiles).join(Profiles, Devices.profile == Profiles.id).filter(
+            Profiles.organisation_id == organisation_id
+        )
+        if device_ids:
+            query = query.filter(Devices.deviceID.in_(device_ids))
+        devices = query.all()
+        found = {device_id for device_id, _ in devices}
+        missing = sorted(set(device_ids or []) - found)
+        if missing:
+            raise HTTPException(status_code=404, detail=f"Devices not found: {', '.join(map(str, missing))}")
+
+        columns = [f'{prefix}{i}' for i in range(1, count + 1)]
+        labels = {}
+        for profile in {profile.id: profile for _, profile in devices}.values():
+            for column in columns:
+                label = getattr(profile, column, None)
+                if label:
+                    labels.setdefault(column, set()).add(label)
+        if labels:
+            columns = [column for column in columns if column in labels]
+        keys = ['deviceID', 'entryID', 'created_at'] if model is DeviceData else ['deviceID', 'created_at']
+        header = ExportController.value_header(columns, labels, keys)
+
+        # Readings may be spread over monthly partitions (see utils/partitioning.py)
+        source = source_for_range(db, start, end) if model is DeviceData else model.__table__
+        key_columns = [source.c.deviceID, source.c.entryID] if model is DeviceData else [source.c.deviceID]
+        statement = select(*key_columns, source.c.created_at, *[source.c[column] for column in columns]).where(
+            source.c.deviceID.in_(sorted(found))
+        )
+        if start is not None:
+            statement = statement.where(source.c.created_at >= start)
+        if end is not None:
+            statement = statement.where(source.c.created_at < end)
+        order = [source.c.deviceID, source.c.entryID] if model is DeviceData else [source.c.deviceID, source.c.created_at]
+        statement = statement.order_by(*order)
+
+        header = [*keys, *header]
+        encode = encode_csv if format == 'csv' else encode_ndjson
+        chunks = encode(header, stream_partitions(db, statement, chunk_size))
+        return gzip_stream(chunks) if compress else chunks
+
+    @staticmethod
+    def value_header(columns: list, labels: dict, keys: list) -> list:
+        """
+        Header names for the value columns: the profiles' label where they agree on one,
+        else the column name. Names must be unique (NDJSON rows are keyed by them), so a
+        label shared by two columns, or equal to another column's name, becomes
+        'label (fieldN)'; if that still collides every value column uses its column name.
+        """
+        header = [next(iter(labels[column])) if len(labels.get(column, ())) == 1 else column for column in columns]
+        taken = Counter(header + keys)
+        header = [f'{name} ({column})' if name != column and taken[name] > 1 else name for name, column in zip(header, columns)]
+        if len(set(header + keys)) < len(header) + len(keys):
+            return list(columns)
+        return header
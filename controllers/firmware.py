@@ -4,6 +4,7 @@ from models.firmware import Firmware, FirmwareType
 from google.cloud import storage
 from schemas.firmware import FirmwareUpload
 from utils.gcp_utils import load_gcp_credentials
+from utils.cache import firmware_descriptor_cache
 import os, io, uuid, zlib
 from intelhex import IntelHex
 from google.oauth2 import service_account
@@ -108,6 +109,7 @@ class FirmwareController:
         )
         db.add(new_firmware)
         db.commit()
+        firmware_descriptor_cache.invalidate(new_firmware.id)
         db.refresh(new_firmware)
         return new_firmware
 
@@ -261,5 +263,6 @@ class FirmwareController:
         firmware = FirmwareController.get_firmware_by_id(db, organisation_id, firmware_id)
         firmware.firmware_type = firmware_type
         db.commit()
+        firmware_descriptor_cache.invalidate(firmware.id)
         db.refresh(firmware)
         return firmware
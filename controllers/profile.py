@@ -1,11 +1,12 @@
 from sqlalchemy.orm import Session
 from models.profile import Profiles
-from models.config_value import ConfigValues
 from models.metadata_value import MetadataValues
 from models.device import Devices  # <-- changed to relative import
-from schemas.profile import ProfileCreate, ProfileRead, ProfileWithDevices, DeviceConfigSummary
+from schemas.profile import ProfileCreate, ProfileRead, ProfileWithDevices, DeviceConfigSummary, ProfileRetention, ProfileFieldTypes
 from typing import List, Optional
 from fastapi import HTTPException
+from utils.device_shadow import latest_configs
+from utils.numeric_fields import rebuild_numeric
 import uuid
 
 class ProfileController:
@@ -23,6 +24,7 @@ class ProfileController:
         fields = profile.fields or {}
         configs = profile.configs or {}
         metadata = profile.metadata or {}
+        retention = profile.retention or ProfileRetention()
         new_profile = Profiles(
             organisation_id=profile.organisation_id,
             name=profile.name,
@@ -30,6 +32,8 @@ class ProfileController:
             **fields,
             **configs,
             **metadata,
+            **retention.dict(),
+            field_types=profile.field_types or None,
         )
         db.add(new_profile)
         db.commit()
@@ -52,7 +56,9 @@ class ProfileController:
             created_at=new_profile.created_at,
             fields=response_fields,
             configs=response_configs,
-            metadata=response_metadata
+            metadata=response_metadata,
+            retention=ProfileController.retention_of(new_profile),
+            field_types=new_profile.field_types
         )
 
     @staticmethod
@@ -78,6 +84,8 @@ class ProfileController:
                 fields=fields,
                 configs=configs,
                 metadata=metadata,
+                retention=ProfileController.retention_of(profile),
+                field_types=profile.field_types,
                 device_count=device_count,
                 devices=[]
             ))
@@ -89,9 +97,10 @@ class ProfileController:
         if not profile:
             raise HTTPException(status_code=404, detail="Profile not found")
         devices = db.query(Devices).filter_by(profile=profile_id).all()
+        recent_configs = latest_configs(db, [device.deviceID for device in devices])
         device_list = []
         for device in devices:
-            recent_config = db.query(ConfigValues).filter_by(deviceID=device.deviceID).order_by(ConfigValues.created_at.desc()).first()
+            recent_config = recent_configs.get(device.deviceID)
             config_values = {}
             if recent_config:
                 config_values['config_updated'] = recent_config.config_updated
@@ -121,6 +130,41 @@ class ProfileController:
             fields=fields,
             configs=configs,
             metadata=metadata,
+            retention=ProfileController.retention_of(profile),
+            field_types=profile.field_types,
             device_count=len(devices),
             devices=device_list
         )
+
+    @staticmethod
+    def retention_of(profile: Profiles) -> ProfileRetention:
+        return ProfileRetention(
+            data_retention_days=profile.data_retention_days,
+            metadata_retention_days=profile.metadata_retention_days,
+            config_history_limit=profile.config_history_limit
+        )
+
+    @staticmethod
+    def update_retention(profile_id: uuid.UUID, retention: ProfileRetention, db: Session, organisation_id: uuid.UUID) -> ProfileRetention:
+        """Replace the profile's retention settings; the background purger applies them on its next run."""
+        profile = db.query(Profiles).filter_by(id=profile_id, organisation_id=organisation_id).first()
+        if not profile:
+            raise HTTPException(status_code=404, detail="Profile not found")
+        for key, value in retention.dict().items():
+            setattr(profile, key, value)
+        db.commit()
+        return ProfileController.retention_of(profile)
+
+    @staticmethod
+    def update_field_types(profile_id: uuid.UUID, field_types: ProfileFieldTypes, db: Session, organisation_id: uuid.UUID) -> ProfileFieldTypes:
+        """Replace the profile's field types and re-parse its devices' readings into devicedata_numeric."""
+        profile = db.query(Profiles).filter_by(id=profile_id, organisation_id=organisation_id).first()
+        if not profile:
+            raise HTTPException(status_code=404, detail="Profile not found")
+        profile.field_types = field_types.field_types or None
+        db.flush()
+        device_ids = [deviceID for (deviceID,) in db.query(Devices.deviceID).filter_by(profile=profile_id)]
+        if device_ids:
+            rebuild_numeric(db, device_ids)
+        db.commit()
+        return ProfileFieldTypes(field_types=profile.field_types or {})
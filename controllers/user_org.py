@@ -4,6 +4,7 @@ from models.user_org import User, Organisation, UserOrganisation, UserRole
 from schemas.user_org import UserCreate, UserRead, OrganisationCreate, OrganisationRead, OrganisationUpdate, UserUpdate
 from utils.database_config import get_db
 from utils.error_codes import ErrorCodes, ResponseMessages
+from utils.cache import organisation_cache
 import uuid
 import secrets
 
@@ -139,14 +140,34 @@ class OrganisationController:
         for key, value in org_update.dict(exclude_unset=True).items():
             if value is not None:
                 setattr(org, key, value)
+        # A deactivated organisation's token must stop resolving straight away, in every worker
+        organisation_cache.publish_invalidation(db, org.id, [org.token])
         db.commit()
+        organisation_cache.invalidate_token(org.token)
+        organisation_cache.invalidate_organisation(org.id)
         db.refresh(org)
         return org
 
     @staticmethod
-    def get_organisation_id_by_token(db: Session, org_token: str) -> str:
-        """Get organisation ID by token from database."""
-        org = db.query(Organisation).filter(Organisation.token == org_token, Organisation.is_active == True).first()
+    def rotate_organisation_token(org_id: uuid.UUID, db: Session) -> Organisation:
+        org = db.query(Organisation).filter(Organisation.id == org_id).first()
         if not org:
-            return None
-        return str(org.id)
+            raise HTTPException(status_code=404, detail=ResponseMessages.ORG_NOT_FOUND.value)
+        old_token = org.token
+        org.token = secrets.token_urlsafe(16)
+        organisation_cache.publish_invalidation(db, org.id, [old_token, org.token])
+        db.commit()
+        organisation_cache.invalidate_token(old_token)
+        organisation_cache.invalidate_organisation(org.id)
+        db.refresh(org)
+        return org
+
+    @staticmethod
+    def get_organisation_id_by_token(db: Session, org_token: str) -> str:
+        """Get organisation ID by token (cached, including misses)."""
+        return organisation_cache.resolve(db, org_token)
+
+    @staticmethod
+    def device_belongs_to_organisation(db: Session, device, organisation_id) -> bool:
+        """Check the device's profile is one of the organisation's profiles."""
+        return organisation_cache.owns_profile(db, organisation_id, device.profile)
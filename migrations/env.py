@@ -0,0 +1,62 @@
+"""
+Alembic environment.
+
+The server still runs create_all_tables() at startup, which creates missing
+tables but never alters existing ones. Migrations therefore have to be safe
+to run against a database that create_all already brought up to date (check
+before adding, use if_not_exists), and they are what brings older databases
+forward.
+"""
+
+import importlib
+import pkgutil
+from logging.config import fileConfig
+from pathlib import Path
+
+from alembic import context
+from sqlalchemy import create_engine
+
+from utils.base import Base
+from utils.database_config import DATABASE_URL
+
+config = context.config
+if config.config_file_name is not None:
+    fileConfig(config.config_file_name)
+
+# Import every model so Base.metadata is complete for autogenerate
+for _, module_name, _ in pkgutil.iter_modules([str(Path(__file__).parent.parent / "models")]):
+    importlib.import_module(f"models.{module_name}")
+
+target_metadata = Base.metadata
+
+
+def database_url() -> str:
+    return config.get_main_option("sqlalchemy.url") or DATABASE_URL
+
+
+def run_migrations_offline():
+    context.configure(url=database_url(), target_metadata=target_metadata, literal_binds=True)
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def run_migrations_online():
+    # Tests and scripts can hand over an existing connection
+    connection = config.attributes.get("connection")
+    if connection is not None:
+        context.configure(connection=connection, target_metadata=target_metadata)
+        with context.begin_transaction():
+            context.run_migrations()
+        return
+
+    engine = create_engine(database_url())
+    with engine.connect() as connection:
+        context.configure(connection=connection, target_metadata=target_metadata)
+        with context.begin_transaction():
+            context.run_migrations()
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
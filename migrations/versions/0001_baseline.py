@@ -0,0 +1,27 @@
+"""Baseline: the schema create_all_tables() built before migrations existed
+
+Databases that were already running before this tree was added are brought in
+with `alembic stamp 0001_baseline` followed by `alembic upgrade head`. On an
+empty database this creates the tables the same way the server does.
+
+Revision ID: 0001_baseline
+Revises:
+Create Date: 2026-10-17
+"""
+from alembic import op
+
+from utils.base import Base
+
+revision = '0001_baseline'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    Base.metadata.create_all(bind=op.get_bind(), checkfirst=True)
+
+
+def downgrade():
+    # There is nothing before the baseline to return to
+    pass
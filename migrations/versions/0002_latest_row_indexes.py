@@ -0,0 +1,37 @@
+"""Composite (deviceID, created_at DESC) indexes on the append-only value tables
+
+Every "latest config/metadata/reading for a device" lookup filters on deviceID
+and orders by created_at descending; with these indexes that is a single index
+seek instead of a scan of the device's whole history.
+
+On a large PostgreSQL table run this outside peak hours, or create the indexes
+by hand first with CREATE INDEX CONCURRENTLY using the same names; the
+migration then skips them.
+
+Revision ID: 0002_latest_row_indexes
+Revises: 0001_baseline
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0002_latest_row_indexes'
+down_revision = '0001_baseline'
+branch_labels = None
+depends_on = None
+
+INDEXES = [
+    ('ix_configvalues_device_created', 'configvalues'),
+    ('ix_metadatavalues_device_created', 'metadatavalues'),
+    ('ix_devicedata_device_created', 'devicedata'),
+]
+
+
+def upgrade():
+    for name, table in INDEXES:
+        op.create_index(name, table, ['deviceID', sa.text('created_at DESC')], if_not_exists=True)
+
+
+def downgrade():
+    for name, table in INDEXES:
+        op.drop_index(name, table_name=table, if_exists=True)
@@ -0,0 +1,48 @@
+"""device_shadow: one row per device with its latest reading, metadata and config
+
+Creates the table (if create_all_tables() has not already) and fills it from
+existing history so "latest" reads are correct straight after the upgrade.
+
+Revision ID: 0003_device_shadow
+Revises: 0002_latest_row_indexes
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.orm import Session
+
+from models.device_shadow import DeviceShadow
+
+revision = '0003_device_shadow'
+down_revision = '0002_latest_row_indexes'
+branch_labels = None
+depends_on = None
+
+# History tables as they are at this revision; later revisions add columns the models already have
+devicedata = sa.table(
+    'devicedata', sa.column('id', UUID(as_uuid=True)), sa.column('entryID', sa.Integer), sa.column('deviceID', sa.Integer),
+    sa.column('created_at', sa.DateTime), *[sa.column(f'field{i}', sa.String) for i in range(1, 16)],
+)
+metadatavalues = sa.table(
+    'metadatavalues', sa.column('id', UUID(as_uuid=True)), sa.column('deviceID', sa.Integer),
+    sa.column('created_at', sa.DateTime), *[sa.column(f'metadata{i}', sa.String) for i in range(1, 16)],
+)
+configvalues = sa.table(
+    'configvalues', sa.column('id', UUID(as_uuid=True)), sa.column('deviceID', sa.Integer),
+    sa.column('created_at', sa.DateTime), *[sa.column(f'config{i}', sa.String) for i in range(1, 11)],
+)
+
+
+def upgrade():
+    from utils.device_shadow import rebuild_shadows
+
+    bind = op.get_bind()
+    DeviceShadow.__table__.create(bind=bind, checkfirst=True)
+    db = Session(bind=bind)
+    rebuild_shadows(db, data=devicedata, metadata=metadatavalues, configs=configvalues)
+    db.flush()
+
+
+def downgrade():
+    op.drop_table('device_shadow')
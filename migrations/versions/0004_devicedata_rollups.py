@@ -0,0 +1,43 @@
+"""devicedata_rollup_{1m,1h,1d}: per device/field/bucket count, sum, min, max and last
+
+Creates the tables (if create_all_tables() has not already) and folds existing
+readings into them so rollup reads cover history straight after the upgrade.
+
+Revision ID: 0004_devicedata_rollups
+Revises: 0003_device_shadow
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.orm import Session
+
+from models.devicedata_rollup import DeviceDataRollup1m, DeviceDataRollup1h, DeviceDataRollup1d
+
+revision = '0004_devicedata_rollups'
+down_revision = '0003_device_shadow'
+branch_labels = None
+depends_on = None
+
+# devicedata as it is at this revision
+devicedata = sa.table(
+    'devicedata', sa.column('entryID', sa.Integer), sa.column('deviceID', sa.Integer), sa.column('created_at', sa.DateTime),
+    *[sa.column(f'field{i}', sa.String) for i in range(1, 16)],
+)
+
+TABLES = [DeviceDataRollup1m.__table__, DeviceDataRollup1h.__table__, DeviceDataRollup1d.__table__]
+
+
+def upgrade():
+    from utils.rollups import rebuild_rollups
+
+    bind = op.get_bind()
+    for table in TABLES:
+        table.create(bind=bind, checkfirst=True)
+    db = Session(bind=bind)
+    rebuild_rollups(db, source=devicedata)
+    db.flush()
+
+
+def downgrade():
+    for table in reversed(TABLES):
+        op.drop_table(table.name)
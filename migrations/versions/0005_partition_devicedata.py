@@ -0,0 +1,35 @@
+"""Optionally convert devicedata to monthly range partitions (PostgreSQL)
+
+Only runs when DEVICEDATA_PARTITIONING=true and the database is PostgreSQL;
+otherwise it is a no-op so the revision chain stays the same everywhere.
+The conversion copies every row into the new partitioned table, so run it
+in a maintenance window. SQLite needs no schema change: closed months are
+moved into period tables by the partition maintainer at runtime.
+
+Revision ID: 0005_partition_devicedata
+Revises: 0004_devicedata_rollups
+Create Date: 2026-10-17
+"""
+from alembic import op
+from sqlalchemy.orm import Session
+
+revision = '0005_partition_devicedata'
+down_revision = '0004_devicedata_rollups'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    from utils.partitioning import DEVICEDATA_PARTITIONING, convert_to_partitioned
+
+    bind = op.get_bind()
+    if not DEVICEDATA_PARTITIONING or bind.dialect.name != 'postgresql':
+        return
+    db = Session(bind=bind)
+    convert_to_partitioned(db)
+    db.flush()
+
+
+def downgrade():
+    # Converting back would copy every row again; partitioned devicedata serves the same queries
+    pass
@@ -0,0 +1,31 @@
+"""profiles: data_retention_days, metadata_retention_days, config_history_limit
+
+Nullable, so existing profiles keep everything until retention is configured.
+Columns already created by create_all_tables() are left alone.
+
+Revision ID: 0006_profile_retention
+Revises: 0005_partition_devicedata
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0006_profile_retention'
+down_revision = '0005_partition_devicedata'
+branch_labels = None
+depends_on = None
+
+COLUMNS = ['data_retention_days', 'metadata_retention_days', 'config_history_limit']
+
+
+def upgrade():
+    existing = {column['name'] for column in sa.inspect(op.get_bind()).get_columns('profiles')}
+    for name in COLUMNS:
+        if name not in existing:
+            op.add_column('profiles', sa.Column(name, sa.Integer(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('profiles') as batch:
+        for name in reversed(COLUMNS):
+            batch.drop_column(name)
@@ -0,0 +1,50 @@
+"""Optionally re-key devicedata, metadatavalues and configvalues with UUIDv7 ids
+
+New rows get time-ordered ids from the model defaults whatever this revision
+does. Rewriting the existing random ids (so the whole index is in time order)
+touches every row, so it only runs with UUID7_REKEY=true; device_shadow.config_id
+is moved along with configvalues.
+
+Revision ID: 0007_uuid7_rekey
+Revises: 0006_profile_retention
+Create Date: 2026-10-17
+"""
+import os
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.orm import Session
+
+revision = '0007_uuid7_rekey'
+down_revision = '0006_profile_retention'
+branch_labels = None
+depends_on = None
+
+# Only the columns rekey() touches, as they are at this revision
+snapshot = sa.MetaData()
+history = [
+    sa.Table(name, snapshot, sa.Column('id', UUID(as_uuid=True), primary_key=True), sa.Column('created_at', sa.DateTime))
+    for name in ('devicedata', 'metadatavalues', 'configvalues')
+]
+device_shadow = sa.Table(
+    'device_shadow', snapshot, sa.Column('deviceID', sa.Integer, primary_key=True), sa.Column('config_id', UUID(as_uuid=True)),
+)
+
+
+def upgrade():
+    if os.getenv("UUID7_REKEY", "false").lower() not in ("1", "true", "yes"):
+        return
+    from utils.uuid7 import rekey
+
+    db = Session(bind=op.get_bind())
+    devicedata, metadatavalues, configvalues = history
+    for table in (devicedata, metadatavalues):
+        print(f"Re-keying {table.name}: {rekey(db, table)} rows")
+    rekeyed = rekey(db, configvalues, references=[(device_shadow, 'config_id')])
+    print(f"Re-keying configvalues: {rekeyed} rows")
+    db.flush()
+
+
+def downgrade():
+    # UUIDv7 ids are valid UUIDs; there is nothing to undo
+    pass
@@ -0,0 +1,43 @@
+"""profiles.field_types and devicedata_numeric: typed copies of readings
+
+Adds the nullable field_types column (profiles without it stay untyped) and
+creates devicedata_numeric, each only if create_all_tables() has not already.
+No profile declares types yet, so there is nothing to backfill; setting types
+with PUT /profiles/{id}/field_types re-parses that profile's readings.
+
+Revision ID: 0008_devicedata_numeric
+Revises: 0007_uuid7_rekey
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import UUID
+
+revision = '0008_devicedata_numeric'
+down_revision = '0007_uuid7_rekey'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    existing = {column['name'] for column in sa.inspect(bind).get_columns('profiles')}
+    if 'field_types' not in existing:
+        op.add_column('profiles', sa.Column('field_types', sa.JSON(), nullable=True))
+    if not sa.inspect(bind).has_table('devicedata_numeric'):
+        op.create_table(
+            'devicedata_numeric',
+            sa.Column('id', UUID(as_uuid=True), primary_key=True),
+            sa.Column('entryID', sa.Integer),
+            sa.Column('deviceID', sa.Integer, sa.ForeignKey('devices.deviceID')),
+            sa.Column('created_at', sa.DateTime),
+            *[sa.Column(f'field{i}', sa.Float) for i in range(1, 16)],
+            sa.Column('parse_errors', sa.Integer, nullable=False),
+        )
+        op.create_index('ix_devicedata_numeric_device_created', 'devicedata_numeric', ['deviceID', 'created_at'])
+
+
+def downgrade():
+    op.drop_table('devicedata_numeric')
+    with op.batch_alter_table('profiles') as batch:
+        batch.drop_column('field_types')
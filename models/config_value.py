@@ -1,11 +1,12 @@
-from sqlalchemy import Column, String, DateTime, ForeignKey, Integer, Boolean
+from sqlalchemy import Column, Index, String, DateTime, ForeignKey, Integer, Boolean
 from sqlalchemy.dialects.postgresql import UUID
 from utils.database_config import Base
-import uuid
+from utils.uuid7 import uuid7
 
 class ConfigValues(Base):
     __tablename__ = 'configvalues'
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    # Time-ordered so inserts append to the primary key index (see utils/uuid7.py)
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid7)
     deviceID = Column(Integer, ForeignKey('devices.deviceID'))
     created_at = Column(DateTime)
     config1 = Column(String(100), default=None)
@@ -21,6 +22,9 @@ class ConfigValues(Base):
     # add a boolean field to indicate if the config is updated
     config_updated = Column(Boolean, default=False)
 
+    # Serves "latest row for a device" lookups (see migrations/versions/0002)
+    __table_args__ = (Index('ix_configvalues_device_created', 'deviceID', created_at.desc()),)
+
     def __init__(self, created_at, deviceID, config1, config2, config3, config4, config5, config6, config7, config8, config9, config10, config_updated=False):
         self.created_at = created_at
         self.deviceID = deviceID
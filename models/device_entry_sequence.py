@@ -0,0 +1,15 @@
+from sqlalchemy import Column, Integer, DateTime, ForeignKey
+from utils.database_config import Base
+from sqlalchemy.sql import func
+
+class DeviceEntrySequence(Base):
+    """Per-device counter backing DeviceData.entryID allocation."""
+    __tablename__ = 'device_entry_sequences'
+    deviceID = Column(Integer, ForeignKey('devices.deviceID'), primary_key=True)
+    # Next entryID that has not been handed out to any worker yet
+    next_entry_id = Column(Integer, nullable=False, default=1)
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
+
+    def __init__(self, deviceID, next_entry_id=1):
+        self.deviceID = deviceID
+        self.next_entry_id = next_entry_id
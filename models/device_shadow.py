@@ -0,0 +1,32 @@
+from sqlalchemy import Column, Integer, DateTime, ForeignKey, JSON
+from sqlalchemy.dialects.postgresql import UUID
+from utils.database_config import Base
+
+class DeviceShadow(Base):
+    """
+    One row per device holding its latest reading, metadata and config.
+
+    Maintained in the same transaction as every devicedata, metadatavalues and
+    configvalues write (see utils/device_shadow.py), so "latest" reads are a
+    primary-key lookup however much history the device has.
+    """
+    __tablename__ = 'device_shadow'
+    deviceID = Column(Integer, ForeignKey('devices.deviceID'), primary_key=True)
+    # Most recent reading by created_at: {"field1": ..., ...}
+    data = Column(JSON, default=None)
+    data_at = Column(DateTime, default=None)
+    last_entry_id = Column(Integer, default=None)
+    # Most recent metadata: {"metadata1": ..., ...}
+    meta = Column(JSON, default=None)
+    meta_at = Column(DateTime, default=None)
+    # Most recent config row and its values: {"config1": ..., ...}
+    config_id = Column(UUID(as_uuid=True), ForeignKey('configvalues.id'), default=None)
+    config = Column(JSON, default=None)
+    config_at = Column(DateTime, default=None)
+    # Incremented on every config write
+    config_version = Column(Integer, nullable=False, default=0)
+    # Latest time the device itself reported (reading or metadata)
+    last_seen = Column(DateTime, default=None)
+
+    def __init__(self, deviceID):
+        self.deviceID = deviceID
@@ -0,0 +1,39 @@
+from sqlalchemy import Column, Index, DateTime, Float, ForeignKey, Integer
+from sqlalchemy.dialects.postgresql import UUID
+from utils.database_config import Base
+
+
+class DeviceDataNumeric(Base):
+    """
+    Typed copy of a devicedata row for devices whose profile declares field
+    types (Profiles.field_types). Values are parsed once on ingest (see
+    utils/numeric_fields.py): float and int fields as numbers, bool fields as
+    0/1. String fields, empty values and values that failed to parse are NULL;
+    failures are counted in parse_errors.
+    """
+    __tablename__ = 'devicedata_numeric'
+    # Same id as the devicedata row it was parsed from
+    id = Column(UUID(as_uuid=True), primary_key=True)
+    entryID = Column(Integer)
+    deviceID = Column(Integer, ForeignKey('devices.deviceID'))
+    created_at = Column(DateTime)
+    field1 = Column(Float, default=None)
+    field2 = Column(Float, default=None)
+    field3 = Column(Float, default=None)
+    field4 = Column(Float, default=None)
+    field5 = Column(Float, default=None)
+    field6 = Column(Float, default=None)
+    field7 = Column(Float, default=None)
+    field8 = Column(Float, default=None)
+    field9 = Column(Float, default=None)
+    field10 = Column(Float, default=None)
+    field11 = Column(Float, default=None)
+    field12 = Column(Float, default=None)
+    field13 = Column(Float, default=None)
+    field14 = Column(Float, default=None)
+    field15 = Column(Float, default=None)
+    parse_errors = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        Index('ix_devicedata_numeric_device_created', 'deviceID', 'created_at'),
+    )
@@ -0,0 +1,34 @@
+from sqlalchemy import Column, Integer, String, DateTime, Float, ForeignKey
+from utils.database_config import Base
+
+
+class _RollupColumns:
+    """
+    Per device, field and time bucket: count, sum, min, max and the latest value
+    of every numeric reading in the bucket. Maintained on ingest by merging
+    each batch into its buckets (see utils/rollups.py), so rows arriving late
+    or backdated land in the right bucket.
+    """
+    deviceID = Column(Integer, ForeignKey('devices.deviceID'), primary_key=True)
+    field = Column(String(10), primary_key=True)
+    bucket_start = Column(DateTime, primary_key=True)
+    count = Column(Integer, nullable=False)
+    sum = Column(Float, nullable=False)
+    min = Column(Float, nullable=False)
+    max = Column(Float, nullable=False)
+    # Value of the newest reading in the bucket, by (created_at, entryID)
+    last = Column(Float, nullable=False)
+    last_at = Column(DateTime, nullable=False)
+    last_entry_id = Column(Integer, nullable=False)
+
+
+class DeviceDataRollup1m(_RollupColumns, Base):
+    __tablename__ = 'devicedata_rollup_1m'
+
+
+class DeviceDataRollup1h(_RollupColumns, Base):
+    __tablename__ = 'devicedata_rollup_1h'
+
+
+class DeviceDataRollup1d(_RollupColumns, Base):
+    __tablename__ = 'devicedata_rollup_1d'
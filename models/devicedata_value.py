@@ -1,11 +1,12 @@
-from sqlalchemy import Column, String, DateTime, ForeignKey, UniqueConstraint, Integer, func
+from sqlalchemy import Column, Index, String, DateTime, ForeignKey, UniqueConstraint, Integer
 from sqlalchemy.dialects.postgresql import UUID
 from utils.database_config import Base
-import uuid
+from utils.uuid7 import uuid7
 
 class DeviceData(Base):
     __tablename__ = 'devicedata'
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    # Time-ordered so inserts append to the primary key index (see utils/uuid7.py)
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid7)
     entryID = Column(Integer)
     deviceID = Column(Integer, ForeignKey('devices.deviceID'))
     created_at = Column(DateTime)
@@ -25,13 +26,17 @@ class DeviceData(Base):
     field14 = Column(String(100), default=None)
     field15 = Column(String(100), default=None)
 
-    __table_args__ = (UniqueConstraint('deviceID', 'entryID', name='unique_device_entry'),)
+    __table_args__ = (
+        UniqueConstraint('deviceID', 'entryID', name='unique_device_entry'),
+        # Serves "latest rows for a device" lookups (see migrations/versions/0002)
+        Index('ix_devicedata_device_created', 'deviceID', created_at.desc()),
+    )
 
     @classmethod
     def get_next_entry_id(cls, db_session, device_id):
         """Get the next available entry ID for a specific device."""
-        max_entry = db_session.query(func.max(cls.entryID)).filter(cls.deviceID == device_id).scalar()
-        return 1 if max_entry is None else max_entry + 1
+        from utils.entry_id_allocator import entry_id_allocator
+        return entry_id_allocator.allocate(db_session, device_id)[0]
 
     def __init__(self, created_at, deviceID, entryID, field1, field2, field3, field4, field5, field6, field7, field8, field9, field10, field11, field12, field13, field14, field15):
         self.created_at = created_at
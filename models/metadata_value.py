@@ -1,11 +1,12 @@
-from sqlalchemy import Column, String, DateTime, ForeignKey, Integer
+from sqlalchemy import Column, Index, String, DateTime, ForeignKey, Integer
 from sqlalchemy.dialects.postgresql import UUID
 from utils.database_config import Base
-import uuid
+from utils.uuid7 import uuid7
 
 class MetadataValues(Base):
     __tablename__ = 'metadatavalues'
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    # Time-ordered so inserts append to the primary key index (see utils/uuid7.py)
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid7)
     deviceID = Column(Integer, ForeignKey('devices.deviceID'))
     created_at = Column(DateTime)
     metadata1 = Column(String(100), default=None)
@@ -24,6 +25,9 @@ class MetadataValues(Base):
     metadata14 = Column(String(100), default=None)
     metadata15 = Column(String(100), default=None)
 
+    # Serves "latest row for a device" lookups (see migrations/versions/0002)
+    __table_args__ = (Index('ix_metadatavalues_device_created', 'deviceID', created_at.desc()),)
+
     def __init__(self, created_at, deviceID, metadata1, metadata2, metadata3, metadata4, metadata5, metadata6, metadata7, metadata8, metadata9, metadata10, metadata11, metadata12, metadata13, metadata14, metadata15):
         self.created_at = created_at
         self.deviceID = deviceID
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, DateTime, ForeignKey
+from sqlalchemy import Column, String, DateTime, ForeignKey, Integer, JSON
 from sqlalchemy.dialects.postgresql import UUID
 from utils.database_config import Base
 from sqlalchemy.sql import func
@@ -51,6 +51,12 @@ class Profiles(Base):
     config9 = Column(String(100), default=None)
     config10 = Column(String(100), default=None)
     created_at = Column(DateTime, server_default=func.now())
+    # Retention for the profile's devices (None keeps everything), enforced by utils/retention.py
+    data_retention_days = Column(Integer, default=None)
+    metadata_retention_days = Column(Integer, default=None)
+    config_history_limit = Column(Integer, default=None)
+    # {'field1': 'float', 'field2': 'int', ...}; typed fields are also parsed into devicedata_numeric
+    field_types = Column(JSON, default=None)
 
     def __init__(
         self,
@@ -64,7 +70,9 @@ class Profiles(Base):
         config6=None, config7=None, config8=None, config9=None, config10=None,
         metadata1=None, metadata2=None, metadata3=None, metadata4=None, metadata5=None,
         metadata6=None, metadata7=None, metadata8=None, metadata9=None, metadata10=None,
-        metadata11=None, metadata12=None, metadata13=None, metadata14=None, metadata15=None
+        metadata11=None, metadata12=None, metadata13=None, metadata14=None, metadata15=None,
+        data_retention_days=None, metadata_retention_days=None, config_history_limit=None,
+        field_types=None
     ):
         self.organisation_id = organisation_id
         self.name = name
@@ -109,3 +117,7 @@ class Profiles(Base):
         self.config8 = config8
         self.config9 = config9
         self.config10 = config10
+        self.data_retention_days = data_retention_days
+        self.metadata_retention_days = metadata_retention_days
+        self.config_history_limit = config_history_limit
+        self.field_types = field_types
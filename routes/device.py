@@ -1,10 +1,15 @@
-from fastapi import APIRouter, Depends, HTTPException, Body, Query
+from fastapi import APIRouter, Depends, HTTPException, Body, Query, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
 from sqlalchemy.orm import Session
 from controllers.device import DeviceController
 from schemas.device import DeviceCreate, DeviceUpdate, DeviceResponse, DeviceDetailResponse, DeviceFirmwareUpdate
 from utils.security import get_user_with_org_context
 from utils.database_config import get_db
+from utils import fast_json
+from utils.fast_json import fast_response
 import uuid
+from datetime import datetime
 from typing import Optional
 
 router = APIRouter()
@@ -64,12 +69,23 @@ def add_device(
 
 @router.get("/device", response_model=list[DeviceResponse])
 def get_devices(
+    response: Response,
+    after: Optional[int] = Query(None, description="Return devices with deviceID greater than this (keyset pagination)"),
+    limit: Optional[int] = Query(None, ge=1, le=5000, description="Maximum number of devices to return"),
+    fields: Optional[str] = Query(None, description="Comma-separated keys to return, e.g. name,last_posted_time"),
     db: Session = Depends(get_db),
     user_data = Depends(get_user_with_org_context)
 ):
     organisation_id = get_organisation_id_from_token(user_data)
-    devices = DeviceController.get_devices(db, organisation_id)
-    return [sanitize_device_response(device) for device in devices]
+    field_list = [field.strip() for field in fields.split(",") if field.strip()] if fields else None
+    devices = DeviceController.get_devices(db, organisation_id, after=after, limit=limit, fields=field_list)
+    if limit is not None and len(devices) == limit:
+        response.headers["X-Next-After"] = str(devices[-1]["deviceID"])
+    if field_list and not fast_json.FAST_JSON:
+        # Partial rows do not fit DeviceResponse, so skip response_model validation
+        return JSONResponse(jsonable_encoder(devices), headers=dict(response.headers))
+    # Rows come straight from device_list_columns with DeviceResponse's keys (or a subset of them)
+    return fast_response(devices, headers=dict(response.headers))
 
 @router.get("/device/{deviceID}", response_model=DeviceDetailResponse)
 def get_device(
@@ -81,7 +97,55 @@ def get_device(
     result = DeviceController.get_device(db, organisation_id, deviceID)
     if isinstance(result, tuple):  # Error case
         raise HTTPException(status_code=result[1], detail=result[0]['message'])
-    return result
+    return fast_response(result)
+
+@router.get("/device/{deviceID}/data")
+def get_device_data(
+    deviceID: int,
+    start: Optional[datetime] = Query(None, description="Only readings with created_at >= start"),
+    end: Optional[datetime] = Query(None, description="Only readings with created_at < end"),
+    fields: Optional[str] = Query(None, description="Comma-separated fieldN columns (default: the profile's labelled fields)"),
+    after_entry: Optional[int] = Query(None, description="Continue after this entryID (next_after_entry of the previous page)"),
+    limit: int = Query(1000, ge=1, le=10000),
+    db: Session = Depends(get_db),
+    user_data = Depends(get_user_with_org_context)
+):
+    """Page through a device's readings as columnar JSON (one array per column)."""
+    organisation_id = get_organisation_id_from_token(user_data)
+    field_list = [field.strip() for field in fields.split(",") if field.strip()] if fields else None
+    return DeviceController.get_device_data(db, organisation_id, deviceID, start, end, field_list, after_entry, limit)
+
+@router.get("/device/{deviceID}/aggregate")
+def aggregate_device_data(
+    deviceID: int,
+    fields: Optional[str] = Query(None, description="Comma-separated fieldN columns (default: the profile's labelled fields)"),
+    bucket: str = Query("1h", description="Bucket width, e.g. 30s, 15m, 1h, 1d"),
+    stats: str = Query("mean", description="Comma-separated: count, sum, min, max, mean, std, median, pNN"),
+    start: Optional[datetime] = Query(None, description="Only readings with created_at >= start"),
+    end: Optional[datetime] = Query(None, description="Only readings with created_at < end"),
+    db: Session = Depends(get_db),
+    user_data = Depends(get_user_with_org_context)
+):
+    """Per-bucket statistics of a device's numeric fields."""
+    organisation_id = get_organisation_id_from_token(user_data)
+    field_list = [field.strip() for field in fields.split(",") if field.strip()] if fields else None
+    stat_list = [stat.strip() for stat in stats.split(",") if stat.strip()]
+    return DeviceController.aggregate_device_data(db, organisation_id, deviceID, bucket, stat_list, field_list, start, end)
+
+@router.get("/device/{deviceID}/rollups")
+def get_device_rollups(
+    deviceID: int,
+    resolution: str = Query("auto", description="1m, 1h, 1d or auto (finest that fits the window)"),
+    fields: Optional[str] = Query(None, description="Comma-separated fieldN columns (default: the profile's labelled fields)"),
+    start: Optional[datetime] = Query(None, description="Only buckets from start"),
+    end: Optional[datetime] = Query(None, description="Only buckets starting before end"),
+    db: Session = Depends(get_db),
+    user_data = Depends(get_user_with_org_context)
+):
+    """Count/sum/min/max/mean/last per bucket from the continuously maintained rollup tables."""
+    organisation_id = get_organisation_id_from_token(user_data)
+    field_list = [field.strip() for field in fields.split(",") if field.strip()] if fields else None
+    return DeviceController.get_device_rollups(db, organisation_id, deviceID, resolution, field_list, start, end)
 
 # @router.put("/device/{deviceID}", response_model=DeviceResponse)
 # def edit_device(
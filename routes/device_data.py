@@ -1,26 +1,98 @@
 from fastapi import APIRouter, Depends, HTTPException, Request, Body, Query
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from controllers.device_data import DeviceDataController, MetadataValuesController, ConfigValuesController
-from schemas.device_data import DeviceDataCreate, MetadataValuesCreate, ConfigValuesCreate
+from schemas.device_data import DeviceDataCreate, MetadataValuesCreate, ConfigValuesCreate, device_data_update_adapter, device_checkin_adapter
 from utils.database_config import get_db
+from utils.security import get_user_with_org_context
+from routes.device import get_organisation_id_from_token
+from utils.config_notify import config_notifier, CONFIG_WAIT_MAX
+from utils.binary_ingest import BINARY_INGEST_MAX_BYTES
+from utils.devicedata_loader import iter_json_rows
+from utils.fast_json import fast_response, parse_body
+import asyncio
+import io
+import tempfile
 
 router = APIRouter()
 
-@router.post("/device_data/update")
-def update_device_data(
-    writekey: str = Body(..., embed=True),
-    fields: dict = Body(...),
+def json_body(adapter) -> dict:
+    """OpenAPI requestBody for a route that validates its raw body with a TypeAdapter."""
+    return {"requestBody": {"required": True, "content": {"application/json": {"schema": adapter.json_schema()}}}}
+
+@router.post("/device_data/update", openapi_extra=json_body(device_data_update_adapter))
+async def update_device_data(
+    request: Request,
+    db: Session = Depends(get_db)
+):
+    body = parse_body(device_data_update_adapter, await request.body())
+    return await run_in_threadpool(DeviceDataController.update_device_data, db, body["writekey"], body["fields"])
+
+@router.post("/device/checkin", openapi_extra=json_body(device_checkin_adapter))
+async def device_checkin(
+    request: Request,
+    db: Session = Depends(get_db)
+):
+    """Store readings and metadata, and return status plus any pending config (acknowledged) in one call."""
+    body = parse_body(device_checkin_adapter, await request.body())
+    result = await run_in_threadpool(
+        DeviceDataController.checkin, db, body["writekey"], body.get("fields"), body.get("metadata")
+    )
+    return fast_response(result)
+
+@router.post("/device_data/binary")
+async def binary_update_device_data(
+    request: Request,
+    org_token: str = Query(None, description="Organization token, required when the payload is keyed by deviceID"),
     db: Session = Depends(get_db)
 ):
-    return DeviceDataController.update_device_data(db, writekey, fields)
+    """Store readings from a compact binary body (format in utils/binary_ingest.py)."""
+    payload = bytearray()
+    async for chunk in request.stream():
+        payload += chunk
+        if len(payload) > BINARY_INGEST_MAX_BYTES:
+            raise HTTPException(status_code=413, detail=f"Payload larger than {BINARY_INGEST_MAX_BYTES} bytes.")
+    return await run_in_threadpool(DeviceDataController.binary_update, db, bytes(payload), org_token)
 
-@router.post("/device_data/bulk_update/{deviceID}")
-def bulk_update_device_data(
+@router.post(
+    "/device_data/bulk_update/{deviceID}",
+    openapi_extra={"requestBody": {"required": True, "content": {"application/json": {"schema": {"type": "array", "items": {"type": "object"}}}}}},
+)
+async def bulk_update_device_data(
     deviceID: int,
-    updates: list = Body(...),
+    request: Request,
     db: Session = Depends(get_db)
 ):
-    return DeviceDataController.bulk_update(db, deviceID, updates)
+    """Store a JSON array of readings. The body (gzip/deflate accepted) is spooled and decoded one reading at a time."""
+    spool = tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024)
+    async for chunk in request.stream():
+        spool.write(chunk)
+    spool.seek(0)
+    try:
+        updates = iter_json_rows(io.TextIOWrapper(spool, encoding="utf-8"))
+        return await run_in_threadpool(DeviceDataController.bulk_update, db, deviceID, updates)
+    finally:
+        spool.close()
+
+@router.post("/device_data/backfill/{deviceID}")
+async def backfill_device_data(
+    deviceID: int,
+    request: Request,
+    format: str = Query("csv", description="Body format: 'csv' (with header row) or 'ndjson'"),
+    db: Session = Depends(get_db),
+    user_data = Depends(get_user_with_org_context)
+):
+    """Load historical readings for a device from a raw CSV/NDJSON body. Requires organization token."""
+    organisation_id = get_organisation_id_from_token(user_data)
+    # Spool the upload (to disk once it gets large) so the loader can stream it without holding it in memory
+    spool = tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024)
+    async for chunk in request.stream():
+        spool.write(chunk)
+    spool.seek(0)
+    try:
+        return await run_in_threadpool(DeviceDataController.backfill, db, organisation_id, deviceID, spool, format)
+    finally:
+        spool.close()
 
 @router.get("/metadata_update")
 def update_metadata_with_status(
@@ -65,20 +137,33 @@ def mass_edit_config_data(
     config_values: dict = Body(...),
     db: Session = Depends(get_db)
 ):
-    return ConfigValuesController.mass_edit_config_data(db, device_ids, config_values)
+    return fast_response(ConfigValuesController.mass_edit_config_data(db, device_ids, config_values))
 
 @router.get("/config/{deviceID}")
 def get_config_data(
     deviceID: int,
     db: Session = Depends(get_db)
 ):
-    return ConfigValuesController.get_config_data(db, deviceID)
+    return fast_response(ConfigValuesController.get_config_data(db, deviceID))
 
 @router.get("/config_update")
-def get_config_update(
+async def get_config_update(
     org_token: str = Query(..., description="Organization token"),
     deviceID: int = Query(..., description="Device ID"),
+    wait: int = Query(0, ge=0, le=CONFIG_WAIT_MAX, description="Seconds to hold the request open waiting for a new config"),
     db: Session = Depends(get_db)
 ):
-    """Get device config update status. Returns data if config_updated=False, just updated status if True."""
-    return ConfigValuesController.get_config_update_status(db, org_token, deviceID)
+    """Get device config update status. Returns data if config_updated=False, just updated status if True.
+    With wait>0 an up-to-date device is answered as soon as a new config is written (or after `wait` seconds)."""
+    # Subscribe before checking so a config written in between is not missed
+    with config_notifier.subscribe(deviceID) as changed:
+        result = await run_in_threadpool(ConfigValuesController.get_config_update_status, db, org_token, deviceID)
+        if not wait or "configs" in result:
+            return fast_response(result)
+        # Give the connection back to the pool while parked
+        await run_in_threadpool(db.close)
+        try:
+            await asyncio.wait_for(changed.wait(), timeout=wait)
+        except asyncio.TimeoutError:
+            return fast_response(result)
+    return fast_response(await run_in_threadpool(ConfigValuesController.get_config_update_status, db, org_token, deviceID))
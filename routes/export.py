@@ -0,0 +1,37 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session
+from controllers.export import ExportController
+from utils.export_stream import EXPORT_FORMATS
+from utils.security import get_user_with_org_context
+from utils.database_config import get_db
+from routes.device import get_organisation_id_from_token
+from datetime import datetime
+from typing import Optional
+
+router = APIRouter()
+
+@router.get("/export/{table}")
+def export_history(
+    table: str,
+    device_ids: Optional[str] = Query(None, description="Comma-separated deviceIDs (default: every device of the organisation)"),
+    start: Optional[datetime] = Query(None, description="Only rows with created_at >= start"),
+    end: Optional[datetime] = Query(None, description="Only rows with created_at < end"),
+    format: str = Query("ndjson", description="'ndjson' or 'csv'"),
+    gzip: bool = Query(False, description="Compress the download with gzip"),
+    db: Session = Depends(get_db),
+    user_data = Depends(get_user_with_org_context)
+):
+    """Stream data, metadata or config history as NDJSON/CSV in constant memory. Requires organization token."""
+    organisation_id = get_organisation_id_from_token(user_data)
+    try:
+        ids = [int(device_id) for device_id in device_ids.split(",") if device_id.strip()] if device_ids else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid device_ids. Must be comma-separated integer deviceIDs.")
+    chunks = ExportController.export(db, organisation_id, table, ids, start, end, format, gzip)
+    filename = f"{table}.{format}.gz" if gzip else f"{table}.{format}"
+    return StreamingResponse(
+        chunks,
+        media_type="application/gzip" if gzip else EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f"attachment; filename={filename}", "Cache-Control": "no-cache"}
+    )
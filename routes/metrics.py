@@ -0,0 +1,45 @@
+from fastapi import APIRouter, Depends
+from utils.security import get_admin_user
+from utils.ingest_buffer import ingest_buffer
+from utils.config_notify import config_notifier
+from utils.partitioning import partition_maintainer
+from utils.retention import retention_purger
+from utils import numeric_fields
+from utils.cache import device_key_cache, organisation_cache, firmware_descriptor_cache, field_type_cache
+
+router = APIRouter()
+
+@router.get("/metrics/ingest")
+def get_ingest_metrics(current_user = Depends(get_admin_user)):
+    """Write-behind ingest buffer queue depth, throughput and flush latency. Requires admin privileges."""
+    return ingest_buffer.stats()
+
+@router.get("/metrics/cache")
+def get_cache_metrics(current_user = Depends(get_admin_user)):
+    """Size and hit/miss counters of the in-process lookup caches. Requires admin privileges."""
+    return {
+        "device_keys": device_key_cache.stats(),
+        "organisations": organisation_cache.stats(),
+        "firmware": firmware_descriptor_cache.stats(),
+        "field_types": field_type_cache.stats(),
+    }
+
+@router.get("/metrics/config_notify")
+def get_config_notify_metrics(current_user = Depends(get_admin_user)):
+    """Parked /config_update long-polls and delivered config change notifications. Requires admin privileges."""
+    return config_notifier.stats()
+
+@router.get("/metrics/partitions")
+def get_partition_metrics(current_user = Depends(get_admin_user)):
+    """Devicedata partition maintenance runs and the partitions it created or archived. Requires admin privileges."""
+    return partition_maintainer.stats()
+
+@router.get("/metrics/retention")
+def get_retention_metrics(current_user = Depends(get_admin_user)):
+    """Rows and estimated bytes removed by the retention purger, with its last report. Requires admin privileges."""
+    return retention_purger.stats()
+
+@router.get("/metrics/numeric")
+def get_numeric_metrics(current_user = Depends(get_admin_user)):
+    """Typed rows written to devicedata_numeric and values that failed to parse. Requires admin privileges."""
+    return numeric_fields.stats()
@@ -1,7 +1,7 @@
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 from controllers.profile import ProfileController
-from schemas.profile import ProfileCreate, ProfileRead, ProfileWithDevices
+from schemas.profile import ProfileCreate, ProfileRead, ProfileWithDevices, ProfileRetention, ProfileFieldTypes
 from utils.database_config import get_db
 from utils.security import get_current_user
 import uuid
@@ -39,3 +39,23 @@ def get_profile(
     organisation_id: uuid.UUID = Depends(get_organisation_id_from_user)
 ):
     return ProfileController.get_profile(profile_id, db, organisation_id)
+
+@router.put("/profiles/{profile_id}/retention", response_model=ProfileRetention)
+def update_profile_retention(
+    profile_id: uuid.UUID,
+    retention: ProfileRetention,
+    db: Session = Depends(get_db),
+    organisation_id: uuid.UUID = Depends(get_organisation_id_from_user)
+):
+    """Set how long the profile's devices keep readings and metadata, and how many config versions."""
+    return ProfileController.update_retention(profile_id, retention, db, organisation_id)
+
+@router.put("/profiles/{profile_id}/field_types", response_model=ProfileFieldTypes)
+def update_profile_field_types(
+    profile_id: uuid.UUID,
+    field_types: ProfileFieldTypes,
+    db: Session = Depends(get_db),
+    organisation_id: uuid.UUID = Depends(get_organisation_id_from_user)
+):
+    """Declare field types (float, int, bool, string); existing readings are re-parsed into devicedata_numeric."""
+    return ProfileController.update_field_types(profile_id, field_types, db, organisation_id)
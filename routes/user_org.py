@@ -160,6 +160,15 @@ def get_all_organisations(
     """Get all organisations. Requires admin privileges."""
     return OrganisationController.get_all_organisations(db)
 
+@router.post("/organisations/{org_id}/rotate_token", response_model=OrganisationRead)
+def rotate_organisation_token(
+    org_id: uuid.UUID,
+    db: Session = Depends(get_db),
+    current_user = Depends(get_admin_user)
+):
+    """Issue a new org_token; the old one stops working immediately. Requires admin privileges."""
+    return OrganisationController.rotate_organisation_token(org_id, db)
+
 # @router.put("/organisations/{org_id}", response_model=OrganisationRead)
 # def update_organisation(org_id: uuid.UUID, org_update: OrganisationUpdate, db: Session = Depends(get_db)):
 #     return OrganisationController.update_organisation(org_id, org_update, db)
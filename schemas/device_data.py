@@ -1,5 +1,6 @@
-from pydantic import BaseModel, Field
-from typing import Optional, Dict, List
+from pydantic import BaseModel, Field, TypeAdapter
+from typing import Optional, Dict, List, Any
+from typing_extensions import TypedDict, NotRequired
 from uuid import UUID
 import datetime
 
@@ -40,3 +41,16 @@ class ConfigValuesRead(ConfigValuesBase):
     id: UUID
     created_at: datetime.datetime
     configs: Dict[str, Optional[str]]
+
+# Ingest request bodies, validated with TypeAdapters compiled once at import (see utils/fast_json.py)
+class DeviceDataUpdateBody(TypedDict):
+    writekey: str
+    fields: Dict[str, Any]
+
+class DeviceCheckinBody(TypedDict):
+    writekey: str
+    fields: NotRequired[Optional[Dict[str, Any]]]
+    metadata: NotRequired[Optional[Dict[str, Any]]]
+
+device_data_update_adapter = TypeAdapter(DeviceDataUpdateBody)
+device_checkin_adapter = TypeAdapter(DeviceCheckinBody)
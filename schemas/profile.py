@@ -1,14 +1,44 @@
-from pydantic import BaseModel, Field
-from typing import Optional, Dict, List, Union
+from pydantic import BaseModel, Field, field_validator
+from typing import Optional, Dict, List, Union, Literal
 from uuid import UUID
 import datetime
 
+class ProfileRetention(BaseModel):
+    # None keeps everything
+    data_retention_days: Optional[int] = Field(None, ge=1)
+    metadata_retention_days: Optional[int] = Field(None, ge=1)
+    config_history_limit: Optional[int] = Field(None, ge=1, description="Config rows kept per device, newest first")
+
+FieldType = Literal['float', 'int', 'bool', 'string']
+
+def _check_field_names(value):
+    unknown = [key for key in value or {} if key not in {f'field{i}' for i in range(1, 16)}]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return value
+
+class ProfileFieldTypes(BaseModel):
+    # fieldN -> type; fields left out stay untyped text
+    field_types: Dict[str, FieldType] = {}
+
+    @field_validator('field_types')
+    @classmethod
+    def check_field_names(cls, value):
+        return _check_field_names(value)
+
 class ProfileBase(BaseModel):
     name: str
     description: Optional[str] = None
     fields: Optional[Dict[str, Optional[str]]] = None
     configs: Optional[Dict[str, Optional[str]]] = None
     metadata: Optional[Dict[str, Optional[str]]] = None
+    retention: Optional[ProfileRetention] = None
+    field_types: Optional[Dict[str, FieldType]] = None
+
+    @field_validator('field_types')
+    @classmethod
+    def check_field_types(cls, value):
+        return _check_field_names(value)
 
 class ProfileCreate(ProfileBase):
     organisation_id: UUID
@@ -1,7 +1,12 @@
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
-from utils.database_config import create_all_tables
+from utils.database_config import create_all_tables, engine
+from utils.ingest_buffer import ingest_buffer
+from utils.config_notify import config_notifier
+from utils.partitioning import partition_maintainer
+from utils.retention import retention_purger
 from fastapi.middleware.cors import CORSMiddleware
+from utils.request_decompression import RequestDecompressionMiddleware
 import uvicorn
 
 from routes.user_org import router as user_org_router
@@ -9,6 +14,8 @@ from routes.firmware import router as firmware_router
 from routes.profile import router as profile_router
 from routes.device import router as device_router
 from routes.device_data import router as device_data_router
+from routes.metrics import router as metrics_router
+from routes.export import router as export_router
 
 origins = [
     "http://localhost:3000",
@@ -26,9 +33,24 @@ async def lifespan(app: FastAPI):
     except Exception as e:
         print(f"❌ Database initialization failed: {e}")
         raise
+    if ingest_buffer.enabled:
+        await ingest_buffer.start()
+        print("✅ Write-behind ingest buffer started")
+    await config_notifier.start(engine)
+    if partition_maintainer.enabled:
+        await partition_maintainer.start()
+        print("✅ Devicedata partition maintenance started")
+    if retention_purger.enabled:
+        await retention_purger.start()
     yield
     # Place for any cleanup logic if needed
     print("Application shutting down...")
+    await config_notifier.stop()
+    await partition_maintainer.stop()
+    await retention_purger.stop()
+    if ingest_buffer.enabled:
+        await ingest_buffer.stop()
+        print("✅ Ingest buffer flushed")
 
 app = FastAPI(
     title="IoTHub FastAPI API",
@@ -44,12 +66,16 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Inflate gzip/deflate request bodies (bulk uploads from gateways) as they stream in
+app.add_middleware(RequestDecompressionMiddleware)
 
 app.include_router(user_org_router, prefix="/api/v1", tags=["UserOrg"])
 app.include_router(firmware_router, prefix="/api/v1", tags=["Firmware"])
 app.include_router(profile_router, prefix="/api/v1", tags=["Profile"])
 app.include_router(device_router, prefix="/api/v1", tags=["Device"])
 app.include_router(device_data_router, prefix="/api/v1", tags=["DeviceData"])
+app.include_router(metrics_router, prefix="/api/v1", tags=["Metrics"])
+app.include_router(export_router, prefix="/api/v1", tags=["Export"])
 
 @app.get("/")
 def root():
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Benchmark: JSON vs binary ingest payloads.
+
+For the same readings, compares bytes on the wire per reading and the
+server-side work of turning a request body into devicedata insert rows:
+json.loads plus building rows from the `fields` dicts (as /device_data/update
+and bulk_update do) against utils.binary_ingest.decode plus filling rows from
+its values (as /device_data/binary does). Database writes are the same for
+both and are left out.
+
+    python tests/benchmarks/bench_binary_ingest.py --fields 3 --batch 1
+    python tests/benchmarks/bench_binary_ingest.py --fields 3 --batch 100
+
+Not collected by pytest.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", ".."))
+
+from utils.binary_ingest import encode, decode  # noqa: E402
+from utils.devicedata_writer import build_device_data_row, parse_timestamps  # noqa: E402
+
+WRITEKEY = "K7Q2M9X4T1B8C3D6"
+
+
+def payloads(fields: int, batch: int):
+    names = [f"field{i}" for i in range(1, fields + 1)]
+    start = datetime(2024, 1, 1)
+    times = [start + timedelta(seconds=30 * i) for i in range(batch)]
+    values = [[round(20 + (i * 7 + slot) % 100 / 10, 1) for slot in range(fields)] for i in range(batch)]
+    if batch == 1:
+        body = {"writekey": WRITEKEY, "fields": {name: "%.7g" % value for name, value in zip(names, values[0])}}
+    else:
+        body = [{"created_at": moment.isoformat(sep=" "), **{name: "%.7g" % value for name, value in zip(names, reading)}}
+                for moment, reading in zip(times, values)]
+    binary = encode(values, names, writekey=WRITEKEY, timestamps=times if batch > 1 else None)
+    return json.dumps(body).encode(), binary
+
+
+def parse_json(body: bytes):
+    data = json.loads(body)
+    now = datetime.now()
+    if isinstance(data, dict):
+        return [build_device_data_row(1, 1, now, data["fields"])]
+    timestamps = parse_timestamps([reading.get("created_at") for reading in data])
+    return [build_device_data_row(1, entry, created_at, reading)
+            for entry, (reading, created_at) in enumerate(zip(data, timestamps), start=1)]
+
+
+def parse_binary(body: bytes):
+    readings = decode(body)
+    return readings.rows(1, range(1, readings.count + 1), datetime.now())
+
+
+def timed(parsers: list, repeat: int, rounds: int = 7) -> list:
+    """Best mean seconds per parse for each (parse, body), over `rounds` interleaved rounds."""
+    best = [float("inf")] * len(parsers)
+    for _ in range(rounds):
+        for index, (parse, body) in enumerate(parsers):
+            began = time.perf_counter()
+            for _ in range(repeat):
+                parse(body)
+            best[index] = min(best[index], (time.perf_counter() - began) / repeat)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--fields", type=int, default=3)
+    parser.add_argument("--batch", type=int, default=1, help="Readings per request")
+    parser.add_argument("--repeat", type=int, default=20000)
+    args = parser.parse_args()
+    json_body, binary_body = payloads(args.fields, args.batch)
+    assert [row["field1"] for row in parse_json(json_body)] == [row["field1"] for row in parse_binary(binary_body)]
+
+    repeat = max(args.repeat // args.batch, 100)
+    json_time, binary_time = timed([(parse_json, json_body), (parse_binary, binary_body)], repeat)
+    print(f"{args.batch} reading(s) of {args.fields} fields per request")
+    for label, body, seconds in (("json", json_body, json_time), ("binary", binary_body, binary_time)):
+        print(f"  {label:6}: {len(body) / args.batch:7.1f} bytes/reading   {seconds / args.batch * 1e6:7.2f} us/reading to parse")
+    print(f"  binary vs json: {len(binary_body) / len(json_body):.2f}x bytes, {binary_time / json_time:.2f}x parse time")
+
+
+if __name__ == "__main__":
+    main()
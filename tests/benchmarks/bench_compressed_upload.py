@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Benchmark: plain vs gzip/deflate bulk uploads.
+
+Builds a /device_data/bulk_update body of --readings gateway readings and
+reports bytes on the wire for each Content-Encoding, the server-side time to
+inflate and decode it (RequestDecompressionMiddleware's decompressobj loop
+feeding utils.devicedata_loader.iter_json_rows) and peak Python memory of
+that streaming decode against json.loads of the whole body.
+
+    python tests/benchmarks/bench_compressed_upload.py --readings 5000 --fields 4
+
+Not collected by pytest.
+"""
+
+import argparse
+import gzip
+import io
+import json
+import os
+import sys
+import time
+import tracemalloc
+import zlib
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", ".."))
+
+from utils.devicedata_loader import iter_json_rows  # noqa: E402
+from utils.request_decompression import INFLATE_CHUNK_BYTES  # noqa: E402
+
+CHUNK = 64 * 1024
+
+
+def body(readings: int, fields: int) -> bytes:
+    start = datetime(2024, 1, 1)
+    values = [lambda i: f"{(i % 997) / 10:.1f}", lambda i: f"{20 + (i % 300) / 100:.2f}",
+              lambda i: str(40 + i % 50), lambda i: f"{1000 + (i % 400) / 10:.1f}", lambda i: "ok"]
+    return json.dumps([
+        {"created_at": (start + timedelta(seconds=30 * i)).isoformat(sep=" "),
+         **{f"field{slot + 1}": values[slot % len(values)](i) for slot in range(fields)}}
+        for i in range(readings)
+    ]).encode()
+
+
+def chunks(data: bytes):
+    for offset in range(0, len(data), CHUNK):
+        yield data[offset:offset + CHUNK]
+
+
+class _InflatedStream(io.RawIOBase):
+    """Binary stream over decompressed chunks, as the handler sees the request body."""
+
+    def __init__(self, data: bytes, wbits):
+        self._chunks = chunks(data)
+        self._decompressor = zlib.decompressobj(wbits) if wbits is not None else None
+        self._buffer = b""
+
+    def readable(self):
+        return True
+
+    def readinto(self, target):
+        while not self._buffer:
+            if self._decompressor and self._decompressor.unconsumed_tail:
+                chunk = self._decompressor.unconsumed_tail
+            else:
+                chunk = next(self._chunks, None)
+            if chunk is None:
+                return 0
+            # Same bounded inflate as the middleware
+            self._buffer = self._decompressor.decompress(chunk, INFLATE_CHUNK_BYTES) if self._decompressor else chunk
+        size = min(len(target), len(self._buffer))
+        target[:size], self._buffer = self._buffer[:size], self._buffer[size:]
+        return size
+
+
+def streamed(data: bytes, wbits) -> int:
+    text = io.TextIOWrapper(io.BufferedReader(_InflatedStream(data, wbits)), encoding="utf-8")
+    return sum(1 for _ in iter_json_rows(text))
+
+
+def buffered(data: bytes, wbits) -> int:
+    raw = zlib.decompress(data, wbits) if wbits is not None else data
+    return len(json.loads(raw))
+
+
+def measure(decode, data: bytes, wbits, repeat: int):
+    began = time.perf_counter()
+    for _ in range(repeat):
+        decode(data, wbits)
+    seconds = (time.perf_counter() - began) / repeat
+    tracemalloc.start()
+    decode(data, wbits)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return seconds, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--readings", type=int, default=5000)
+    parser.add_argument("--fields", type=int, default=4)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    plain = body(args.readings, args.fields)
+    encodings = {
+        "identity": (plain, None),
+        "gzip -6": (gzip.compress(plain, 6), 16 + zlib.MAX_WBITS),
+        "gzip -1": (gzip.compress(plain, 1), 16 + zlib.MAX_WBITS),
+        "deflate": (zlib.compress(plain), zlib.MAX_WBITS),
+    }
+    print(f"{args.readings} readings of {args.fields} fields, {len(plain) / 1024:.0f} KiB of JSON")
+    for label, (data, wbits) in encodings.items():
+        assert streamed(data, wbits) == args.readings
+        seconds, peak = measure(streamed, data, wbits, args.repeat)
+        print(f"  {label:8}: {len(data) / 1024:8.1f} KiB on the wire ({len(plain) / len(data):5.1f}x smaller)   "
+              f"inflate+decode {seconds * 1000:7.1f} ms   peak {peak / 1024:8.0f} KiB")
+    seconds, peak = measure(buffered, *encodings["gzip -6"], args.repeat)
+    print(f"  gzip -6 buffered json.loads: inflate+decode {seconds * 1000:7.1f} ms   peak {peak / 1024:8.0f} KiB")
+
+
+if __name__ == "__main__":
+    main()
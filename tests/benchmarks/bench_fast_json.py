@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Benchmark: default vs FAST_JSON serialization for large responses.
+
+Serves the same controller-shaped payloads (a get_device result with 100
+readings, 100 configs and 100 metadata rows, and a get_devices page) from a
+throwaway FastAPI app twice: once through response_model validation and
+json.dumps as FastAPI does by default, once through
+utils.fast_json.fast_response with FAST_JSON on. Reports CPU time per request
+(in-process TestClient, so client overhead is included and equal for both)
+and the serialization step alone. Also compares ingest body parsing:
+json.loads plus TypeAdapter validation against validate_json.
+
+    python tests/benchmarks/bench_fast_json.py --devices 1000
+
+Not collected by pytest.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", ".."))
+
+from fastapi import FastAPI  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+from pydantic import TypeAdapter  # noqa: E402
+from utils import fast_json  # noqa: E402
+from utils.fast_json import FastJSONResponse, fast_response  # noqa: E402
+from schemas.device import DeviceDetailResponse, DeviceResponse  # noqa: E402
+from schemas.device_data import device_data_update_adapter  # noqa: E402
+
+
+def device_detail() -> dict:
+    start = datetime(2024, 1, 1)
+    return {
+        "id": uuid.uuid4(), "created_at": start, "name": "sensor", "readkey": "R" * 16, "writekey": "W" * 16,
+        "deviceID": 1, "profile": uuid.uuid4(), "profile_name": "air", "currentFirmwareVersion": "1.2.0",
+        "targetFirmwareVersion": "1.2.0", "previousFirmwareVersion": "1.1.0", "networkID": "net-1",
+        "fileDownloadState": False, "firmwareDownloadState": "updated",
+        "device_data": [{"entryID": uuid.uuid4(), "created_at": start + timedelta(seconds=30 * i),
+                         **{f"field{slot}": f"{20 + (i + slot) % 100 / 10:.1f}" for slot in range(1, 16)}} for i in range(100)],
+        "config_data": [{"entryID": uuid.uuid4(), "created_at": start + timedelta(hours=i), "config_updated": True,
+                         **{f"config{slot}": str(slot * 10) for slot in range(1, 11)}} for i in range(100)],
+        "meta_data": [{"entryID": uuid.uuid4(), "created_at": start + timedelta(minutes=i),
+                       **{f"metadata{slot}": f"m{slot}" for slot in range(1, 6)}} for i in range(100)],
+        "field_names": {f"field{slot}": f"sensor{slot}" for slot in range(1, 16)},
+        "config_names": {f"config{slot}": f"setting{slot}" for slot in range(1, 11)},
+        "metadata_names": {f"metadata{slot}": f"meta{slot}" for slot in range(1, 6)},
+    }
+
+
+def device_rows(count: int) -> list:
+    start = datetime(2024, 1, 1)
+    return [{
+        "id": uuid.uuid4(), "name": f"sensor-{i}", "readkey": "R" * 16, "writekey": "W" * 16, "deviceID": i,
+        "networkID": "net-1", "currentFirmwareVersion": "1.2.0", "previousFirmwareVersion": "1.1.0",
+        "targetFirmwareVersion": "1.2.0", "fileDownloadState": False, "profile": uuid.uuid4(), "profile_name": "air",
+        "last_posted_time": start + timedelta(seconds=i), "created_at": start, "firmwareDownloadState": "updated",
+    } for i in range(1, count + 1)]
+
+
+def make_app(detail: dict, rows: list) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/default/device", response_model=DeviceDetailResponse)
+    def default_device():
+        return detail
+
+    @app.get("/default/devices", response_model=list[DeviceResponse])
+    def default_devices():
+        return rows
+
+    @app.get("/fast/device", response_model=DeviceDetailResponse)
+    def fast_device():
+        return fast_response(detail)
+
+    @app.get("/fast/devices", response_model=list[DeviceResponse])
+    def fast_devices():
+        return fast_response(rows)
+
+    return app
+
+
+def cpu_per_call(call, repeat: int) -> float:
+    began = time.process_time()
+    for _ in range(repeat):
+        call()
+    return (time.process_time() - began) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--devices", type=int, default=1000, help="Rows in the get_devices page")
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+    fast_json.FAST_JSON = True
+    detail, rows = device_detail(), device_rows(args.devices)
+    client = TestClient(make_app(detail, rows))
+
+    print(f"get_device: 300 history rows; get_devices: {args.devices} rows")
+    for name, model, content in (("device", DeviceDetailResponse, detail), ("devices", list[DeviceResponse], rows)):
+        default_body, fast_body = client.get(f"/default/{name}").json(), client.get(f"/fast/{name}").json()
+        assert default_body == fast_body, name
+        repeat = max(args.repeat * 1000 // (args.devices if name == "devices" else 300), 20)
+        request_default = cpu_per_call(lambda: client.get(f"/default/{name}"), repeat)
+        request_fast = cpu_per_call(lambda: client.get(f"/fast/{name}"), repeat)
+
+        # FastAPI's serialize_response: validate against response_model, dump in JSON mode, then json.dumps
+        adapter = TypeAdapter(model)
+        step_default = cpu_per_call(lambda: json.dumps(adapter.dump_python(adapter.validate_python(content), mode="json")).encode(), repeat)
+        step_fast = cpu_per_call(lambda: FastJSONResponse(content).body, repeat)
+        print(f"  {name:8}: request {request_default * 1000:7.2f} -> {request_fast * 1000:6.2f} ms CPU "
+              f"({request_default / request_fast:4.1f}x)   serialization {step_default * 1000:7.2f} -> {step_fast * 1000:6.2f} ms "
+              f"({step_default / step_fast:4.1f}x)")
+
+    body = json.dumps({"writekey": "W" * 16, "fields": {f"field{slot}": f"{slot}.5" for slot in range(1, 16)}}).encode()
+    parse_default = cpu_per_call(lambda: device_data_update_adapter.validate_python(json.loads(body)), 20000)
+    parse_fast = cpu_per_call(lambda: device_data_update_adapter.validate_json(body), 20000)
+    print(f"  ingest  : body parse {parse_default * 1e6:6.2f} -> {parse_fast * 1e6:6.2f} us ({parse_default / parse_fast:4.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Shared fixtures: a throwaway SQLite database per test under pytest's tmp_path,
+with every model's table created, and helpers to seed profiles and devices
+"""
+
+import importlib
+import pkgutil
+import uuid
+from pathlib import Path
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from utils.base import Base
+from models.device import Devices
+from models.profile import Profiles
+
+# Import every model so create_all builds the full schema, as migrations/env.py does
+for _, module_name, _ in pkgutil.iter_modules([str(Path(__file__).parent.parent / "models")]):
+    importlib.import_module(f"models.{module_name}")
+
+
+@pytest.fixture
+def make_engine(tmp_path):
+    """Factory for SQLite engines on new database files with all tables created (disposed after the test)."""
+    engines = []
+
+    def make(name: str = "test.db"):
+        engine = create_engine(f"sqlite:///{tmp_path / name}", connect_args={"timeout": 30})
+        Base.metadata.create_all(bind=engine)
+        engines.append(engine)
+        return engine
+
+    yield make
+    for engine in engines:
+        engine.dispose()
+
+
+@pytest.fixture
+def engine(make_engine):
+    return make_engine()
+
+
+@pytest.fixture
+def session_factory(engine):
+    return sessionmaker(bind=engine, autoflush=False)
+
+
+@pytest.fixture
+def db(session_factory):
+    session = session_factory()
+    yield session
+    session.close()
+
+
+@pytest.fixture
+def add_profile(db):
+    """add_profile(organisation_id=None, name="air", **columns) -> committed Profiles row."""
+    def add(organisation_id=None, name: str = "air", **columns) -> Profiles:
+        profile = Profiles(organisation_id=organisation_id or uuid.uuid4(), name=name, description=None, **columns)
+        db.add(profile)
+        db.commit()
+        return profile
+    return add
+
+
+@pytest.fixture
+def add_device(db):
+    """add_device(profile_id, deviceID=1, **columns) -> committed Devices row named sensor<deviceID>, keys R/W<deviceID>."""
+    def add(profile_id, deviceID: int = 1, **columns) -> Devices:
+        values = {
+            'name': f"sensor{deviceID}", 'readkey': f"R{deviceID}", 'writekey': f"W{deviceID}", 'networkID': None,
+            'currentFirmwareVersion': None, 'previousFirmwareVersion': None, 'targetFirmwareVersion': None,
+            'fileDownloadState': False, 'firmwareDownloadState': "updated", **columns,
+        }
+        device = Devices(deviceID=deviceID, profile=profile_id, **values)
+        db.add(device)
+        db.commit()
+        return device
+    return add
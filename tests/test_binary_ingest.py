@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Test the compact binary ingest format: decoding, malformed payloads, writekey
+and gateway (deviceID + org token) keys, profile field masks and batched
+readings with delta-encoded timestamps
+"""
+
+import struct
+from datetime import datetime, timedelta
+import pytest
+from fastapi import HTTPException
+
+from utils.binary_ingest import encode, decode
+from utils.cache import device_key_cache, organisation_cache
+from controllers.device_data import DeviceDataController
+from models.devicedata_value import DeviceData
+from models.user_org import Organisation
+
+
+@pytest.fixture(autouse=True)
+def org(db, add_profile, add_device):
+    device_key_cache.clear()
+    organisation_cache.clear()
+    org = Organisation(name="org", description="", is_active=True, token="ORG-TOKEN")
+    other = Organisation(name="other", description="", is_active=True, token="OTHER-TOKEN")
+    db.add_all([org, other])
+    db.commit()
+    # field2 is not enabled in the profile, so values sent for it are dropped
+    profile = add_profile(org.id, field1="pm25", field3="temp")
+    add_device(profile.id, name="sensor")
+    return org
+
+
+def test_decode_round_trip():
+    times = [datetime(2024, 1, 1, 10, 0), datetime(2024, 1, 1, 10, 0, 30), datetime(2024, 1, 1, 10, 5)]
+    payload = encode([[21.3, 1], [None, 2], [-4.25, 3]], ["field3", "field1"], deviceID=42, timestamps=times)
+    assert len(payload) == 2 + 4 + 4 + (4 + 3 * 2) + 3 * 2 * 4
+    readings = decode(payload)
+    assert (readings.deviceID, readings.writekey, readings.count) == (42, None, 3)
+    assert readings.fields == ["field1", "field3"]
+    assert readings.columns == [["1", "2", "3"], ["21.3", None, "-4.25"]]
+    assert readings.timestamps == times
+
+    single = encode([[21.3, 40.0, 1013.2]], ["field1", "field2", "field3"], writekey="W" * 16)
+    assert len(single) == 35 and decode(single).writekey == "W" * 16
+
+
+def test_non_finite_values_are_no_value():
+    inf = float("inf")
+    readings = decode(encode([[inf, 1.5], [-inf, float("nan")], [3.0, 2.0]], ["field1", "field2"], deviceID=1))
+    assert readings.columns == [[None, None, "3"], ["1.5", None, "2"]]
+
+
+@pytest.mark.parametrize("payload, message", [
+    (b"\x02\x00", "version"),
+    (b"\x01\x08", "flags"),
+    (b"\x01\x00\x05W1", "truncated"),
+    (b"\x01\x01" + struct.pack("<IHH", 1, 0, 1), "mask"),
+    (b"\x01\x01" + struct.pack("<IHH", 1, 1, 0), "no readings"),
+    (b"\x01\x01" + struct.pack("<IHHf", 1, 1, 2, 1.0), "truncated"),
+    (b"\x01\x01" + struct.pack("<IHHff", 1, 1, 1, 1.0, 2.0), "unexpected"),
+])
+def test_malformed_payloads_are_rejected(payload, message):
+    with pytest.raises(ValueError, match=message):
+        decode(payload)
+
+
+def test_writekey_payload_is_stored(db):
+    payload = encode([[12.5, 99.0, 21.0]], ["field1", "field2", "field3"], writekey="W1")
+    result = DeviceDataController.binary_update(db, payload)
+    assert result["count"] == 1 and result["deviceID"] == 1
+    row = db.query(DeviceData).one()
+    assert (row.field1, row.field2, row.field3) == ("12.5", None, "21")
+
+    with pytest.raises(HTTPException) as e:
+        DeviceDataController.binary_update(db, encode([[1.0]], ["field1"], writekey="nope"))
+    assert e.value.status_code == 403
+    with pytest.raises(HTTPException) as e:
+        DeviceDataController.binary_update(db, payload[:-1])
+    assert e.value.status_code == 400
+
+
+def test_gateway_batch_with_timestamps(db):
+    start = datetime(2024, 1, 1, 12, 0)
+    times = [start + timedelta(minutes=minute) for minute in range(60)]
+    payload = encode([[float(minute), 20.0 + minute / 10] for minute in range(60)], ["field1", "field3"], deviceID=1, timestamps=times)
+
+    with pytest.raises(HTTPException) as e:
+        DeviceDataController.binary_update(db, payload)
+    assert e.value.status_code == 403
+    with pytest.raises(HTTPException) as e:
+        DeviceDataController.binary_update(db, payload, org_token="OTHER-TOKEN")
+    assert e.value.status_code == 403
+
+    result = DeviceDataController.binary_update(db, payload, org_token="ORG-TOKEN")
+    assert result["count"] == 60 and result["last_entry_id"] == 60
+    rows = db.query(DeviceData).order_by(DeviceData.entryID).all()
+    assert [row.created_at for row in rows] == times
+    assert rows[59].field1 == "59" and rows[59].field3 == "25.9"
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+Test the set-based /device_data/bulk_update path against a throwaway SQLite database
+"""
+
+import uuid
+from datetime import datetime
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import event
+
+from controllers.device_data import DeviceDataController
+from models.devicedata_value import DeviceData
+
+
+@pytest.fixture(autouse=True)
+def gateway(add_device):
+    return add_device(uuid.uuid4(), name="gateway", networkID="net-1")
+
+
+def test_bulk_update_single_insert(engine, db):
+    """500 readings are written with one INSERT statement and sequential entryIDs"""
+    updates = [
+        {"created_at": f"2024-01-01 00:{i // 60:02d}:{i % 60:02d}", "field1": str(i), "field2": "x"}
+        for i in range(500)
+    ]
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+
+    assert DeviceDataController.bulk_update(db, 1, updates) == {"message": "success"}
+
+    inserts = [s for s in statements if s.startswith("INSERT INTO devicedata (")]
+    assert len(inserts) == 1
+    rows = db.query(DeviceData).order_by(DeviceData.entryID).all()
+    assert [row.entryID for row in rows] == list(range(1, 501))
+    assert rows[0].created_at == datetime(2024, 1, 1, 0, 0, 0)
+    assert rows[-1].field1 == "499" and rows[-1].field3 is None
+
+
+def test_bulk_update_rejects_bad_timestamp(db):
+    """A malformed created_at fails the whole batch with 400 and writes nothing"""
+    updates = [{"created_at": "2024-01-01 00:00:00"}, {"created_at": "yesterday"}]
+    with pytest.raises(HTTPException) as exc:
+        DeviceDataController.bulk_update(db, 1, updates)
+    assert exc.value.status_code == 400
+    assert "index 1" in exc.value.detail
+    assert db.query(DeviceData).count() == 0
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Test config change notifications used by /config_update?wait=N long-polls
+"""
+
+import asyncio
+from datetime import datetime
+import pytest
+
+from utils.config_notify import config_notifier, _payloads
+from controllers.device_data import ConfigValuesController
+from models.config_value import ConfigValues
+
+
+@pytest.fixture(autouse=True)
+def sensors(add_profile, add_device):
+    profile = add_profile(config1="interval")
+    return [add_device(profile.id, device_id, networkID=f"net-{device_id}") for device_id in (1, 2)]
+
+
+def test_config_write_wakes_waiter(db):
+    """A parked device is woken by update_config_data committing in a worker thread"""
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        with config_notifier.subscribe(1) as changed, config_notifier.subscribe(2) as untouched:
+            await loop.run_in_executor(None, ConfigValuesController.update_config_data, db, 1, {"config1": "30"})
+            await asyncio.wait_for(changed.wait(), timeout=5)
+            await asyncio.sleep(0.05)
+            assert not untouched.is_set()
+
+    asyncio.run(run())
+    config_notifier._loop = None
+
+
+def test_mass_edit_wakes_every_device(db):
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        with config_notifier.subscribe(1) as first, config_notifier.subscribe(2) as second:
+            await loop.run_in_executor(
+                None, ConfigValuesController.mass_edit_config_data, db, [1, 2, 99], {"config1": "5"}
+            )
+            await asyncio.wait_for(asyncio.gather(first.wait(), second.wait()), timeout=5)
+
+    asyncio.run(run())
+    config_notifier._loop = None
+
+
+def test_rollback_does_not_notify(db):
+    """Devices published in a rolled back transaction are not announced by a later commit"""
+    published = []
+    original, config_notifier._notify_local = config_notifier._notify_local, published.append
+    try:
+        config_notifier.publish(db, [1])
+        db.rollback()
+        db.add(ConfigValues(datetime.now(), 2, "1", *([None] * 9)))
+        config_notifier.publish(db, [2])
+        db.commit()
+    finally:
+        config_notifier._notify_local = original
+    assert published == [[2]]
+
+
+def test_payloads_fit_notify_limit():
+    payloads = list(_payloads(range(100000, 105000)))
+    assert all(len(payload) < 8000 for payload in payloads)
+    assert sum(len(payload.split(",")) for payload in payloads) == 5000
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Test GET /device/{deviceID}/aggregate: bucketed NumPy statistics, unparseable
+value counting and a month of 1-minute readings in one request
+"""
+
+import statistics
+import time
+import uuid
+from datetime import datetime, timedelta
+import numpy as np
+import pytest
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from controllers.device import DeviceController
+from models.devicedata_value import DeviceData
+
+ORG_ID = uuid.uuid4()
+T0 = datetime(2024, 1, 1)
+
+
+@pytest.fixture
+def add_readings(db, add_profile, add_device):
+    """add_readings(values) writes device 1's readings from (minutes after T0, field1, field2) tuples."""
+    profile = add_profile(ORG_ID, field1="pm25", field2="temp")
+    add_device(profile.id, name="sensor")
+
+    def add(values):
+        db.execute(DeviceData.__table__.insert(), [
+            {"id": uuid.uuid4(), "deviceID": 1, "entryID": i + 1, "created_at": T0 + timedelta(minutes=minute),
+             "field1": field1, "field2": field2}
+            for i, (minute, field1, field2) in enumerate(values)
+        ])
+        db.commit()
+    return add
+
+
+def test_bucket_statistics_match_python(db, add_readings):
+    readings = [(m, str(m % 7), "20") for m in range(0, 180)]
+    add_readings(readings)
+    result = DeviceController.aggregate_device_data(db, ORG_ID, 1, "1h", ["count", "min", "max", "mean", "median", "p95"], ["field1"])
+    assert result["bucket_start"] == [T0, T0 + timedelta(hours=1), T0 + timedelta(hours=2)]
+    for hour in range(3):
+        values = [m % 7 for m in range(hour * 60, hour * 60 + 60)]
+        stats = result["fields"]["field1"]
+        assert stats["count"][hour] == 60
+        assert stats["min"][hour] == min(values) and stats["max"][hour] == max(values)
+        assert stats["mean"][hour] == pytest.approx(statistics.mean(values))
+        assert stats["median"][hour] == pytest.approx(statistics.median(values))
+        assert stats["p95"][hour] == pytest.approx(np.percentile(values, 95))
+
+
+def test_unparseable_values_are_counted_and_gaps_are_null(db, add_readings):
+    add_readings([(0, "1", "20"), (1, "oops", "21"), (2, None, "x"), (120, "4", None)])
+    result = DeviceController.aggregate_device_data(db, ORG_ID, 1, "1h", ["count", "mean"])
+    assert result["unparseable"] == {"field1": 1, "field2": 1}
+    assert result["bucket_start"] == [T0, T0 + timedelta(hours=2)]
+    assert result["fields"]["field1"]["mean"] == [1.0, 4.0]
+    assert result["fields"]["field2"] == {"count": [2, 0], "mean": [20.5, None]}
+    assert result["labels"] == {"field1": "pm25", "field2": "temp"}
+
+
+def test_non_finite_values_are_unparseable(db, add_readings):
+    """inf, 1e999 and nan text are counted, not returned (the response must stay valid JSON)"""
+    add_readings([(0, "1", "20"), (1, "inf", "oops"), (2, "1e999", "-inf"), (3, "nan", "22")])
+    result = DeviceController.aggregate_device_data(db, ORG_ID, 1, "1h", ["count", "sum", "max", "std"])
+    assert result["unparseable"] == {"field1": 3, "field2": 2}
+    assert result["fields"]["field1"] == {"count": [1], "sum": [1.0], "max": [1.0], "std": [0.0]}
+    assert result["fields"]["field2"]["max"] == [22.0]
+    JSONResponse(jsonable_encoder(result))
+
+
+def test_rejects_bad_parameters(db, add_readings):
+    add_readings([(0, "1", "2")])
+    for kwargs in ({"bucket": "5x"}, {"stats": ["p999"]}, {"fields": ["field0"]},
+                   {"bucket": "1s", "start": T0, "end": T0 + timedelta(days=30)}):
+        with pytest.raises(HTTPException) as exc:
+            DeviceController.aggregate_device_data(db, ORG_ID, 1, **kwargs)
+        assert exc.value.status_code == 400
+
+
+def test_month_of_minute_data(db, add_readings):
+    minutes = 30 * 24 * 60
+    add_readings([(m, str(m % 50), f"{20 + (m % 10) / 10}") for m in range(minutes)])
+    started = time.perf_counter()
+    result = DeviceController.aggregate_device_data(db, ORG_ID, 1, "1h", ["mean", "p95", "max"], ["field1", "field2"],
+                                                    T0, T0 + timedelta(days=30))
+    elapsed = time.perf_counter() - started
+    assert result["readings"] == minutes and len(result["bucket_start"]) == 30 * 24
+    assert elapsed < 5
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Test the combined /device/checkin call (reading + metadata + pending config in one transaction)
+"""
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import event
+
+from utils.cache import device_key_cache
+from controllers.device_data import DeviceDataController, ConfigValuesController
+from models.devicedata_value import DeviceData
+from models.metadata_value import MetadataValues
+from models.config_value import ConfigValues
+
+QUERY_BUDGET = 11  # device, latest config, reading + shadow + 3 rollups, metadata + shadow, config ack, commit
+
+
+@pytest.fixture(autouse=True)
+def sensor(add_profile, add_device):
+    profile = add_profile(field1="pm25", field2="pm10", metadata1="battery", config1="interval")
+    device = add_device(profile.id, name="sensor", networkID="net-1")
+    device_key_cache.clear()
+    return device
+
+
+def add_config(db, value):
+    ConfigValuesController.update_config_data(db, 1, {"config1": value})
+
+
+def test_checkin_stores_and_acknowledges(db):
+    add_config(db, "60")
+    result = DeviceDataController.checkin(db, "W1", {"field1": "12", "field9": "x"}, {"metadata1": "3.7"})
+    assert result["message"] == "success"
+    assert result["configs"] == {"config1": "60"}
+    assert result["status"]["config_updated"] is True
+
+    assert db.query(DeviceData).one().field1 == "12"
+    assert db.query(DeviceData).one().field9 is None  # not enabled in the profile
+    assert db.query(MetadataValues).one().metadata1 == "3.7"
+    assert db.query(ConfigValues).one().config_updated is True
+
+    again = DeviceDataController.checkin(db, "W1", {"field1": "13"})
+    assert "configs" not in again and again["status"]["config_updated"] is True
+
+
+def test_checkin_query_budget(engine, db):
+    DeviceDataController.checkin(db, "W1", {"field1": "1"})  # warm the caches and entryID lease
+    add_config(db, "30")
+
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+    commits = []
+    event.listen(engine, "commit", lambda conn: commits.append(1))
+    result = DeviceDataController.checkin(db, "W1", {"field1": "2"}, {"metadata1": "3.6"})
+
+    assert result["configs"] == {"config1": "30"}
+    assert len(statements) + len(commits) <= QUERY_BUDGET
+    assert len(commits) == 1
+
+
+def test_checkin_rejects_bad_writekey(db):
+    with pytest.raises(HTTPException) as exc:
+        DeviceDataController.checkin(db, "nope", {"field1": "1"})
+    assert exc.value.status_code == 403
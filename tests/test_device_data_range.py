@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Test GET /device/{deviceID}/data: keyset pages over (deviceID, entryID), time range,
+field projection and columnar output
+"""
+
+import uuid
+from datetime import datetime, timedelta
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import event
+
+from controllers.device import DeviceController
+from models.devicedata_value import DeviceData
+
+ORG_ID = uuid.uuid4()
+T0 = datetime(2024, 1, 1)
+
+
+@pytest.fixture
+def add_readings(db, add_profile, add_device):
+    """add_readings(count) writes device 1's readings 1..count, one minute apart from T0."""
+    profile = add_profile(ORG_ID, field1="pm25", field3="temp")
+    add_device(profile.id, name="sensor")
+
+    def add(count):
+        for entry_id in range(1, count + 1):
+            db.add(DeviceData(T0 + timedelta(minutes=entry_id), 1, entry_id, str(entry_id), "b", str(entry_id * 10), *([None] * 12)))
+        db.commit()
+    return add
+
+
+def test_keyset_pages_cover_every_row_once(db, add_readings):
+    add_readings(10)
+    seen, after = [], None
+    while True:
+        page = DeviceController.get_device_data(db, ORG_ID, 1, after_entry=after, limit=4)
+        seen.extend(page["columns"]["entryID"])
+        after = page["next_after_entry"]
+        if after is None:
+            break
+    assert seen == list(range(1, 11))
+
+
+def test_columnar_projection_and_labels(engine, db, add_readings):
+    add_readings(3)
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+    page = DeviceController.get_device_data(db, ORG_ID, 1, fields=["field3"])
+    assert set(page["columns"]) == {"entryID", "created_at", "field3"}
+    assert page["columns"]["field3"] == ["10", "20", "30"]
+    assert page["labels"] == {"field3": "temp"}
+    assert "field1" not in statements[-1] and "field2" not in statements[-1]
+    assert len(statements) == 2
+
+    default = DeviceController.get_device_data(db, ORG_ID, 1)
+    assert set(default["columns"]) == {"entryID", "created_at", "field1", "field3"}
+
+
+def test_time_range_and_errors(db, add_readings):
+    add_readings(10)
+    page = DeviceController.get_device_data(db, ORG_ID, 1, start=T0 + timedelta(minutes=3), end=T0 + timedelta(minutes=6))
+    assert page["columns"]["entryID"] == [3, 4, 5]
+    assert page["next_after_entry"] is None
+
+    with pytest.raises(HTTPException) as exc:
+        DeviceController.get_device_data(db, ORG_ID, 1, fields=["field99"])
+    assert exc.value.status_code == 400
+    with pytest.raises(HTTPException) as exc:
+        DeviceController.get_device_data(db, uuid.uuid4(), 1)
+    assert exc.value.status_code == 404
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Test the writekey -> (deviceID, enabled field mask) cache used by /device_data/update
+"""
+
+import pytest
+from sqlalchemy import event
+
+from utils.cache import device_key_cache, apply_mask
+from controllers.device_data import DeviceDataController
+from models.device import Devices
+from models.profile import Profiles
+from models.devicedata_value import DeviceData
+
+
+@pytest.fixture(autouse=True)
+def sensor(add_profile, add_device):
+    profile = add_profile(field1="pm25", field2="pm10")
+    device = add_device(profile.id, name="sensor", networkID="net-1")
+    device_key_cache.clear()
+    return device
+
+
+def test_mask_filters_disabled_fields():
+    values = {"field1": "a", "field2": "b", "field3": "c"}
+    assert apply_mask(values, "field", 0b101)["field1"] == "a"
+    assert apply_mask(values, "field", 0b101)["field2"] is None
+    assert apply_mask(values, "field", 0b101)["field3"] == "c"
+
+
+def test_cached_ingest_skips_lookups(engine, db):
+    """After the first reading, ingest issues no device/profile SELECTs"""
+    DeviceDataController.update_device_data(db, "W1", {"field1": "10", "field3": "x"})
+
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+    row = DeviceDataController.update_device_data(db, "W1", {"field1": "11", "field2": "4"})
+
+    assert not [s for s in statements if "FROM devices" in s or "FROM profiles" in s]
+    assert row["field1"] == "11" and row["field2"] == "4"
+    stored = db.query(DeviceData).order_by(DeviceData.entryID).all()
+    assert stored[0].field3 is None  # field3 is not enabled in the profile
+
+
+def test_profile_change_invalidates(db):
+    """Enabling a field on the profile is visible to the next reading"""
+    DeviceDataController.update_device_data(db, "W1", {"field3": "x"})
+    profile = db.query(Profiles).first()
+    profile.field3 = "pm1"
+    db.commit()
+    row = DeviceDataController.update_device_data(db, "W1", {"field3": "y"})
+    assert row["field3"] == "y"
+
+
+def test_writekey_change_invalidates(db):
+    DeviceDataController.update_device_data(db, "W1", {"field1": "1"})
+    device = db.query(Devices).first()
+    device.writekey = "W2"
+    db.commit()
+    assert device_key_cache.get(db, "W1") is None
+    assert device_key_cache.get(db, "W2").deviceID == 1
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Test GET /device listing: one query regardless of device count, keyset pagination and projection
+"""
+
+import uuid
+from datetime import datetime
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import event
+
+from controllers.device import DeviceController
+from controllers.device_data import DeviceDataController
+from models.firmware import Firmware
+from models.devicedata_value import DeviceData
+
+ORG_ID = uuid.uuid4()
+
+
+@pytest.fixture
+def add_sensors(db, add_profile, add_device):
+    """add_sensors(first, last) adds ORG_ID devices first..last next to one foreign organisation device."""
+    profile = add_profile(ORG_ID, field1="pm25")
+    other = add_profile(name="other")
+    v1 = Firmware(organisation_id=ORG_ID, firmware_version="1.0", firmware_string="a.bin")
+    v2 = Firmware(organisation_id=ORG_ID, firmware_version="2.0", firmware_string="b.bin")
+    db.add_all([v1, v2])
+    db.commit()
+    add_device(other.id, 1000, name="foreign", readkey="RX", writekey="WX")
+
+    def add(first, last):
+        for i in range(first, last + 1):
+            add_device(
+                profile.id, i, networkID=f"net-{i}", currentFirmwareVersion=v1.id,
+                targetFirmwareVersion=v2.id if i % 2 else None
+            )
+    return add
+
+
+def count_queries(engine, call):
+    statements = []
+    listener = lambda *args: statements.append(args[2])
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        result = call()
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+    return result, len(statements)
+
+
+def test_query_count_is_constant(engine, db, add_sensors):
+    counts = []
+    for first, last in ((1, 3), (4, 60)):
+        add_sensors(first, last)
+        devices, queries = count_queries(engine, lambda: DeviceController.get_devices(db, ORG_ID))
+        assert len(devices) == last
+        counts.append(queries)
+    assert counts == [1, 1]
+
+
+def test_versions_profile_and_last_posted_time(db, add_sensors):
+    add_sensors(1, 2)
+    DeviceDataController.update_device_data(db, "W1", {"field1": "1"})
+    # A reading written before the shadow table existed
+    db.add(DeviceData(datetime(2024, 5, 1), 2, 1, "x", *([None] * 14)))
+    db.commit()
+
+    first, second = DeviceController.get_devices(db, ORG_ID)
+    assert first["currentFirmwareVersion"] == "1.0" and first["targetFirmwareVersion"] == "2.0"
+    assert first["previousFirmwareVersion"] == "1.0"  # falls back to current
+    assert second["targetFirmwareVersion"] == "1.0"
+    assert first["profile_name"] == "air"
+    assert first["last_posted_time"] is not None
+    assert second["last_posted_time"] == datetime(2024, 5, 1)
+
+
+def test_keyset_pagination_and_projection(db, add_sensors):
+    add_sensors(1, 5)
+    page = DeviceController.get_devices(db, ORG_ID, after=2, limit=2, fields=["name"])
+    assert page == [{"deviceID": 3, "name": "sensor3"}, {"deviceID": 4, "name": "sensor4"}]
+    assert DeviceController.get_devices(db, ORG_ID, after=4, limit=2)[0]["deviceID"] == 5
+    with pytest.raises(HTTPException) as exc:
+        DeviceController.get_devices(db, ORG_ID, fields=["password"])
+    assert exc.value.status_code == 400
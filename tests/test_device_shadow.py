@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Test the device_shadow table kept up to date by data, metadata and config writes
+"""
+
+import uuid
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import event
+
+from utils import upsert
+from utils.cache import device_key_cache
+from utils.device_shadow import rebuild_shadows, latest_config, last_posted_times
+from controllers.device_data import DeviceDataController, MetadataValuesController, ConfigValuesController
+from controllers.device import DeviceController
+from models.device_shadow import DeviceShadow
+from models.devicedata_value import DeviceData
+from models.config_value import ConfigValues
+
+ORG_ID = uuid.uuid4()
+
+
+@pytest.fixture(autouse=True)
+def sensor(add_profile, add_device):
+    profile = add_profile(ORG_ID, field1="pm25", metadata1="battery", config1="interval")
+    device = add_device(profile.id, name="sensor", networkID="net-1")
+    device_key_cache.clear()
+    return device
+
+
+def test_writes_maintain_shadow(db):
+    DeviceDataController.update_device_data(db, "W1", {"field1": "10"})
+    MetadataValuesController.update_metadata(db, "W1", {"metadata1": "3.7"})
+    ConfigValuesController.update_config_data(db, 1, {"config1": "60"})
+    ConfigValuesController.mass_edit_config_data(db, [1], {"config1": "30"})
+
+    shadow = db.get(DeviceShadow, 1)
+    assert shadow.data == {"field1": "10"}
+    assert shadow.meta == {"metadata1": "3.7"}
+    assert shadow.config == {"config1": "30"} and shadow.config_version == 2
+    assert shadow.last_seen == max(shadow.data_at, shadow.meta_at)
+    assert latest_config(db, 1).config1 == "30"
+
+
+def test_backfilled_history_does_not_replace_newer_reading(db):
+    DeviceDataController.update_device_data(db, "W1", {"field1": "now"})
+    old = (datetime.now() - timedelta(days=30)).isoformat(sep=" ")
+    DeviceDataController.bulk_update(db, 1, [{"created_at": old, "field1": "old"}])
+    assert db.get(DeviceShadow, 1).data == {"field1": "now"}
+
+
+def test_generic_upsert_fallback(db, monkeypatch):
+    """Backends without INSERT ... ON CONFLICT keep the same shadow through select-then-update/insert"""
+    monkeypatch.setattr(upsert, "_NATIVE", {})
+    DeviceDataController.update_device_data(db, "W1", {"field1": "now"})
+    old = (datetime.now() - timedelta(days=30)).isoformat(sep=" ")
+    DeviceDataController.bulk_update(db, 1, [{"created_at": old, "field1": "old"}])
+    ConfigValuesController.update_config_data(db, 1, {"config1": "60"})
+    ConfigValuesController.mass_edit_config_data(db, [1], {"config1": "30"})
+
+    shadow = db.get(DeviceShadow, 1)
+    assert shadow.data == {"field1": "now"}
+    assert shadow.config == {"config1": "30"} and shadow.config_version == 2
+
+
+def test_latest_reads_skip_history(engine, db):
+    """Latest config and last_posted_time come from the shadow, not sorted history"""
+    DeviceDataController.update_device_data(db, "W1", {"field1": "1"})
+    ConfigValuesController.update_config_data(db, 1, {"config1": "60"})
+
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+    assert latest_config(db, 1).config1 == "60"
+    assert last_posted_times(db, [1])[1] is not None
+    devices = DeviceController.get_devices(db, ORG_ID)
+    assert devices[0]["last_posted_time"] is not None
+    assert not [s for s in statements if "created_at DESC" in s]
+
+
+def test_rebuild_from_history(db):
+    """Rows written before the shadow existed are picked up by rebuild_shadows()"""
+    db.add(DeviceData(datetime(2024, 1, 1), 1, 1, "a", *([None] * 14)))
+    db.add(DeviceData(datetime(2024, 1, 2), 1, 2, "b", *([None] * 14)))
+    db.add(ConfigValues(datetime(2024, 1, 1), 1, "5", *([None] * 9)))
+    db.commit()
+    assert latest_config(db, 1).config1 == "5"  # fallback before the rebuild
+    rebuild_shadows(db)
+    rebuild_shadows(db)
+    db.commit()
+    shadow = db.get(DeviceShadow, 1)
+    assert shadow.data == {"field1": "b"} and shadow.last_entry_id == 2
+    assert shadow.config == {"config1": "5"} and shadow.config_version == 1
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Test the per-device entryID allocator against a throwaway SQLite database
+"""
+
+import threading
+from datetime import datetime
+from sqlalchemy import event
+
+from utils.entry_id_allocator import EntryIDAllocator
+from models.device_entry_sequence import DeviceEntrySequence
+from models.devicedata_value import DeviceData
+
+
+def test_seeds_from_existing_rows(db):
+    """A device that already has data continues after its highest entryID"""
+    for entry_id in (1, 2, 7):
+        db.add(DeviceData(datetime.now(), 1, entry_id, *([None] * 15)))
+    db.commit()
+
+    allocator = EntryIDAllocator(block_size=10)
+    assert allocator.allocate(db, 1, 3) == [8, 9, 10]
+    assert allocator.allocate(db, 1) == [11]
+    # Counter row has moved past the whole leased block
+    assert db.query(DeviceEntrySequence).filter_by(deviceID=1).one().next_entry_id == 18
+
+
+def test_bulk_allocation_is_one_round_trip(engine, db):
+    """500 ids for one device come from a single reservation"""
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+
+    allocator = EntryIDAllocator(block_size=100)
+    ids = allocator.allocate(db, 5, 500)
+    assert ids == list(range(1, 501))
+    # seed: UPDATE (miss), SELECT max, INSERT
+    assert len(statements) <= 3
+
+    statements.clear()
+    allocator.allocate(db, 5, 500)
+    assert len(statements) == 1
+
+
+def test_workers_never_share_ids(session_factory):
+    """Several allocators (one per simulated worker) hand out disjoint ids"""
+    results = []
+    lock = threading.Lock()
+
+    def worker():
+        allocator = EntryIDAllocator(block_size=7)
+        db = session_factory()
+        got = []
+        for _ in range(20):
+            got.extend(allocator.allocate(db, 3, 3))
+        db.close()
+        with lock:
+            results.extend(got)
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(results) == 4 * 20 * 3
+    assert len(set(results)) == len(results)
+
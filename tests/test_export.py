@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Test streaming history export: chunked server-side reads, NDJSON/CSV encoding,
+profile labels as headers, gzip and per-organisation device scoping
+"""
+
+import csv
+import gzip
+import io
+import json
+import uuid
+from datetime import datetime, timedelta
+import pytest
+from fastapi import HTTPException
+
+from controllers.export import ExportController
+from routes.export import export_history
+from models.devicedata_value import DeviceData
+from models.metadata_value import MetadataValues
+
+ORG_ID = uuid.uuid4()
+T0 = datetime(2024, 1, 1)
+
+
+@pytest.fixture
+def add_readings(db, add_profile, add_device):
+    """add_readings(count) writes readings 1..count for devices 1 and 2 (ORG_ID) and 3 (another organisation)."""
+    profile = add_profile(ORG_ID, field1="pm25", field2="temp", metadata1="battery")
+    other = add_profile(name="other")
+    for device_id, profile_id in ((1, profile.id), (2, profile.id), (3, other.id)):
+        add_device(profile_id, device_id)
+
+    def add(count):
+        for device_id in (1, 2, 3):
+            for entry_id in range(1, count + 1):
+                db.add(DeviceData(T0 + timedelta(minutes=entry_id), device_id, entry_id, str(entry_id), "20.5", *([None] * 13)))
+        db.add(MetadataValues(T0, 1, "3.7", *([None] * 14)))
+        db.commit()
+    return add
+
+
+def test_ndjson_is_streamed_in_chunks(db, add_readings):
+    add_readings(10)
+    chunks = list(ExportController.export(db, ORG_ID, "data", device_ids=[1], chunk_size=4))
+    assert len(chunks) == 3
+    rows = [json.loads(line) for line in b"".join(chunks).decode().splitlines()]
+    assert [row["entryID"] for row in rows] == list(range(1, 11))
+    assert rows[0] == {"deviceID": 1, "entryID": 1, "created_at": "2024-01-01T00:01:00", "pm25": "1", "temp": "20.5"}
+
+
+def test_csv_labels_and_all_org_devices(db, add_readings):
+    add_readings(3)
+    body = b"".join(ExportController.export(db, ORG_ID, "data", format="csv")).decode()
+    rows = list(csv.reader(io.StringIO(body)))
+    assert rows[0] == ["deviceID", "entryID", "created_at", "pm25", "temp"]
+    assert {row[0] for row in rows[1:]} == {"1", "2"}  # device 3 belongs to another organisation
+    assert len(rows) == 7
+
+    metadata = b"".join(ExportController.export(db, ORG_ID, "metadata", format="csv")).decode().splitlines()
+    assert metadata == ["deviceID,created_at,battery", "1,2024-01-01T00:00:00,3.7"]
+
+
+def test_gzip_and_time_range(db, add_readings):
+    add_readings(10)
+    start, end = T0 + timedelta(minutes=3), T0 + timedelta(minutes=6)
+    compressed = b"".join(ExportController.export(db, ORG_ID, "data", [2], start, end, compress=True, chunk_size=2))
+    rows = [json.loads(line) for line in gzip.decompress(compressed).decode().splitlines()]
+    assert [row["entryID"] for row in rows] == [3, 4, 5]
+
+
+def test_colliding_labels_keep_every_column(db, add_readings, add_profile, add_device):
+    add_readings(1)
+    # Another profile in the organisation calls field2 what "air" calls field1, and reuses its own label
+    clash = add_profile(ORG_ID, name="clash", field1="pm25", field2="pm25", field3="created_at")
+    add_device(clash.id, 4)
+    db.add(DeviceData(T0, 4, 1, "12", "13", "14", *([None] * 12)))
+    db.commit()
+    rows = [json.loads(line) for line in b"".join(ExportController.export(db, ORG_ID, "data", device_ids=[4])).decode().splitlines()]
+    assert rows == [{"deviceID": 4, "entryID": 1, "created_at": "2024-01-01T00:00:00",
+                     "pm25 (field1)": "12", "pm25 (field2)": "13", "created_at (field3)": "14"}]
+
+    header = next(csv.reader(io.StringIO(b"".join(ExportController.export(db, ORG_ID, "data", format="csv")).decode())))
+    # field2 is "temp" on one profile and "pm25" on the other, so it keeps its column name
+    assert header == ["deviceID", "entryID", "created_at", "pm25", "field2", "created_at (field3)"]
+
+
+def test_rejects_bad_requests(db, add_readings):
+    add_readings(1)
+    for kwargs, status in (({"table": "users"}, 400), ({"table": "data", "format": "xml"}, 400),
+                           ({"table": "data", "device_ids": [3]}, 404)):
+        with pytest.raises(HTTPException) as exc:
+            ExportController.export(db, ORG_ID, **kwargs)
+        assert exc.value.status_code == status
+    with pytest.raises(HTTPException) as exc:
+        export_history("data", device_ids="1,abc", start=None, end=None, format="ndjson", gzip=False, db=db,
+                       user_data={"primary_org_id": str(ORG_ID)})
+    assert exc.value.status_code == 400
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Test the opt-in fast JSON path: orjson responses match the default
+response_model/jsonable_encoder output, and TypeAdapter-validated ingest
+bodies parse the same with and without FAST_JSON
+"""
+
+import json
+import pytest
+from fastapi.encoders import jsonable_encoder
+from fastapi.exceptions import RequestValidationError
+
+from utils import fast_json
+from utils.fast_json import FastJSONResponse, fast_response, parse_body
+from schemas.device import DeviceDetailResponse, DeviceResponse
+from schemas.device_data import device_data_update_adapter, device_checkin_adapter
+from controllers.device import DeviceController
+from controllers.device_data import DeviceDataController
+from models.user_org import Organisation
+
+
+@pytest.fixture
+def organisation_id(db, add_profile, add_device):
+    org = Organisation(name="org", description="", is_active=True, token="ORG-TOKEN")
+    db.add(org)
+    db.commit()
+    profile = add_profile(org.id, field1="pm25", field2="temp", config1="interval")
+    add_device(profile.id, name="sensor", networkID="net-1")
+    DeviceDataController.bulk_update(db, 1, [
+        {"created_at": f"2024-01-01 10:{minute:02d}:00.250000", "field1": str(minute), "field2": "21.5"} for minute in range(30)
+    ])
+    return org.id
+
+
+def test_fast_responses_match_default(db, organisation_id):
+    device = DeviceController.get_device(db, organisation_id, 1)
+    devices = DeviceController.get_devices(db, organisation_id)
+    # What FastAPI sends by default: response_model validation, then serialization
+    expected = {
+        "device": json.loads(DeviceDetailResponse.model_validate(device).model_dump_json()),
+        "devices": [json.loads(DeviceResponse.model_validate(row).model_dump_json()) for row in devices],
+        "partial": jsonable_encoder(DeviceController.get_devices(db, organisation_id, fields=["name", "last_posted_time"])),
+    }
+    actual = {
+        "device": json.loads(FastJSONResponse(device).body),
+        "devices": json.loads(FastJSONResponse(devices).body),
+        "partial": json.loads(FastJSONResponse(DeviceController.get_devices(db, organisation_id, fields=["name", "last_posted_time"])).body),
+    }
+    assert actual == expected
+    assert len(actual["device"]["device_data"]) == 30 and actual["device"]["device_data"][0]["created_at"].endswith(".250000")
+
+
+def test_fast_response_is_opt_in(monkeypatch):
+    content = {"deviceID": 1}
+    assert fast_response(content) is content
+    monkeypatch.setattr(fast_json, "FAST_JSON", True)
+    response = fast_response(content, headers={"X-Next-After": "1"})
+    assert response.body == b'{"deviceID":1}' and response.headers["x-next-after"] == "1"
+
+
+@pytest.mark.parametrize("fast", [False, True])
+def test_ingest_bodies(monkeypatch, fast):
+    monkeypatch.setattr(fast_json, "FAST_JSON", fast)
+    body = parse_body(device_data_update_adapter, b'{"writekey": "W1", "fields": {"field1": "1", "field2": 2.5}, "extra": 1}')
+    assert body == {"writekey": "W1", "fields": {"field1": "1", "field2": 2.5}}
+    assert parse_body(device_checkin_adapter, b'{"writekey": "W1"}') == {"writekey": "W1"}
+
+    for raw, error in ((b'{"writekey": "W1"}', "missing"), (b'{"writekey": 5, "fields": {}}', "string_type"), (b'{bad', "json_invalid")):
+        with pytest.raises(RequestValidationError) as e:
+            parse_body(device_data_update_adapter, raw)
+        assert e.value.errors()[0]["type"] == error and e.value.errors()[0]["loc"][0] == "body"
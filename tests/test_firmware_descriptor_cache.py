@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Test the shared device status builder and its firmware descriptor cache
+"""
+
+import uuid
+import pytest
+from sqlalchemy import event
+
+from utils.cache import firmware_descriptor_cache
+from utils.device_status import build_device_status
+from models.device import Devices
+from models.firmware import Firmware, FirmwareType
+
+
+@pytest.fixture
+def firmware(db):
+    firmware = Firmware(
+        organisation_id=uuid.uuid4(), firmware_version="1.2.0", firmware_string="fw.bin",
+        crc32="deadbeef", firmware_bin_size=2048
+    )
+    db.add(firmware)
+    db.commit()
+    firmware_descriptor_cache.clear()
+    return firmware
+
+
+@pytest.fixture
+def device(firmware):
+    # The status builder only reads attributes, so the device need not be persisted
+    return Devices(
+        name="sensor", readkey="R1", writekey="W1", deviceID=1, networkID="net-1",
+        profile=None, currentFirmwareVersion=None, previousFirmwareVersion=None,
+        targetFirmwareVersion=firmware.id, fileDownloadState=False, firmwareDownloadState="pending"
+    )
+
+
+def test_status_uses_cached_descriptor(engine, db, device, firmware):
+    status = build_device_status(db, device, None)
+    assert status["firmwareDownload"] == {
+        "firmwareDownloadState": "pending", "version": "1.2.0", "fwcrc": "deadbeef", "firmware_size": 2048
+    }
+
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+    assert build_device_status(db, device, None) == status
+    assert not [s for s in statements if "FROM firmware" in s]
+
+
+def test_no_target_firmware(db, device):
+    device.targetFirmwareVersion = None
+    status = build_device_status(db, device, None)
+    assert status["firmwareDownload"]["version"] == "unknown"
+    assert status["firmwareDownload"]["fwcrc"] == "0x00000000"
+    assert status["firmwareDownload"]["firmware_size"] == 0
+
+
+def test_firmware_update_invalidates(db, device, firmware):
+    build_device_status(db, device, None)
+    firmware.firmware_type = FirmwareType.stable
+    firmware.crc32 = "cafebabe"
+    db.commit()
+    assert build_device_status(db, device, None)["firmwareDownload"]["fwcrc"] == "cafebabe"
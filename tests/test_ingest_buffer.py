@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Test the write-behind ingest buffer (group commit, back-pressure, shutdown flush)
+"""
+
+import asyncio
+from datetime import datetime
+import pytest
+from sqlalchemy import event
+
+from utils.ingest_buffer import IngestBuffer, BufferFull
+from utils.devicedata_writer import build_device_data_row
+from models.devicedata_value import DeviceData
+
+
+def reading(entry_id):
+    return build_device_data_row(1, entry_id, datetime.now(), {"field1": str(entry_id)})
+
+
+def test_flush_groups_commits(engine, session_factory):
+    """Queued readings are written in batches, one commit per batch"""
+    commits = []
+    event.listen(engine, "commit", lambda conn: commits.append(1))
+    buffer = IngestBuffer(session_factory, enabled=True, batch_size=50)
+    for i in range(1, 121):
+        buffer.put(reading(i))
+    assert buffer.stats()["queue_depth"] == 120
+
+    assert buffer.flush() == 120
+    assert len(commits) == 3
+    stats = buffer.stats()
+    assert stats["queue_depth"] == 0 and stats["flushed"] == 120 and stats["flushes"] == 3
+    assert session_factory().query(DeviceData).count() == 120
+
+
+def test_queued_rows_are_copies(session_factory):
+    """The flusher never mutates the row a handler returned to its client"""
+    buffer = IngestBuffer(session_factory, enabled=True)
+    row = reading(1)
+    buffer.put(row)
+    buffer.flush()
+    assert "id" not in row
+    assert session_factory().query(DeviceData).count() == 1
+
+
+def test_back_pressure(session_factory):
+    """A full buffer rejects new readings once the enqueue timeout passes"""
+    buffer = IngestBuffer(session_factory, enabled=True, max_size=2, enqueue_timeout_ms=10)
+    buffer.put(reading(1))
+    buffer.put(reading(2))
+    with pytest.raises(BufferFull):
+        buffer.put(reading(3))
+    assert buffer.stats()["rejected"] == 1
+    buffer.flush()
+    buffer.put(reading(3))
+
+
+def test_shutdown_flushes_remaining_rows(session_factory):
+    """stop() drains the queue even if the interval has not elapsed"""
+    buffer = IngestBuffer(session_factory, enabled=True, flush_interval_ms=60000)
+
+    async def run():
+        await buffer.start()
+        for i in range(1, 11):
+            buffer.put(reading(i))
+        await buffer.stop()
+
+    asyncio.run(run())
+    assert session_factory().query(DeviceData).count() == 10
+
+
+def test_failed_batch_is_retried_then_split(session_factory):
+    """After the retries only the row that fails on its own is dropped; the rest of its batch is written"""
+    buffer = IngestBuffer(session_factory, enabled=True)
+    for entry_id in (1, 2, 3, 2, 4):  # the second entryID 2 violates unique_device_entry
+        buffer.put(reading(entry_id))
+    for _ in range(3):
+        buffer.flush()
+    stats = buffer.stats()
+    assert stats["failed_flushes"] == 3
+    assert stats["dropped"] == 1 and stats["flushed"] == 4 and stats["queue_depth"] == 0
+    assert sorted(row.entryID for row in session_factory().query(DeviceData)) == [1, 2, 3, 4]
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Query-plan regression test: "latest row for a device" lookups must use the
+(deviceID, created_at DESC) indexes, and the Alembic tree must create them.
+"""
+
+import os
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import inspect, text
+
+from models.config_value import ConfigValues
+from models.metadata_value import MetadataValues
+from models.devicedata_value import DeviceData
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LOOKUPS = [
+    (ConfigValues, 'ix_configvalues_device_created'),
+    (MetadataValues, 'ix_metadatavalues_device_created'),
+    (DeviceData, 'ix_devicedata_device_created'),
+]
+
+
+def query_plan(db, query) -> str:
+    sql = str(query.statement.compile(db.get_bind(), compile_kwargs={"literal_binds": True}))
+    return " | ".join(row[-1] for row in db.execute(text(f"EXPLAIN QUERY PLAN {sql}")))
+
+
+def test_latest_lookups_use_index(db):
+    for model, index_name in LOOKUPS:
+        query = db.query(model).filter_by(deviceID=7).order_by(model.created_at.desc()).limit(1)
+        plan = query_plan(db, query)
+        assert f"USING INDEX {index_name}" in plan, plan
+        assert "TEMP B-TREE" not in plan, plan
+
+
+def alembic_config(url):
+    cfg = Config(os.path.join(ROOT, "alembic.ini"))
+    cfg.set_main_option("script_location", os.path.join(ROOT, "migrations"))
+    cfg.set_main_option("sqlalchemy.url", url)
+    return cfg
+
+
+def test_migration_adds_indexes_to_existing_database(engine):
+    """A database created before the indexes existed gets them from `stamp` + `upgrade head`"""
+    with engine.begin() as conn:
+        for _, index_name in LOOKUPS:
+            conn.execute(text(f"DROP INDEX {index_name}"))
+
+    cfg = alembic_config(str(engine.url))
+    command.stamp(cfg, "0001_baseline")
+    command.upgrade(cfg, "head")
+    inspector = inspect(engine)
+    for model, index_name in LOOKUPS:
+        assert index_name in [index["name"] for index in inspector.get_indexes(model.__tablename__)]
+    # Downgrade and upgrade again round-trip cleanly
+    command.downgrade(cfg, "0001_baseline")
+    command.upgrade(cfg, "head")
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Test the set-based /config/mass_edit (constant number of queries regardless of device count)
+"""
+
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import event
+
+from utils.cache import firmware_descriptor_cache
+from utils.device_shadow import rebuild_shadows
+from controllers.device_data import ConfigValuesController
+from models.device import Devices
+from models.firmware import Firmware
+from models.config_value import ConfigValues
+
+DEVICE_COUNT = 500
+
+
+@pytest.fixture(autouse=True)
+def fleet(db, add_profile):
+    profile = add_profile(config1="interval", config2="mode")
+    firmware = Firmware(organisation_id=profile.organisation_id, firmware_version="2.0", firmware_string="fw.bin", crc32="abcd", firmware_bin_size=10)
+    db.add(firmware)
+    db.commit()
+    db.add_all([
+        Devices(
+            name=f"sensor{i}", readkey=f"R{i}", writekey=f"W{i}", deviceID=i, networkID=f"net-{i}",
+            profile=profile.id, currentFirmwareVersion=None, previousFirmwareVersion=None,
+            targetFirmwareVersion=firmware.id if i % 2 else None, fileDownloadState=False,
+            firmwareDownloadState="updated"
+        )
+        for i in range(1, DEVICE_COUNT + 1)
+    ])
+    # Two config generations per device; only the newer one should be carried forward
+    old, new = datetime.now() - timedelta(days=2), datetime.now() - timedelta(days=1)
+    for i in range(1, DEVICE_COUNT + 1):
+        db.add(ConfigValues(old, i, "10", "old", *([None] * 8)))
+        db.add(ConfigValues(new, i, "20", f"mode{i}", *([None] * 8)))
+    db.commit()
+    rebuild_shadows(db)
+    db.commit()
+    firmware_descriptor_cache.clear()
+
+
+def test_mass_edit_is_set_based(engine, db):
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+
+    results = ConfigValuesController.mass_edit_config_data(
+        db, list(range(1, DEVICE_COUNT + 1)) + [99999, "abc"], {"config1": "60", "config2": ""}
+    )
+
+    assert len(results['success']) == DEVICE_COUNT
+    assert {failure['deviceID'] for failure in results['failed']} == {99999, "abc"}
+    # devices, latest configs, firmware, one insert, one shadow upsert
+    assert len(statements) <= 5, statements
+    first = results['success'][0]
+    assert first['configs'] == {"config1": "60", "config2": "mode1"}
+    assert first['status']['firmwareDownload']['version'] == "2.0"
+    assert first['status']['config_updated'] is False
+
+
+def test_new_rows_become_latest(db):
+    ConfigValuesController.mass_edit_config_data(db, [1, 2, 2], {"config1": "", "config2": "x"})
+    latest = ConfigValuesController.latest_configs(db, [1, 2])
+    assert latest[1].config1 == "20" and latest[1].config2 == "x"
+    assert latest[1].config_updated is False
+    assert db.query(ConfigValues).filter_by(deviceID=2).count() == 3  # duplicate ids are edited once
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Upgrade path regression test: a database with the schema create_all_tables()
+built before migrations existed (and some history in it) is brought to head
+with `alembic stamp 0001_baseline && alembic upgrade head`, as the README
+documents, and the data migrations fill the new tables from that history
+"""
+
+import os
+import uuid
+from datetime import datetime, timedelta
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import create_engine, inspect, text
+
+from utils.base import Base
+import models.config_value, models.device, models.device_file, models.devicedata_value  # noqa: F401
+import models.firmware, models.metadata_value, models.profile, models.user_org  # noqa: F401
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Tables and columns as they were before the migrations tree was added
+BASELINE_TABLES = [
+    'organisations', 'users', 'user_organisations', 'firmware', 'profiles', 'devices',
+    'devicefiles', 'devicedata', 'metadatavalues', 'configvalues',
+]
+LATER_COLUMNS = [
+    ('profiles', 'data_retention_days'), ('profiles', 'metadata_retention_days'),
+    ('profiles', 'config_history_limit'), ('profiles', 'field_types'),
+]
+LATER_INDEXES = ['ix_devicedata_device_created', 'ix_metadatavalues_device_created', 'ix_configvalues_device_created']
+
+
+def alembic_config(url):
+    cfg = Config(os.path.join(ROOT, "alembic.ini"))
+    cfg.set_main_option("script_location", os.path.join(ROOT, "migrations"))
+    cfg.set_main_option("sqlalchemy.url", url)
+    return cfg
+
+
+def make_baseline_database(path):
+    url = f"sqlite:///{path / 'baseline.db'}"
+    engine = create_engine(url)
+    Base.metadata.create_all(bind=engine, tables=[Base.metadata.tables[name] for name in BASELINE_TABLES])
+    org, profile = uuid.uuid4().hex, uuid.uuid4().hex
+    start = datetime(2024, 1, 1, 10, 0)
+    with engine.begin() as conn:
+        for name in LATER_INDEXES:
+            conn.execute(text(f"DROP INDEX {name}"))
+        for table, column in LATER_COLUMNS:
+            conn.execute(text(f"ALTER TABLE {table} DROP COLUMN {column}"))
+        conn.execute(text("INSERT INTO organisations (id, name, is_active, token) VALUES (:id, 'org', 1, 'TOKEN')"), {"id": org})
+        conn.execute(text("INSERT INTO profiles (id, organisation_id, name, field1) VALUES (:id, :org, 'air', 'temp')"),
+                     {"id": profile, "org": org})
+        conn.execute(text(
+            "INSERT INTO devices (id, name, readkey, writekey, deviceID, profile, fileDownloadState, firmwareDownloadState) "
+            "VALUES (:id, 'sensor', 'R1', 'W1', 1, :profile, 0, 'updated')"
+        ), {"id": uuid.uuid4().hex, "profile": profile})
+        for minute in range(5):
+            conn.execute(text(
+                "INSERT INTO devicedata (id, entryID, deviceID, created_at, field1) VALUES (:id, :entry, 1, :at, :value)"
+            ), {"id": uuid.uuid4().hex, "entry": minute + 1, "at": start + timedelta(minutes=minute), "value": str(20 + minute)})
+        conn.execute(text("INSERT INTO metadatavalues (id, deviceID, created_at, metadata1) VALUES (:id, 1, :at, 'm')"),
+                     {"id": uuid.uuid4().hex, "at": start})
+        conn.execute(text("INSERT INTO configvalues (id, deviceID, created_at, config_updated, config1) VALUES (:id, 1, :at, 0, '30')"),
+                     {"id": uuid.uuid4().hex, "at": start})
+    return url, engine
+
+
+def test_baseline_database_upgrades_to_head(tmp_path, monkeypatch):
+    monkeypatch.setenv("UUID7_REKEY", "true")
+    url, engine = make_baseline_database(tmp_path)
+    cfg = alembic_config(url)
+    command.stamp(cfg, "0001_baseline")
+    command.upgrade(cfg, "head")
+
+    inspector = inspect(engine)
+    indexes = {index['name'] for table in ('devicedata', 'metadatavalues', 'configvalues') for index in inspector.get_indexes(table)}
+    assert set(LATER_INDEXES) <= indexes
+    assert {'data_retention_days', 'config_history_limit', 'field_types'} <= {column['name'] for column in inspector.get_columns('profiles')}
+    assert 'devicedata_numeric' in inspector.get_table_names()
+    with engine.connect() as conn:
+        shadow = conn.execute(text('SELECT data, last_entry_id, meta, config FROM device_shadow WHERE "deviceID" = 1')).one()
+        assert shadow.last_entry_id == 5 and '"field1": "24"' in shadow.data
+        assert '"metadata1": "m"' in shadow.meta and '"config1": "30"' in shadow.config
+        hourly = conn.execute(text("SELECT count, sum, last FROM devicedata_rollup_1h WHERE field = 'field1'")).one()
+        assert tuple(hourly) == (5, 110.0, 24.0)
+        # UUID7_REKEY rewrote the history ids and moved the shadow's config reference along
+        ids = [uuid.UUID(row[0]) for row in conn.execute(text("SELECT id FROM devicedata"))]
+        assert all(value.version == 7 for value in ids)
+        assert conn.execute(text("SELECT count(*) FROM device_shadow JOIN configvalues ON configvalues.id = device_shadow.config_id")).scalar() == 1
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Test typed profile fields: readings parsed once into devicedata_numeric,
+unparseable values counted instead of kept, untyped devices skipped,
+re-parsing history when a profile's types change, and retention
+"""
+
+import uuid
+from datetime import datetime, timedelta
+import pytest
+from pydantic import ValidationError
+from sqlalchemy import func
+
+from utils import numeric_fields
+from utils.cache import field_type_cache
+from utils.retention import RetentionPurger
+from controllers.device_data import DeviceDataController
+from controllers.profile import ProfileController
+from schemas.profile import ProfileFieldTypes, ProfileCreate
+from models.devicedata_value import DeviceData
+from models.devicedata_numeric import DeviceDataNumeric
+
+ORG_ID = uuid.uuid4()
+# Device ids no other test uses, so the process-wide field type cache cannot leak between test databases
+TYPED, UNTYPED = 9101, 9102
+
+
+@pytest.fixture(autouse=True)
+def profiles(add_profile, add_device):
+    field_type_cache.clear()
+    typed = add_profile(ORG_ID, name="typed", field1="pm25", field2="count", field3="fan", field4="label",
+                        field_types={"field1": "float", "field2": "int", "field3": "bool", "field4": "string"})
+    untyped = add_profile(ORG_ID, name="untyped", field1="pm25")
+    for device_id, profile in ((TYPED, typed), (UNTYPED, untyped)):
+        add_device(profile.id, device_id, readkey=f"NR{device_id}", writekey=f"NW{device_id}")
+    return typed, untyped
+
+
+def test_typed_fields_are_parsed_once_and_errors_counted(db):
+    before = numeric_fields.stats()
+    DeviceDataController.bulk_update(db, TYPED, [
+        {"created_at": "2024-01-01 10:00:00", "field1": "21.5", "field2": "3", "field3": "on", "field4": "ok"},
+        {"created_at": "2024-01-01 10:01:00", "field1": "nan", "field2": "3.5", "field3": "maybe", "field4": "12"},
+        {"created_at": "2024-01-01 10:02:00", "field1": "-4e1", "field2": "7.0", "field3": "0", "field4": None},
+    ])
+    DeviceDataController.bulk_update(db, UNTYPED, [{"created_at": "2024-01-01 10:00:00", "field1": "21.5"}])
+
+    rows = db.query(DeviceDataNumeric).order_by(DeviceDataNumeric.entryID).all()
+    assert [row.deviceID for row in rows] == [TYPED] * 3
+    assert [(row.field1, row.field2, row.field3, row.field4) for row in rows] == [
+        (21.5, 3.0, 1.0, None), (None, None, None, None), (-40.0, 7.0, 0.0, None)
+    ]
+    assert [row.parse_errors for row in rows] == [0, 3, 0]
+    # Same id as the raw row, so the two can be joined
+    raw = {row.entryID: row.id for row in db.query(DeviceData).filter_by(deviceID=TYPED)}
+    assert all(raw[row.entryID] == row.id for row in rows)
+    # The original text is untouched
+    assert db.query(DeviceData.field1).filter_by(deviceID=TYPED, entryID=rows[1].entryID).scalar() == "nan"
+
+    after = numeric_fields.stats()
+    assert after["rows"] - before["rows"] == 3
+    assert after["values"] - before["values"] == 6
+    assert after["parse_errors"] - before["parse_errors"] == 3
+
+
+def test_changing_field_types_reparses_history(db, profiles):
+    _, untyped = profiles
+    DeviceDataController.bulk_update(db, UNTYPED, [
+        {"created_at": f"2024-01-01 10:0{minute}:00", "field1": value} for minute, value in enumerate(["1", "2.5", "x"])
+    ])
+    assert db.query(DeviceDataNumeric).count() == 0
+
+    result = ProfileController.update_field_types(untyped.id, ProfileFieldTypes(field_types={"field1": "float"}), db, ORG_ID)
+    assert result.field_types == {"field1": "float"}
+    assert [row.field1 for row in db.query(DeviceDataNumeric).order_by(DeviceDataNumeric.entryID)] == [1.0, 2.5, None]
+
+    # New readings follow the new types straight away (the cache entry was dropped on update)
+    DeviceDataController.bulk_update(db, UNTYPED, [{"created_at": "2024-01-01 10:05:00", "field1": "4"}])
+    assert db.query(func.count(DeviceDataNumeric.id)).filter_by(deviceID=UNTYPED).scalar() == 4
+
+    ProfileController.update_field_types(untyped.id, ProfileFieldTypes(), db, ORG_ID)
+    assert db.query(DeviceDataNumeric).filter_by(deviceID=UNTYPED).count() == 0
+    DeviceDataController.bulk_update(db, UNTYPED, [{"created_at": "2024-01-01 10:06:00", "field1": "5"}])
+    assert db.query(DeviceDataNumeric).filter_by(deviceID=UNTYPED).count() == 0
+
+
+def test_field_types_are_validated():
+    with pytest.raises(ValidationError):
+        ProfileFieldTypes(field_types={"field16": "float"})
+    with pytest.raises(ValidationError):
+        ProfileFieldTypes(field_types={"field1": "decimal"})
+    profile = ProfileCreate(name="p", organisation_id=ORG_ID, field_types={"field2": "bool"})
+    assert profile.field_types == {"field2": "bool"}
+
+
+def test_retention_removes_numeric_rows(session_factory, db, profiles):
+    typed, _ = profiles
+    now = datetime(2024, 6, 1)
+    DeviceDataController.bulk_update(db, TYPED, [
+        {"created_at": (now - timedelta(days=day)).isoformat(), "field1": str(day)} for day in range(10)
+    ])
+    typed.data_retention_days = 5
+    db.commit()
+    report = RetentionPurger(session_factory, pause_ms=0).run_once(now=now)
+    assert report["devicedata"]["rows"] == 4
+    assert report["devicedata_numeric"]["rows"] == 4
+    assert db.query(DeviceDataNumeric).count() == 6
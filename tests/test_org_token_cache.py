@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Test the cached org_token -> organisation resolver and organisation -> profiles ownership check
+"""
+
+import uuid
+from typing import NamedTuple
+import pytest
+from sqlalchemy import event
+
+from utils.cache import organisation_cache, ORG_NOTIFY_CHANNEL
+from utils.config_notify import config_notifier
+from controllers.user_org import OrganisationController
+from schemas.user_org import OrganisationUpdate
+from models.user_org import Organisation
+from models.device import Devices
+from models.profile import Profiles
+
+
+@pytest.fixture
+def org(db, add_profile, add_device):
+    org = Organisation(name="acme", description=None, is_active=True, token="TOKEN1")
+    db.add(org)
+    db.commit()
+    profile = add_profile(org.id, field1="pm25")
+    add_device(profile.id, name="sensor", networkID="net-1")
+    organisation_cache.clear()
+    return org
+
+
+def count_statements(engine):
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+    return statements
+
+
+def test_token_lookups_are_cached(engine, db, org):
+    assert OrganisationController.get_organisation_id_by_token(db, "TOKEN1") == str(org.id)
+    assert OrganisationController.get_organisation_id_by_token(db, "BAD") is None
+
+    statements = count_statements(engine)
+    for _ in range(5):
+        assert OrganisationController.get_organisation_id_by_token(db, "TOKEN1") == str(org.id)
+        assert OrganisationController.get_organisation_id_by_token(db, "BAD") is None
+    assert statements == []
+    stats = organisation_cache.stats()
+    assert stats["hits"] >= 5 and stats["negative_hits"] >= 5
+
+
+def test_ownership_check_needs_no_profile_query(engine, db, org):
+    device = db.query(Devices).first()
+    assert OrganisationController.device_belongs_to_organisation(db, device, str(org.id))
+
+    statements = count_statements(engine)
+    assert OrganisationController.device_belongs_to_organisation(db, device, str(org.id))
+    assert statements == []
+    assert not OrganisationController.device_belongs_to_organisation(db, device, str(uuid.uuid4()))
+
+
+def test_new_profile_is_visible(db, org):
+    OrganisationController.device_belongs_to_organisation(db, db.query(Devices).first(), str(org.id))
+    profile = Profiles(organisation_id=org.id, name="water", description=None)
+    db.add(profile)
+    db.commit()
+    assert str(profile.id) in organisation_cache.profile_ids(db, str(org.id))
+
+
+def test_deactivation_and_rotation_invalidate(db, org):
+    assert OrganisationController.get_organisation_id_by_token(db, "TOKEN1") == str(org.id)
+    OrganisationController.update_organisation(org.id, OrganisationUpdate(is_active=False), db)
+    assert OrganisationController.get_organisation_id_by_token(db, "TOKEN1") is None
+
+    OrganisationController.update_organisation(org.id, OrganisationUpdate(is_active=True), db)
+    assert OrganisationController.get_organisation_id_by_token(db, "TOKEN1") == str(org.id)
+    rotated = OrganisationController.rotate_organisation_token(org.id, db)
+    assert OrganisationController.get_organisation_id_by_token(db, "TOKEN1") is None
+    assert OrganisationController.get_organisation_id_by_token(db, rotated.token) == str(org.id)
+
+
+class FakeListenConnection:
+    """Stands in for the psycopg2 connection config_notifier LISTENs on."""
+
+    def __init__(self, notifies):
+        self.driver_connection = self
+        self.notifies = notifies
+
+    def poll(self):
+        pass
+
+
+def test_invalidation_from_another_worker(db, org):
+    """A NOTIFY on ORG_NOTIFY_CHANNEL drops this worker's cached token and profile set"""
+    assert OrganisationController.get_organisation_id_by_token(db, "TOKEN1") == str(org.id)
+    assert OrganisationController.device_belongs_to_organisation(db, db.query(Devices).first(), str(org.id))
+    # Another worker deactivates the organisation: the row changes without this worker's ORM seeing it
+    db.query(Organisation).filter_by(id=org.id).update({"is_active": False})
+    db.commit()
+    assert OrganisationController.get_organisation_id_by_token(db, "TOKEN1") == str(org.id)
+
+    before = organisation_cache.stats()["remote_invalidations"]
+    notification = NamedTuple("Notify", [("channel", str), ("payload", str)])(ORG_NOTIFY_CHANNEL, f"{org.id},TOKEN1")
+    config_notifier._listen_connection = FakeListenConnection([notification])
+    try:
+        config_notifier._on_pg_notify()
+    finally:
+        config_notifier._listen_connection = None
+    assert OrganisationController.get_organisation_id_by_token(db, "TOKEN1") is None
+    assert organisation_cache.stats()["remote_invalidations"] == before + 1 and organisation_cache.stats()["profile_sets"] == 0
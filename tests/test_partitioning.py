@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Test devicedata time partitioning: SQLite period-table emulation, pruned reads
+through source_for_range (including readers with no time window), whole-month
+drops and the PostgreSQL partition DDL
+"""
+
+import uuid
+from datetime import datetime
+import pytest
+from sqlalchemy import event, inspect
+
+from utils import partitioning, rollups
+from utils.device_shadow import last_posted_times, rebuild_shadows
+from utils.entry_id_allocator import EntryIDAllocator
+from controllers.device import DeviceController
+from controllers.device_data import DeviceDataController
+from models.devicedata_value import DeviceData
+from models.devicedata_rollup import DeviceDataRollup1d
+from models.device_entry_sequence import DeviceEntrySequence
+from models.device_shadow import DeviceShadow
+
+ORG_ID = uuid.uuid4()
+NOW = datetime(2024, 4, 15)
+
+
+@pytest.fixture(autouse=True)
+def readings(db, add_profile, add_device):
+    profile = add_profile(ORG_ID, field1="pm25")
+    add_device(profile.id, name="sensor")
+    DeviceDataController.bulk_update(db, 1, [
+        {"created_at": f"2024-{month:02d}-{day:02d} 12:00:00", "field1": str(month * 100 + day)}
+        for month in (1, 2, 3, 4) for day in (1, 10, 20)
+    ])
+
+
+def test_closed_months_are_archived_into_period_tables(engine, db, monkeypatch):
+    monkeypatch.setattr(partitioning, "DEVICEDATA_PARTITIONING", True)
+    archived = partitioning.archive_closed_months(db, live_months=1, now=NOW)
+    db.commit()
+    assert archived == ["devicedata_p202401", "devicedata_p202402", "devicedata_p202403"]
+    assert db.query(DeviceData).count() == 3  # April stays live
+    assert "devicedata_p202402" in inspect(engine).get_table_names()
+
+    # Reads spanning live and archived months still see every row, in entryID order
+    page = DeviceController.get_device_data(db, ORG_ID, 1, limit=100)
+    assert page["columns"]["entryID"] == list(range(1, 13))
+
+
+def test_windowed_reads_touch_only_overlapping_periods(engine, db, monkeypatch):
+    monkeypatch.setattr(partitioning, "DEVICEDATA_PARTITIONING", True)
+    partitioning.archive_closed_months(db, live_months=1, now=NOW)
+    db.commit()
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+    page = DeviceController.get_device_data(db, ORG_ID, 1, start=datetime(2024, 2, 5), end=datetime(2024, 2, 25))
+    assert page["columns"]["field1"] == ["210", "220"]
+    sql = statements[-1]
+    assert "devicedata_p202402" in sql
+    assert "devicedata_p202401" not in sql and "devicedata_p202403" not in sql
+
+    result = DeviceController.aggregate_device_data(db, ORG_ID, 1, "1d", ["count"], None, datetime(2024, 3, 1), datetime(2024, 5, 1))
+    assert result["readings"] == 6
+
+
+def test_every_reader_sees_archived_rows(db, monkeypatch):
+    monkeypatch.setattr(partitioning, "DEVICEDATA_PARTITIONING", True)
+    partitioning.archive_closed_months(db, live_months=1, now=datetime(2024, 6, 15))
+    # Readings and shadow from before the shadow table existed: only the period tables hold them
+    db.query(DeviceShadow).delete()
+    db.query(DeviceEntrySequence).delete()
+    db.query(DeviceDataRollup1d).delete()
+    db.commit()
+    assert db.query(DeviceData).count() == 0
+
+    device = DeviceController.get_device(db, ORG_ID, 1)
+    assert len(device["device_data"]) == 12 and device["device_data"][0]["field1"] == "420"
+    newest = datetime(2024, 4, 20, 12)
+    assert last_posted_times(db, [1]) == {1: newest}
+    assert DeviceController.get_devices(db, ORG_ID)[0]["last_posted_time"] == newest
+
+    rollups.rollup_entries(db, 1, 1, 6)
+    assert sum(row.count for row in db.query(DeviceDataRollup1d)) == 6
+    assert rollups.rebuild_rollups(db) == 12
+    assert sum(row.count for row in db.query(DeviceDataRollup1d)) == 12
+    assert rebuild_shadows(db) == 1 and db.get(DeviceShadow, 1).data_at == newest
+    db.commit()
+
+    # The first reservation after the counter is lost still starts past the archived entryIDs
+    assert EntryIDAllocator(block_size=10).allocate(db, 1) == [13]
+
+
+def test_drop_partitions_before(db, monkeypatch):
+    monkeypatch.setattr(partitioning, "DEVICEDATA_PARTITIONING", True)
+    partitioning.archive_closed_months(db, live_months=1, now=NOW)
+    dropped = partitioning.drop_partitions_before(db, datetime(2024, 3, 10))
+    db.commit()
+    assert dropped == [("devicedata_p202401", 3), ("devicedata_p202402", 3)]
+    assert [name for _, name in partitioning.partitions(db)] == ["devicedata_p202403"]
+
+
+def test_disabled_partitioning_reads_devicedata(db):
+    assert partitioning.source_for_range(db) is DeviceData.__table__
+    assert partitioning.ensure_partitions(db) == []
+
+
+def test_postgres_partition_ddl():
+    assert partitioning.add_months(datetime(2024, 11, 1), 3) == datetime(2025, 2, 1)
+    assert partitioning._create_partition_sql(datetime(2024, 12, 1)) == (
+        'CREATE TABLE IF NOT EXISTS "devicedata_p202412" PARTITION OF devicedata '
+        "FOR VALUES FROM ('2024-12-01') TO ('2025-01-01')"
+    )
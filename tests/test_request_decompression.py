@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Test gzip/deflate request bodies: the decompression middleware (streaming,
+size cap, corrupt and unknown encodings), the incremental JSON array reader
+and batched bulk_update writes
+"""
+
+import gzip
+import io
+import json
+import uuid
+import zlib
+import pytest
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.testclient import TestClient
+
+from utils.request_decompression import RequestDecompressionMiddleware
+from utils.devicedata_loader import iter_json_rows
+from controllers.device_data import DeviceDataController
+from models.devicedata_value import DeviceData
+
+READINGS = [{"created_at": f"2024-01-01 00:{i // 60:02d}:{i % 60:02d}", "field1": str(i), "field2": "21.5"} for i in range(1000)]
+
+
+def make_client(max_size=1024 * 1024):
+    app = FastAPI()
+    app.add_middleware(RequestDecompressionMiddleware, max_size=max_size)
+
+    @app.post("/echo")
+    async def echo(request: Request):
+        chunks = [len(chunk) async for chunk in request.stream()]
+        return {"bytes": sum(chunks), "chunks": len(chunks), "encoding": request.headers.get("content-encoding")}
+
+    return TestClient(app)
+
+
+def test_middleware_inflates_bodies():
+    client = make_client()
+    body = json.dumps(READINGS).encode()
+    for encoding, payload in (
+        ("gzip", gzip.compress(body)),
+        ("deflate", zlib.compress(body)),
+        ("deflate", zlib.compress(body, wbits=-zlib.MAX_WBITS)),
+        (None, body),
+    ):
+        headers = {"Content-Encoding": encoding} if encoding else {}
+        result = client.post("/echo", content=payload, headers=headers).json()
+        assert result["bytes"] == len(body) and result["encoding"] is None
+
+
+def test_middleware_rejects_bad_bodies():
+    client = make_client(max_size=64 * 1024)
+    bomb = gzip.compress(b" " * (10 * 1024 * 1024))
+    assert client.post("/echo", content=bomb, headers={"Content-Encoding": "gzip"}).status_code == 413
+    assert client.post("/echo", content=gzip.compress(b"[]")[:-4], headers={"Content-Encoding": "gzip"}).status_code == 400
+    assert client.post("/echo", content=b"not gzip", headers={"Content-Encoding": "gzip"}).status_code == 400
+    assert client.post("/echo", content=b"[]", headers={"Content-Encoding": "br"}).status_code == 415
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 4096])
+def test_json_rows_across_chunk_boundaries(chunk_size):
+    text = json.dumps(READINGS[:50], indent=1)
+    assert list(iter_json_rows(io.StringIO(text), chunk_size)) == READINGS[:50]
+    assert list(iter_json_rows(io.StringIO(" [ ] "), chunk_size)) == []
+
+
+@pytest.mark.parametrize("text, message", [
+    ("", "empty"),
+    ('{"field1": "1"}', "must be a JSON array"),
+    ('[{"field1": "1"}', "not terminated"),
+    ('[{"field1": "1"},]', "element 1"),
+    ('[{"field1": "1"}, 5]', "Element 1 is not a JSON object"),
+    ('[{"field1": "1"} {}]', "Expected"),
+    ('[{"field1": "1"}] []', "after the JSON array"),
+])
+def test_json_rows_rejects_malformed_arrays(text, message):
+    with pytest.raises(ValueError, match=message):
+        list(iter_json_rows(io.StringIO(text), 4))
+
+
+def test_bulk_update_streams_in_batches(db, add_device):
+    add_device(uuid.uuid4(), name="gateway", networkID="net-1")
+    text = io.StringIO(json.dumps(READINGS))
+    assert DeviceDataController.bulk_update(db, 1, iter_json_rows(text, 256), batch_size=100) == {"message": "success"}
+    rows = db.query(DeviceData).order_by(DeviceData.entryID).all()
+    assert [row.entryID for row in rows] == list(range(1, 1001))
+    assert rows[-1].field1 == "999"
+
+    # A bad reading in a later batch fails the whole upload, with its index in the upload
+    broken = READINGS[:250] + [{"created_at": "yesterday"}]
+    with pytest.raises(HTTPException) as exc:
+        DeviceDataController.bulk_update(db, 1, iter(broken), batch_size=100)
+    assert exc.value.status_code == 400 and "index 250" in exc.value.detail
+    assert db.query(DeviceData).count() == 1000
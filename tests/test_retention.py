@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Test per-profile retention: batched purge of old readings and metadata, config
+history capped at N versions, whole-month drops when partitioned, and the
+rows/bytes report
+"""
+
+import uuid
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import event
+
+from utils import partitioning
+from utils.retention import RetentionPurger
+from utils.device_shadow import latest_config
+from controllers.device_data import DeviceDataController, ConfigValuesController
+from models.profile import Profiles
+from models.devicedata_value import DeviceData
+from models.metadata_value import MetadataValues
+from models.config_value import ConfigValues
+
+NOW = datetime(2024, 6, 1)
+
+
+@pytest.fixture(autouse=True)
+def history(db, add_profile, add_device):
+    org = uuid.uuid4()
+    short = add_profile(org, name="short", field1="pm25", config1="interval",
+                        data_retention_days=30, metadata_retention_days=10, config_history_limit=2)
+    forever = add_profile(org, name="forever", field1="pm25", config1="interval")
+    for device_id, profile in ((1, short), (2, forever)):
+        add_device(profile.id, device_id)
+    for device_id in (1, 2):
+        DeviceDataController.bulk_update(db, device_id, [
+            {"created_at": (NOW - timedelta(days=day)).isoformat(), "field1": str(day)} for day in range(90)
+        ])
+        db.add_all([MetadataValues(NOW - timedelta(days=day), device_id, "3.7", *([None] * 14)) for day in range(20)])
+        db.commit()
+        for version in range(5):
+            ConfigValuesController.update_config_data(db, device_id, {"config1": str(version)})
+
+
+def test_purge_applies_each_profile_policy(session_factory, db):
+    purger = RetentionPurger(session_factory, batch_size=25, pause_ms=0)
+    report = purger.run_once(now=NOW)
+
+    assert report["devicedata"]["rows"] == 59  # days 31..89 of device 1
+    assert report["metadatavalues"]["rows"] == 9
+    assert report["configvalues"]["rows"] == 3
+    assert report["devicedata"]["bytes"] > 0
+    assert db.query(DeviceData).filter_by(deviceID=1).count() == 31
+    assert db.query(DeviceData).filter_by(deviceID=2).count() == 90  # no policy: kept
+    assert db.query(MetadataValues).filter_by(deviceID=1).count() == 11
+    configs = db.query(ConfigValues).filter_by(deviceID=1).order_by(ConfigValues.created_at).all()
+    assert [config.config1 for config in configs] == ["3", "4"]
+    assert latest_config(db, 1).config1 == "4"
+    assert db.query(ConfigValues).filter_by(deviceID=2).count() == 5
+
+    # Nothing left to do on the next run
+    assert purger.run_once(now=NOW)["devicedata"]["rows"] == 0
+
+
+def test_deletes_run_in_bounded_batches(engine, session_factory):
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+    RetentionPurger(session_factory, batch_size=25, pause_ms=0).run_once(now=NOW)
+    deletes = [s for s in statements if s.startswith("DELETE FROM devicedata")]
+    assert len(deletes) == 3  # 25 + 25 + 9
+    assert all("LIMIT" in s for s in deletes)
+
+
+def test_partitioned_data_drops_whole_months(session_factory, db, monkeypatch):
+    monkeypatch.setattr(partitioning, "DEVICEDATA_PARTITIONING", True)
+    db.query(Profiles).update({Profiles.data_retention_days: 30})
+    db.commit()
+    partitioning.archive_closed_months(db, now=NOW)
+    db.commit()
+    report = RetentionPurger(session_factory, batch_size=1000, pause_ms=0).run_once(now=NOW)
+    # Cutoff 2024-05-02: March and April go as whole tables, May 1st row by row
+    assert report["partitions_dropped"] == ["devicedata_p202403", "devicedata_p202404"]
+    assert [name for _, name in partitioning.partitions(db)] == ["devicedata_p202405"]
+    assert report["devicedata"]["rows"] == 118  # days 31..89 of both devices
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Test the UUIDv7 generator and re-keying existing rows to time-ordered ids
+"""
+
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from utils.uuid7 import uuid7, uuid7_at, uuid7_time, rekey
+from utils.device_shadow import latest_config, rebuild_shadows
+from controllers.device_data import DeviceDataController
+from models.devicedata_value import DeviceData
+from models.config_value import ConfigValues
+from models.device_shadow import DeviceShadow
+
+
+def test_uuid7_layout_and_order():
+    ids = [uuid7() for _ in range(10000)]
+    assert all(value.version == 7 and value.variant == uuid.RFC_4122 for value in ids)
+    # Strictly increasing even within one millisecond
+    assert ids == sorted(ids) and len(set(ids)) == len(ids)
+    assert abs(uuid7_time(ids[0]) - datetime.now(timezone.utc)) < timedelta(seconds=5)
+
+
+def test_uuid7_at_follows_created_at():
+    moments = [datetime(2023, 1, 1) + timedelta(minutes=i) for i in range(100)]
+    ids = [uuid7_at(moment) for moment in moments]
+    assert ids == sorted(ids)
+    assert uuid7_time(ids[5]) == moments[5].astimezone(timezone.utc)
+
+
+def test_uuid7_at_reads_naive_times_as_local(monkeypatch):
+    # created_at is written with a naive local datetime.now(); re-keyed ids must line up with uuid7()
+    monkeypatch.setenv("TZ", "America/New_York")
+    time.tzset()
+    try:
+        assert abs(uuid7_time(uuid7_at(datetime.now())) - uuid7_time(uuid7())) < timedelta(seconds=5)
+    finally:
+        monkeypatch.undo()
+        time.tzset()
+
+
+def test_models_default_to_uuid7(db, add_device):
+    add_device(uuid.uuid4())
+    DeviceDataController.bulk_update(db, 1, [{"created_at": "2024-01-01 00:00:00", "field1": "1"}] * 3)
+    ids = [row.id for row in db.query(DeviceData).order_by(DeviceData.entryID)]
+    assert all(value.version == 7 for value in ids) and ids == sorted(ids)
+
+
+def test_rekey_moves_history_and_shadow_references(db, add_device):
+    add_device(uuid.uuid4())
+    start = datetime(2023, 6, 1)
+    # Rows written before UUIDv7 ids: random uuid4 keys
+    for i in range(7):
+        config = ConfigValues(start + timedelta(hours=i), 1, str(i), *([None] * 9))
+        config.id = uuid.uuid4()
+        db.add(config)
+    db.commit()
+    rebuild_shadows(db)
+    db.commit()
+
+    assert rekey(db, ConfigValues.__table__, batch_size=3, references=[(DeviceShadow.__table__, 'config_id')]) == 7
+    db.commit()
+    db.expire_all()
+    rows = db.query(ConfigValues).order_by(ConfigValues.id).all()
+    assert all(row.id.version == 7 for row in rows)
+    assert [row.config1 for row in rows] == [str(i) for i in range(7)]  # id order is now time order
+    assert latest_config(db, 1).config1 == "6"
+    assert db.query(DeviceShadow).one().config_id == rows[-1].id
+    # Already re-keyed rows are left alone
+    assert rekey(db, ConfigValues.__table__) == 0
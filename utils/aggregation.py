@@ -0,0 +1,161 @@
+"""
+Bucketed statistics over device readings, computed with NumPy.
+
+Readings are stored as strings, so a window is streamed from the database in
+chunks and each chunk is coerced to float64 (missing values become NaN and
+text that is not a finite number is counted, not guessed at). Each statistic is then
+computed for every bucket at once:
+count/sum/min/max/mean/std via ufunc.reduceat over bucket boundaries, and
+percentiles by sorting on (bucket, value) and interpolating in each run.
+"""
+
+import os
+import re
+import numpy as np
+from sqlalchemy import select
+from utils.export_stream import stream_partitions
+from utils.partitioning import source_for_range
+
+AGGREGATE_CHUNK_SIZE = int(os.getenv("AGGREGATE_CHUNK_SIZE", "20000"))
+AGGREGATE_MAX_BUCKETS = int(os.getenv("AGGREGATE_MAX_BUCKETS", "10000"))
+
+BUCKET_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+BASIC_STATS = ('count', 'sum', 'min', 'max', 'mean', 'std')
+_BUCKET_RE = re.compile(r'^(\d+)([smhd])$')
+_PERCENTILE_RE = re.compile(r'^p(\d{1,2}(?:\.\d+)?|100)$')
+
+
+def parse_bucket(bucket: str) -> int:
+    """'15m' -> 900. Raises ValueError for anything else."""
+    match = _BUCKET_RE.match(bucket or '')
+    if not match or int(match.group(1)) == 0:
+        raise ValueError(f"Invalid bucket '{bucket}', expected e.g. 30s, 15m, 1h, 1d")
+    return int(match.group(1)) * BUCKET_UNITS[match.group(2)]
+
+
+def parse_stats(stats: list) -> list:
+    """Validate stat names: count, sum, min, max, mean, std, median and pNN percentiles."""
+    for stat in stats:
+        if stat not in BASIC_STATS and stat != 'median' and not _PERCENTILE_RE.match(stat):
+            raise ValueError(f"Unknown stat '{stat}', expected {', '.join(BASIC_STATS)}, median or pNN")
+    return stats
+
+
+def to_float(values: list):
+    """
+    Coerce strings to float64; returns (array, unparseable count). None and '' become NaN;
+    text that is not a finite number ('abc', 'inf', '1e999', 'nan') becomes NaN and is counted.
+    """
+    cleaned = ['nan' if value is None or value == '' else value for value in values]
+    try:
+        result = np.asarray(cleaned, dtype=np.float64)
+    except ValueError:
+        pass
+    else:
+        non_finite = ~np.isfinite(result)
+        if not non_finite.any():
+            return result, 0
+        non_finite &= np.fromiter((value is not None and value != '' for value in values), dtype=bool, count=len(values))
+        result[non_finite] = np.nan
+        return result, int(non_finite.sum())
+    result = np.empty(len(values), dtype=np.float64)
+    errors = 0
+    for index, value in enumerate(values):
+        if value is None or value == '':
+            result[index] = np.nan
+            continue
+        try:
+            number = float(value)
+        except (TypeError, ValueError):
+            number = np.nan
+        if not np.isfinite(number):
+            number = np.nan
+            errors += 1
+        result[index] = number
+    return result, errors
+
+
+def load_window(db, deviceID: int, fields: list, start=None, end=None, chunk_size: int = AGGREGATE_CHUNK_SIZE):
+    """Read a device's readings into (epoch seconds int64, {field: float64 array}, {field: unparseable count})."""
+    source = source_for_range(db, start, end)
+    statement = select(source.c.created_at, *[source.c[field] for field in fields]).where(
+        source.c.deviceID == deviceID,
+        source.c.created_at.isnot(None)
+    )
+    if start is not None:
+        statement = statement.where(source.c.created_at >= start)
+    if end is not None:
+        statement = statement.where(source.c.created_at < end)
+
+    times, columns = [], {field: [] for field in fields}
+    errors = {field: 0 for field in fields}
+    for partition in stream_partitions(db, statement, chunk_size):
+        chunk = list(zip(*partition))
+        times.append(np.asarray(chunk[0], dtype='datetime64[s]').astype(np.int64))
+        for field, values in zip(fields, chunk[1:]):
+            array, failed = to_float(values)
+            columns[field].append(array)
+            errors[field] += failed
+
+    if not times:
+        return np.empty(0, dtype=np.int64), {field: np.empty(0) for field in fields}, errors
+    return np.concatenate(times), {field: np.concatenate(parts) for field, parts in columns.items()}, errors
+
+
+def _percentile(sorted_values, starts, counts, q: float):
+    """Linear-interpolated percentile of each run sorted_values[starts[i]:starts[i]+counts[i]]."""
+    position = (counts - 1) * (q / 100.0)
+    lower = np.floor(position).astype(np.int64)
+    upper = np.minimum(lower + 1, counts - 1)
+    fraction = position - lower
+    return sorted_values[starts + lower] * (1 - fraction) + sorted_values[starts + upper] * fraction
+
+
+def bucket_stats(bucket_ids, values, stats: list) -> dict:
+    """Per-bucket statistics for one field; returns (unique bucket ids, {stat: array}). NaNs are ignored."""
+    valid = ~np.isnan(values)
+    bucket_ids, values = bucket_ids[valid], values[valid]
+    if not len(values):
+        return bucket_ids, {stat: values for stat in stats}
+    order = np.lexsort((values, bucket_ids))
+    bucket_ids, values = bucket_ids[order], values[order]
+    buckets, starts, counts = np.unique(bucket_ids, return_index=True, return_counts=True)
+
+    sums = np.add.reduceat(values, starts)
+    means = sums / counts
+    result = {}
+    for stat in stats:
+        if stat == 'count':
+            result[stat] = counts
+        elif stat == 'sum':
+            result[stat] = sums
+        elif stat == 'mean':
+            result[stat] = means
+        elif stat == 'min':
+            result[stat] = values[starts]
+        elif stat == 'max':
+            result[stat] = values[starts + counts - 1]
+        elif stat == 'std':
+            deviations = values - np.repeat(means, counts)
+            result[stat] = np.sqrt(np.add.reduceat(deviations * deviations, starts) / counts)
+        else:
+            result[stat] = _percentile(values, starts, counts, 50.0 if stat == 'median' else float(stat[1:]))
+    return buckets, result
+
+
+def aggregate(times, columns: dict, bucket_seconds: int, stats: list) -> dict:
+    """Bucket epoch-second timestamps and compute stats per field, aligned on the union of non-empty buckets."""
+    bucket_ids = times // bucket_seconds
+    all_buckets = np.unique(bucket_ids)
+    fields = {}
+    for field, values in columns.items():
+        buckets, result = bucket_stats(bucket_ids, values, stats)
+        slots = np.searchsorted(all_buckets, buckets)
+        fields[field] = {}
+        for stat, array in result.items():
+            aligned = np.full(len(all_buckets), np.nan)
+            aligned[slots] = array
+            fields[field][stat] = [None if value != value else value for value in aligned.tolist()]
+        if 'count' in result:
+            fields[field]['count'] = [int(value or 0) for value in fields[field]['count']]
+    return {'bucket_start': (all_buckets * bucket_seconds).astype('datetime64[s]').astype(object).tolist(), 'fields': fields}
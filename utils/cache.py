@@ -0,0 +1,396 @@
+"""
+In-process caches for lookups made on every device request.
+
+Each worker process keeps its own copy. Entries are invalidated as soon as the
+underlying rows are changed through the ORM in this process, and expire after
+DEVICE_CACHE_TTL seconds so changes made by other workers are picked up too.
+Organisation changes (deactivation, token rotation) are also broadcast to every
+worker on PostgreSQL through LISTEN/NOTIFY on ORG_NOTIFY_CHANNEL; ORG_CACHE_TTL
+bounds how long a worker that missed one keeps a stale token.
+"""
+
+import os
+import threading
+import uuid
+from typing import NamedTuple, Optional
+from cachetools import LRUCache, TTLCache
+from sqlalchemy import event, inspect, text
+from models.device import Devices
+from models.profile import Profiles
+from models.user_org import Organisation
+from models.firmware import Firmware
+from utils.config_notify import config_notifier
+
+DEVICE_CACHE_TTL = int(os.getenv("DEVICE_CACHE_TTL", "60"))
+DEVICE_CACHE_SIZE = int(os.getenv("DEVICE_CACHE_SIZE", "10000"))
+ORG_CACHE_TTL = int(os.getenv("ORG_CACHE_TTL", "60"))
+ORG_NEGATIVE_CACHE_TTL = int(os.getenv("ORG_NEGATIVE_CACHE_TTL", "30"))
+ORG_CACHE_SIZE = int(os.getenv("ORG_CACHE_SIZE", "1000"))
+ORG_NOTIFY_CHANNEL = os.getenv("ORG_NOTIFY_CHANNEL", "organisation_cache")
+FIRMWARE_CACHE_SIZE = int(os.getenv("FIRMWARE_CACHE_SIZE", "1000"))
+
+
+def build_mask(labels) -> int:
+    """Bit i is set when slot i+1 (field1, metadata1, ...) has a label in the profile."""
+    mask = 0
+    for index, label in enumerate(labels):
+        if label:
+            mask |= 1 << index
+    return mask
+
+
+def apply_mask(values: dict, prefix: str, mask: int, count: int = 15) -> dict:
+    """Return {prefix1..prefixN: value} keeping only slots enabled in `mask`."""
+    return {
+        f'{prefix}{i}': values.get(f'{prefix}{i}') if mask & (1 << (i - 1)) else None
+        for i in range(1, count + 1)
+    }
+
+
+class DeviceKey(NamedTuple):
+    deviceID: int
+    profile_id: uuid.UUID
+    field_mask: int
+    metadata_mask: int
+
+
+class DeviceKeyCache:
+    """writekey -> DeviceKey (deviceID, profile and enabled field/metadata masks)."""
+
+    def __init__(self, maxsize: int = DEVICE_CACHE_SIZE, ttl: int = DEVICE_CACHE_TTL):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, db, writekey: str) -> Optional[DeviceKey]:
+        with self._lock:
+            entry = self._cache.get(writekey)
+            if entry is not None:
+                self.hits += 1
+                return entry
+            self.misses += 1
+
+        columns = [getattr(Profiles, f'field{i}') for i in range(1, 16)]
+        columns += [getattr(Profiles, f'metadata{i}') for i in range(1, 16)]
+        row = (
+            db.query(Devices.deviceID, Devices.profile, *columns)
+            .outerjoin(Profiles, Profiles.id == Devices.profile)
+            .filter(Devices.writekey == writekey)
+            .first()
+        )
+        if row is None:
+            return None
+        entry = DeviceKey(
+            deviceID=row[0],
+            profile_id=row[1],
+            field_mask=build_mask(row[2:17]),
+            metadata_mask=build_mask(row[17:32]),
+        )
+        with self._lock:
+            self._cache[writekey] = entry
+        return entry
+
+    def invalidate_writekey(self, writekey: str):
+        with self._lock:
+            self._cache.pop(writekey, None)
+
+    def invalidate_profile(self, profile_id):
+        with self._lock:
+            for writekey in [k for k, v in self._cache.items() if v.profile_id == profile_id]:
+                self._cache.pop(writekey, None)
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"size": len(self._cache), "hits": self.hits, "misses": self.misses}
+
+
+class OrganisationCache:
+    """
+    org_token -> organisation id for active organisations (unknown or inactive
+    tokens are cached too, for a shorter time), and organisation id -> ids of
+    its profiles for device ownership checks.
+    """
+
+    def __init__(self, maxsize: int = ORG_CACHE_SIZE, ttl: int = ORG_CACHE_TTL, negative_ttl: int = ORG_NEGATIVE_CACHE_TTL):
+        self._tokens = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._bad_tokens = TTLCache(maxsize=maxsize, ttl=negative_ttl)
+        self._profiles = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.negative_hits = 0
+        self.profile_hits = 0
+        self.profile_misses = 0
+        self.remote_invalidations = 0
+
+    def resolve(self, db, org_token: str) -> Optional[str]:
+        with self._lock:
+            organisation_id = self._tokens.get(org_token)
+            if organisation_id is not None:
+                self.hits += 1
+                return organisation_id
+            if org_token in self._bad_tokens:
+                self.negative_hits += 1
+                return None
+            self.misses += 1
+
+        org_id = db.query(Organisation.id).filter(
+            Organisation.token == org_token, Organisation.is_active == True
+        ).scalar()
+        with self._lock:
+            if org_id is None:
+                self._bad_tokens[org_token] = True
+                return None
+            self._tokens[org_token] = str(org_id)
+        return str(org_id)
+
+    def profile_ids(self, db, organisation_id) -> frozenset:
+        """String ids of every profile owned by the organisation."""
+        key = str(organisation_id)
+        with self._lock:
+            ids = self._profiles.get(key)
+            if ids is not None:
+                self.profile_hits += 1
+                return ids
+            self.profile_misses += 1
+
+        org_uuid = organisation_id if isinstance(organisation_id, uuid.UUID) else uuid.UUID(key)
+        ids = frozenset(str(pid) for (pid,) in db.query(Profiles.id).filter(Profiles.organisation_id == org_uuid))
+        with self._lock:
+            self._profiles[key] = ids
+        return ids
+
+    def owns_profile(self, db, organisation_id, profile_id) -> bool:
+        return profile_id is not None and str(profile_id) in self.profile_ids(db, organisation_id)
+
+    def invalidate_organisation(self, organisation_id):
+        """Forget every token resolving to the organisation and its profile set."""
+        key = str(organisation_id)
+        with self._lock:
+            for token in [t for t, org in self._tokens.items() if org == key]:
+                self._tokens.pop(token, None)
+            self._profiles.pop(key, None)
+
+    def invalidate_token(self, org_token: str):
+        with self._lock:
+            self._tokens.pop(org_token, None)
+            self._bad_tokens.pop(org_token, None)
+
+    def invalidate_profiles(self, organisation_id):
+        with self._lock:
+            self._profiles.pop(str(organisation_id), None)
+
+    def publish_invalidation(self, db, organisation_id, tokens):
+        """
+        Tell every worker to drop the organisation and `tokens` once db commits (PostgreSQL
+        only: a pg_notify queued in the same transaction). The caller still invalidates this
+        worker's entries itself after the commit.
+        """
+        if db.get_bind().dialect.name != "postgresql":
+            return
+        payload = ",".join([str(organisation_id), *(token for token in tokens if token)])
+        db.execute(text("SELECT pg_notify(:channel, :payload)"), {"channel": ORG_NOTIFY_CHANNEL, "payload": payload})
+
+    def apply_invalidation(self, payload: str):
+        """Handle a publish_invalidation() payload from any worker: 'organisation_id,token,...'."""
+        organisation_id, *tokens = payload.split(",")
+        self.invalidate_organisation(organisation_id)
+        for token in tokens:
+            self.invalidate_token(token)
+        with self._lock:
+            self.remote_invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._tokens.clear()
+            self._bad_tokens.clear()
+            self._profiles.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "tokens": len(self._tokens),
+                "bad_tokens": len(self._bad_tokens),
+                "hits": self.hits,
+                "misses": self.misses,
+                "negative_hits": self.negative_hits,
+                "profile_sets": len(self._profiles),
+                "profile_hits": self.profile_hits,
+                "profile_misses": self.profile_misses,
+                "remote_invalidations": self.remote_invalidations,
+            }
+
+
+class FirmwareDescriptor(NamedTuple):
+    version: str
+    crc32: Optional[str]
+    firmware_bin_size: Optional[int]
+
+
+class FirmwareDescriptorCache:
+    """
+    firmware id -> FirmwareDescriptor for device status responses.
+
+    The version, checksum and size of an uploaded firmware never change, so
+    entries are only evicted by size or explicit invalidation, not by TTL.
+    """
+
+    def __init__(self, maxsize: int = FIRMWARE_CACHE_SIZE):
+        self._cache = LRUCache(maxsize=maxsize)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, db, firmware_id) -> Optional[FirmwareDescriptor]:
+        if not firmware_id:
+            return None
+        key = str(firmware_id)
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None:
+                self.hits += 1
+                return entry
+            self.misses += 1
+
+        firmware_uuid = firmware_id if isinstance(firmware_id, uuid.UUID) else uuid.UUID(key)
+        row = (
+            db.query(Firmware.firmware_version, Firmware.crc32, Firmware.firmware_bin_size)
+            .filter(Firmware.id == firmware_uuid)
+            .first()
+        )
+        if row is None:
+            return None
+        entry = FirmwareDescriptor(*row)
+        with self._lock:
+            self._cache[key] = entry
+        return entry
+
+    def prime(self, db, firmware_ids):
+        """Load descriptors for every firmware id not cached yet with a single query."""
+        with self._lock:
+            missing = {str(firmware_id) for firmware_id in firmware_ids if firmware_id} - set(self._cache.keys())
+        if not missing:
+            return
+        rows = (
+            db.query(Firmware.id, Firmware.firmware_version, Firmware.crc32, Firmware.firmware_bin_size)
+            .filter(Firmware.id.in_([uuid.UUID(firmware_id) for firmware_id in missing]))
+            .all()
+        )
+        with self._lock:
+            for firmware_id, *descriptor in rows:
+                self._cache[str(firmware_id)] = FirmwareDescriptor(*descriptor)
+
+    def invalidate(self, firmware_id):
+        with self._lock:
+            self._cache.pop(str(firmware_id), None)
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"size": len(self._cache), "hits": self.hits, "misses": self.misses}
+
+
+class FieldTypeCache:
+    """
+    deviceID -> (profile id, tuple of the 15 declared field types or None per
+    slot), read on every reading write to decide what goes to devicedata_numeric.
+    """
+
+    def __init__(self, maxsize: int = DEVICE_CACHE_SIZE, ttl: int = DEVICE_CACHE_TTL):
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, db, device_ids) -> dict:
+        """deviceID -> field type tuple for every known device, loading the uncached ones with a single query."""
+        found, missing = {}, []
+        with self._lock:
+            for deviceID in set(device_ids):
+                entry = self._cache.get(deviceID)
+                if entry is not None:
+                    self.hits += 1
+                    found[deviceID] = entry[1]
+                else:
+                    self.misses += 1
+                    missing.append(deviceID)
+        if not missing:
+            return found
+
+        rows = (
+            db.query(Devices.deviceID, Devices.profile, Profiles.field_types)
+            .outerjoin(Profiles, Profiles.id == Devices.profile)
+            .filter(Devices.deviceID.in_(missing))
+            .all()
+        )
+        with self._lock:
+            for deviceID, profile_id, field_types in rows:
+                types = tuple((field_types or {}).get(f'field{i}') for i in range(1, 16))
+                self._cache[deviceID] = (profile_id, types)
+                found[deviceID] = types
+        return found
+
+    def invalidate_device(self, deviceID):
+        with self._lock:
+            self._cache.pop(deviceID, None)
+
+    def invalidate_profile(self, profile_id):
+        with self._lock:
+            for deviceID in [k for k, v in self._cache.items() if v[0] == profile_id]:
+                self._cache.pop(deviceID, None)
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"size": len(self._cache), "hits": self.hits, "misses": self.misses}
+
+
+device_key_cache = DeviceKeyCache()
+organisation_cache = OrganisationCache()
+firmware_descriptor_cache = FirmwareDescriptorCache()
+field_type_cache = FieldTypeCache()
+config_notifier.on_notify(ORG_NOTIFY_CHANNEL, organisation_cache.apply_invalidation)
+
+
+@event.listens_for(Devices, "after_update")
+@event.listens_for(Devices, "after_delete")
+def _invalidate_device(mapper, connection, target):
+    # Drop both the current and, if it was just changed, the previous writekey
+    history = inspect(target).attrs.writekey.history
+    for writekey in [target.writekey, *(history.deleted or ())]:
+        if writekey:
+            device_key_cache.invalidate_writekey(writekey)
+    field_type_cache.invalidate_device(target.deviceID)
+
+
+@event.listens_for(Profiles, "after_update")
+@event.listens_for(Profiles, "after_delete")
+def _invalidate_profile(mapper, connection, target):
+    device_key_cache.invalidate_profile(target.id)
+    field_type_cache.invalidate_profile(target.id)
+    _invalidate_profile_owner(mapper, connection, target)
+
+
+@event.listens_for(Profiles, "after_insert")
+def _invalidate_profile_owner(mapper, connection, target):
+    history = inspect(target).attrs.organisation_id.history
+    for organisation_id in [target.organisation_id, *(history.deleted or ())]:
+        if organisation_id:
+            organisation_cache.invalidate_profiles(organisation_id)
+
+
+@event.listens_for(Firmware, "after_update")
+@event.listens_for(Firmware, "after_delete")
+def _invalidate_firmware(mapper, connection, target):
+    firmware_descriptor_cache.invalidate(target.id)
@@ -0,0 +1,177 @@
+"""
+Config change notifications for long-polling devices (GET /config_update?wait=N).
+
+A request that finds nothing new parks on an asyncio.Event keyed by its
+deviceID. Controllers that write a new config row call
+config_notifier.publish(db, device_ids) before committing:
+
+- waiters in this process are woken once the session commits (nothing is
+  sent if it rolls back);
+- on PostgreSQL a pg_notify on CONFIG_NOTIFY_CHANNEL is queued in the same
+  transaction, so every worker LISTENing on the channel wakes its own waiters
+  when the commit lands.
+
+On other backends only the in-process path exists: a waiter parked in another
+worker simply times out and sees the change on its next poll.
+
+The same LISTEN connection serves other cross-worker notifications: modules
+register a handler for their own channel with on_notify() (utils/cache.py uses
+it to drop organisation cache entries in every worker).
+"""
+
+import asyncio
+import os
+from contextlib import contextmanager
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+
+CONFIG_NOTIFY_CHANNEL = os.getenv("CONFIG_NOTIFY_CHANNEL", "config_updates")
+CONFIG_WAIT_MAX = int(os.getenv("CONFIG_WAIT_MAX", "120"))
+# pg_notify payloads are limited to 8000 bytes
+_PAYLOAD_LIMIT = 7900
+_SESSION_KEY = "config_notify_devices"
+
+
+class ConfigNotifier:
+    def __init__(self, channel: str = CONFIG_NOTIFY_CHANNEL):
+        self.channel = channel
+        self._loop = None
+        self._events = {}
+        self._listen_connection = None
+        # Extra channel -> handler(payload), called on the event loop thread
+        self._handlers = {}
+        self._metrics = {"published": 0, "woken": 0, "remote_notifications": 0}
+
+    def on_notify(self, channel: str, handler):
+        """LISTEN on `channel` too (from the next start()) and pass each payload to handler."""
+        self._handlers[channel] = handler
+
+    @contextmanager
+    def subscribe(self, device_id: int):
+        """Register interest in a device's config; yields an asyncio.Event set on the next change.
+        Must be used on the event loop thread."""
+        if self._loop is None:
+            self._loop = asyncio.get_running_loop()
+        entry = self._events.get(device_id)
+        if entry is None:
+            entry = self._events[device_id] = [asyncio.Event(), 0]
+        entry[1] += 1
+        try:
+            yield entry[0]
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0 and self._events.get(device_id) is entry:
+                del self._events[device_id]
+
+    def publish(self, db, device_ids):
+        """Announce new config rows for device_ids; delivered when db commits."""
+        device_ids = [int(device_id) for device_id in device_ids]
+        if not device_ids:
+            return
+        # Begin the session transaction now so a rollback reliably discards the announcement
+        connection = db.connection()
+        db.info.setdefault(_SESSION_KEY, set()).update(device_ids)
+        if connection.dialect.name == "postgresql":
+            for payload in _payloads(device_ids):
+                db.execute(text("SELECT pg_notify(:channel, :payload)"), {"channel": self.channel, "payload": payload})
+
+    def _notify_local(self, device_ids):
+        self._metrics["published"] += len(device_ids)
+        if self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._wake, device_ids)
+
+    def _wake(self, device_ids):
+        for device_id in device_ids:
+            entry = self._events.pop(device_id, None)
+            if entry is not None:
+                self._metrics["woken"] += entry[1]
+                entry[0].set()
+
+    async def start(self, engine):
+        """Remember the event loop and, on PostgreSQL, LISTEN for changes made by other workers."""
+        self._loop = asyncio.get_running_loop()
+        if engine.dialect.name != "postgresql":
+            return
+        try:
+            connection = engine.raw_connection()
+            connection.driver_connection.autocommit = True
+            with connection.driver_connection.cursor() as cursor:
+                for channel in [self.channel, *self._handlers]:
+                    cursor.execute(f'LISTEN "{channel}"')
+            self._listen_connection = connection
+            self._loop.add_reader(connection.driver_connection.fileno(), self._on_pg_notify)
+            print(f"✅ Listening for config changes on '{self.channel}'")
+        except Exception as e:
+            print(f"⚠️ Config LISTEN unavailable, only this worker's changes wake long-polls: {e}")
+            self._close_listener()
+
+    async def stop(self):
+        self._close_listener()
+        # Release anyone still parked so shutdown does not wait out their timeouts
+        self._wake(list(self._events))
+        self._loop = None
+
+    def _on_pg_notify(self):
+        driver_connection = self._listen_connection.driver_connection
+        try:
+            driver_connection.poll()
+        except Exception as e:
+            print(f"⚠️ Config LISTEN connection lost: {e}")
+            self._close_listener()
+            return
+        while driver_connection.notifies:
+            notification = driver_connection.notifies.pop(0)
+            self._metrics["remote_notifications"] += 1
+            handler = self._handlers.get(notification.channel)
+            if handler is not None:
+                try:
+                    handler(notification.payload)
+                except Exception as e:
+                    print(f"⚠️ Handling a notification on '{notification.channel}' failed: {e}")
+                continue
+            self._wake([int(device_id) for device_id in notification.payload.split(",") if device_id])
+
+    def _close_listener(self):
+        connection, self._listen_connection = self._listen_connection, None
+        if connection is None:
+            return
+        try:
+            self._loop.remove_reader(connection.driver_connection.fileno())
+        except Exception:
+            pass
+        connection.invalidate()
+
+    def stats(self) -> dict:
+        return {
+            "listening": self._listen_connection is not None,
+            "waiting_devices": len(self._events),
+            "waiters": sum(entry[1] for entry in self._events.values()),
+            **self._metrics,
+        }
+
+
+def _payloads(device_ids):
+    payload = ""
+    for device_id in device_ids:
+        piece = str(device_id)
+        if payload and len(payload) + len(piece) + 1 > _PAYLOAD_LIMIT:
+            yield payload
+            payload = ""
+        payload = f"{payload},{piece}" if payload else piece
+    if payload:
+        yield payload
+
+
+config_notifier = ConfigNotifier()
+
+
+@event.listens_for(Session, "after_commit")
+def _deliver_config_notifications(session):
+    device_ids = session.info.pop(_SESSION_KEY, None)
+    if device_ids:
+        config_notifier._notify_local(sorted(device_ids))
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _discard_config_notifications(session, previous_transaction):
+    session.info.pop(_SESSION_KEY, None)
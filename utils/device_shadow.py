@@ -0,0 +1,213 @@
+"""
+Maintenance and reads of the device_shadow table (models/device_shadow.py).
+
+Writers call record_data / record_metadata / record_configs in the same
+transaction as the rows they insert; each is a single INSERT ... ON CONFLICT
+DO UPDATE for the whole batch. Readings and metadata only replace the shadow
+when they are at least as new as what it holds, so backfilled history never
+hides a newer value.
+"""
+
+from sqlalchemy import case, func, or_, select
+from models.config_value import ConfigValues
+from models.devicedata_value import DeviceData
+from models.metadata_value import MetadataValues
+from models.device_shadow import DeviceShadow
+from utils.partitioning import source_for_range
+from utils.upsert import upsert
+
+shadow = DeviceShadow.__table__
+
+
+def _upsert(db, rows: list, update_columns, newer_than=None):
+    """Insert-or-update shadow rows; `update_columns` maps column -> expression built from `excluded`."""
+    where = None
+    if newer_than is not None:
+        def where(excluded):
+            return or_(shadow.c[newer_than].is_(None), shadow.c[newer_than] <= excluded[newer_than])
+    upsert(db, shadow, rows, [shadow.c.deviceID], update_columns, where)
+
+
+def _last_seen(excluded):
+    return case((shadow.c.last_seen > excluded.last_seen, shadow.c.last_seen), else_=excluded.last_seen)
+
+
+def _values(row: dict, prefix: str, count: int) -> dict:
+    return {f'{prefix}{i}': row[f'{prefix}{i}'] for i in range(1, count + 1) if row.get(f'{prefix}{i}') is not None}
+
+
+def _newest_per_device(rows: list) -> list:
+    newest = {}
+    for row in rows:
+        current = newest.get(row['deviceID'])
+        if current is None or (row['created_at'], row.get('entryID') or 0) >= (current['created_at'], current.get('entryID') or 0):
+            newest[row['deviceID']] = row
+    return list(newest.values())
+
+
+def record_data(db, rows: list):
+    """Point each device's shadow at its newest reading among `rows` (devicedata insert dicts)."""
+    if not rows:
+        return
+    _upsert(db, [
+        {
+            'deviceID': row['deviceID'],
+            'data': _values(row, 'field', 15),
+            'data_at': row['created_at'],
+            'last_entry_id': row['entryID'],
+            'last_seen': row['created_at'],
+            'config_version': 0,
+        }
+        for row in _newest_per_device(rows)
+    ], lambda excluded: {
+        'data': excluded.data,
+        'data_at': excluded.data_at,
+        'last_entry_id': excluded.last_entry_id,
+        'last_seen': _last_seen(excluded),
+    }, newer_than='data_at')
+
+
+def record_metadata(db, rows: list):
+    """Same as record_data for metadatavalues insert dicts (deviceID, created_at, metadata1..15)."""
+    if not rows:
+        return
+    _upsert(db, [
+        {
+            'deviceID': row['deviceID'],
+            'meta': _values(row, 'metadata', 15),
+            'meta_at': row['created_at'],
+            'last_seen': row['created_at'],
+            'config_version': 0,
+        }
+        for row in _newest_per_device(rows)
+    ], lambda excluded: {
+        'meta': excluded.meta,
+        'meta_at': excluded.meta_at,
+        'last_seen': _last_seen(excluded),
+    }, newer_than='meta_at')
+
+
+def record_configs(db, rows: list):
+    """Make each configvalues row (dicts with id, deviceID, created_at, config1..10) its device's latest config."""
+    if not rows:
+        return
+    _upsert(db, [
+        {
+            'deviceID': row['deviceID'],
+            'config_id': row['id'],
+            'config': _values(row, 'config', 10),
+            'config_at': row['created_at'],
+            'config_version': 1,
+        }
+        for row in rows
+    ], lambda excluded: {
+        'config_id': excluded.config_id,
+        'config': excluded.config,
+        'config_at': excluded.config_at,
+        'config_version': shadow.c.config_version + 1,
+    })
+
+
+def config_row(config: ConfigValues) -> dict:
+    """Insert-style dict for an ORM ConfigValues row (flushed, so it has an id)."""
+    return _row(config, 'config', 10, id=config.id)
+
+
+def _row(entry, prefix: str, count: int, **extra) -> dict:
+    row = {'deviceID': entry.deviceID, 'created_at': entry.created_at, **extra}
+    for i in range(1, count + 1):
+        row[f'{prefix}{i}'] = getattr(entry, f'{prefix}{i}')
+    return row
+
+
+def latest_configs(db, device_ids) -> dict:
+    """deviceID -> latest ConfigValues row for each device that has one."""
+    device_ids = list(device_ids)
+    if not device_ids:
+        return {}
+    configs = {
+        config.deviceID: config
+        for config in db.query(ConfigValues)
+        .join(DeviceShadow, DeviceShadow.config_id == ConfigValues.id)
+        .filter(DeviceShadow.deviceID.in_(device_ids))
+    }
+    missing = [device_id for device_id in device_ids if device_id not in configs]
+    if missing:
+        # No config recorded in the shadow: either none exists or it predates the shadow table
+        configs.update(_ranked_latest(db, ConfigValues, missing))
+    return configs
+
+
+def latest_config(db, deviceID: int):
+    """The device's latest ConfigValues row, or None."""
+    return latest_configs(db, [deviceID]).get(deviceID)
+
+
+def get_shadows(db, device_ids) -> dict:
+    """deviceID -> DeviceShadow for the given devices."""
+    device_ids = list(device_ids)
+    if not device_ids:
+        return {}
+    return {row.deviceID: row for row in db.query(DeviceShadow).filter(DeviceShadow.deviceID.in_(device_ids))}
+
+
+def last_posted_times(db, device_ids) -> dict:
+    """deviceID -> created_at of the device's newest reading."""
+    times = {deviceID: row.data_at for deviceID, row in get_shadows(db, device_ids).items() if row.data_at}
+    missing = [device_id for device_id in device_ids if device_id not in times]
+    if missing:
+        # Devices whose readings predate the shadow table
+        source = source_for_range(db)
+        times.update(db.execute(
+            select(source.c.deviceID, func.max(source.c.created_at))
+            .where(source.c.deviceID.in_(missing))
+            .group_by(source.c.deviceID)
+        ).all())
+    return times
+
+
+def _ranked_latest(db, model, device_ids=None) -> dict:
+    """deviceID -> newest `model` row per device using ROW_NUMBER() (all devices when device_ids is None)."""
+    order_by = [model.created_at.desc()]
+    if model is DeviceData:
+        order_by.append(DeviceData.entryID.desc())
+    ranked = db.query(
+        model.id,
+        func.row_number().over(partition_by=model.deviceID, order_by=order_by).label("rank")
+    )
+    if device_ids is not None:
+        ranked = ranked.filter(model.deviceID.in_(device_ids))
+    ranked = ranked.subquery()
+    latest = db.query(model).join(ranked, ranked.c.id == model.id).filter(ranked.c.rank == 1)
+    return {entry.deviceID: entry for entry in latest}
+
+
+def _latest_rows(db, table, device_ids=None) -> list:
+    """Newest row per device as dicts, selecting only `table`'s own columns (Core, so table snapshots work)."""
+    order_by = [table.c.created_at.desc()]
+    if 'entryID' in table.c:
+        order_by.append(table.c.entryID.desc())
+    ranked = select(*table.c, func.row_number().over(partition_by=table.c.deviceID, order_by=order_by).label("rank"))
+    if device_ids is not None:
+        ranked = ranked.where(table.c.deviceID.in_(device_ids))
+    ranked = ranked.subquery()
+    latest = select(*[ranked.c[column.name] for column in table.c]).where(ranked.c.rank == 1)
+    return [dict(row) for row in db.execute(latest).mappings()]
+
+
+def rebuild_shadows(db, data=None, metadata=None, configs=None) -> int:
+    """
+    Recompute every device's shadow from history (used when the table is first added).
+    The history tables default to the models'; migrations pass sa.table() snapshots
+    of the columns that existed at their revision.
+    """
+    data = _latest_rows(db, data if data is not None else source_for_range(db))
+    metadata = _latest_rows(db, metadata if metadata is not None else MetadataValues.__table__)
+    configs = _latest_rows(db, configs if configs is not None else ConfigValues.__table__)
+    record_data(db, data)
+    record_metadata(db, metadata)
+    if configs:
+        # Set rather than increment the version so rebuilding twice is harmless
+        db.execute(shadow.update().where(shadow.c.deviceID.in_([config['deviceID'] for config in configs])).values(config_version=0))
+        record_configs(db, configs)
+    return len({row['deviceID'] for row in data + metadata + configs})
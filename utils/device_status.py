@@ -0,0 +1,18 @@
+from utils.cache import firmware_descriptor_cache
+
+
+def build_device_status(db, device, latest_config) -> dict:
+    """Build standardized status structure for device responses"""
+    # Target firmware details come from the descriptor cache, not a query per response
+    firmware = firmware_descriptor_cache.get(db, device.targetFirmwareVersion)
+
+    return {
+        "config_updated": latest_config.config_updated if latest_config else False,
+        "fileDownloadState": device.fileDownloadState,
+        "firmwareDownload": {
+            "firmwareDownloadState": device.firmwareDownloadState,
+            "version": firmware.version if firmware else "unknown",
+            "fwcrc": (firmware.crc32 if firmware else None) or "0x00000000",
+            "firmware_size": firmware.firmware_bin_size if firmware else 0
+        }
+    }
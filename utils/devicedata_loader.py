@@ -0,0 +1,212 @@
+"""
+Backfill loader for historical DeviceData.
+
+On PostgreSQL rows are streamed into devicedata with a single
+COPY ... FROM STDIN through psycopg2's copy_expert; rows are parsed, given
+entryIDs and CSV-encoded lazily while the server reads, so memory stays flat
+regardless of file size. Other backends fall back to batched executemany
+INSERTs. Either way the whole load is one transaction owned by the caller.
+"""
+
+import csv
+import io
+import json
+import os
+import re
+from utils.uuid7 import uuid7
+from itertools import islice
+from utils.devicedata_writer import DEVICEDATA_FIELDS, parse_timestamps, build_device_data_row, write_device_data_rows
+from utils.entry_id_allocator import entry_id_allocator
+from utils.device_shadow import record_data
+from utils.rollups import rollup_entries
+from utils.numeric_fields import numeric_entries
+
+BACKFILL_BATCH_SIZE = int(os.getenv("BACKFILL_BATCH_SIZE", "5000"))
+# Largest single element iter_json_rows will buffer while waiting for the rest of it
+JSON_ELEMENT_MAX_CHARS = 1024 * 1024
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+COPY_COLUMNS = ['id', 'entryID', 'deviceID', 'created_at'] + DEVICEDATA_FIELDS
+
+
+def iter_csv_rows(text_stream):
+    """Yield reading dicts from CSV with a header row (created_at, field1..field15)."""
+    for row in csv.DictReader(text_stream):
+        yield {key: (value if value != '' else None) for key, value in row.items()}
+
+
+def iter_ndjson_rows(text_stream):
+    """Yield reading dicts from newline-delimited JSON objects."""
+    for line_number, line in enumerate(text_stream, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            row = json.loads(line)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Invalid JSON on line {line_number}: {e.msg}")
+        if not isinstance(row, dict):
+            raise ValueError(f"Line {line_number} is not a JSON object")
+        yield row
+
+
+def iter_json_rows(text_stream, chunk_size: int = 64 * 1024):
+    """
+    Yield reading dicts from a JSON array of objects, decoding one element at a
+    time as the text is read, so only the current chunk is held in memory.
+    """
+    decoder = json.JSONDecoder()
+    buffer, position, eof = '', 0, False
+    index = 0
+    state = 'start'  # start -> value/first -> separator -> ... -> end
+    while True:
+        position = _WHITESPACE.match(buffer, position).end()
+        if position == len(buffer):
+            if eof:
+                if state == 'end':
+                    return
+                raise ValueError("Body is empty" if state == 'start' else "JSON array is not terminated")
+            chunk = text_stream.read(chunk_size)
+            buffer, position, eof = buffer[position:] + chunk, 0, not chunk
+            continue
+        char = buffer[position]
+        if state == 'start':
+            if char != '[':
+                raise ValueError("Body must be a JSON array")
+            position, state = position + 1, 'first'
+        elif state in ('first', 'value'):
+            if state == 'first' and char == ']':
+                position, state = position + 1, 'end'
+                continue
+            try:
+                value, end = decoder.raw_decode(buffer, position)
+                # A value running to the end of the buffer may continue in the next chunk
+                complete = eof or end < len(buffer)
+            except json.JSONDecodeError as e:
+                if eof or len(buffer) - position > JSON_ELEMENT_MAX_CHARS:
+                    raise ValueError(f"Invalid JSON in element {index}: {e.msg}")
+                complete = False
+            if not complete:
+                chunk = text_stream.read(chunk_size)
+                buffer, position, eof = buffer[position:] + chunk, 0, not chunk
+                continue
+            if not isinstance(value, dict):
+                raise ValueError(f"Element {index} is not a JSON object")
+            yield value
+            index += 1
+            position, state = end, 'separator'
+        elif state == 'separator':
+            if char not in ',]':
+                raise ValueError(f"Expected ',' or ']' after element {index - 1}")
+            position, state = position + 1, 'value' if char == ',' else 'end'
+        else:
+            raise ValueError("Unexpected data after the JSON array")
+
+
+def _batches(rows, size):
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
+
+class _CopyStream:
+    """Read-only file object that produces COPY CSV text on demand from a line iterator."""
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._buffer = ''
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buffer) < size:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                break
+            self._buffer += chunk
+        if size < 0:
+            data, self._buffer = self._buffer, ''
+        else:
+            data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+    def readline(self, size=-1):
+        return self.read(size)
+
+
+def _encode_csv(rows) -> str:
+    out = io.StringIO()
+    writer = csv.writer(out)
+    for row in rows:
+        writer.writerow([
+            row['id'], row['entryID'], row['deviceID'], row['created_at'].isoformat(sep=' '),
+            *(row[key] for key in DEVICEDATA_FIELDS)
+        ])
+    return out.getvalue()
+
+
+def load_device_data(db, deviceID: int, rows, batch_size: int = BACKFILL_BATCH_SIZE) -> int:
+    """
+    Load an iterable of reading dicts for one device. Returns the number of rows written.
+    The caller commits (or rolls back) the session.
+    """
+    if db.get_bind().dialect.name == 'postgresql':
+        return _copy_rows(db, deviceID, rows, batch_size)
+
+    conn = db.connection()
+    total = 0
+    for batch in _batches(rows, batch_size):
+        # The session already holds the SQLite write lock, so reserve ids in the same transaction
+        entry_ids = entry_id_allocator.reserve_in_transaction(conn, deviceID, len(batch))
+        timestamps = parse_timestamps([row.get('created_at') for row in batch])
+        total += write_device_data_rows(db, [
+            build_device_data_row(deviceID, entryID, created_at, row)
+            for row, entryID, created_at in zip(batch, entry_ids, timestamps)
+        ])
+    return total
+
+
+def _runs(entry_ids: list) -> list:
+    """Contiguous (first, last) runs of a sorted id list; a batch can span the end of one lease and a new block."""
+    runs = []
+    for entry_id in entry_ids:
+        if runs and entry_id == runs[-1][1] + 1:
+            runs[-1][1] = entry_id
+        else:
+            runs.append([entry_id, entry_id])
+    return runs
+
+
+def _copy_rows(db, deviceID: int, rows, batch_size: int) -> int:
+    counter = {'rows': 0, 'newest': None, 'entry_ranges': []}
+
+    def chunks():
+        for batch in _batches(rows, batch_size):
+            entry_ids = entry_id_allocator.allocate(db, deviceID, len(batch))
+            counter['entry_ranges'].extend(_runs(entry_ids))
+            timestamps = parse_timestamps([row.get('created_at') for row in batch])
+            prepared = []
+            for row, entryID, created_at in zip(batch, entry_ids, timestamps):
+                prepared_row = build_device_data_row(deviceID, entryID, created_at, row)
+                prepared_row['id'] = uuid7()
+                prepared.append(prepared_row)
+            counter['rows'] += len(prepared)
+            newest = max(prepared, key=lambda row: (row['created_at'], row['entryID']))
+            if counter['newest'] is None or newest['created_at'] >= counter['newest']['created_at']:
+                counter['newest'] = newest
+            yield _encode_csv(prepared)
+
+    columns = ', '.join(f'"{column}"' for column in COPY_COLUMNS)
+    dbapi_connection = db.connection().connection.dbapi_connection
+    with dbapi_connection.cursor() as cursor:
+        cursor.copy_expert(f'COPY devicedata ({columns}) FROM STDIN WITH (FORMAT csv)', _CopyStream(chunks()))
+    if counter['newest'] is not None:
+        record_data(db, [counter['newest']])
+    # COPY cannot share the connection while streaming, so fold the loaded rows into the rollups
+    # and the typed copies afterwards
+    for first_entry, last_entry in counter['entry_ranges']:
+        rollup_entries(db, deviceID, first_entry, last_entry)
+        numeric_entries(db, deviceID, first_entry, last_entry)
+    return counter['rows']
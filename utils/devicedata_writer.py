@@ -0,0 +1,65 @@
+"""
+Set-based write path for DeviceData rows.
+
+Rows are plain dicts keyed by devicedata column names and are written with a
+single Core executemany INSERT, bypassing ORM unit-of-work bookkeeping.
+"""
+
+from datetime import datetime
+from models.devicedata_value import DeviceData
+from utils.device_shadow import record_data
+from utils.rollups import record_rollups
+from utils.numeric_fields import record_numeric
+from utils.uuid7 import uuid7
+
+DEVICEDATA_FIELDS = [f'field{i}' for i in range(1, 16)]
+
+
+def parse_timestamps(values: list, default: datetime = None, start: int = 0) -> list:
+    """
+    Parse a batch of 'YYYY-MM-DD HH:MM:SS' (ISO 8601) timestamps in one pass.
+    Missing values get `default` (now). Raises ValueError naming the first bad
+    index, counted from `start` (the batch's offset in a larger upload).
+    """
+    default = default or datetime.now()
+    parse = datetime.fromisoformat
+    parsed = []
+    for index, value in enumerate(values, start=start):
+        if not value:
+            parsed.append(default)
+            continue
+        if isinstance(value, datetime):
+            parsed.append(value)
+            continue
+        try:
+            parsed.append(parse(value))
+        except (TypeError, ValueError):
+            raise ValueError(f"Invalid created_at at index {index}: {value!r}")
+    return parsed
+
+
+def build_device_data_row(deviceID: int, entryID: int, created_at: datetime, values: dict) -> dict:
+    """Build an insert row for one reading; fields missing from `values` are stored as NULL."""
+    row = {'deviceID': deviceID, 'entryID': entryID, 'created_at': created_at}
+    for key in DEVICEDATA_FIELDS:
+        row[key] = values.get(key)
+    return row
+
+
+def write_device_data_rows(db, rows: list) -> int:
+    """
+    Insert rows with one multi-row INSERT in the caller's transaction, move
+    each device's shadow to its newest reading, merge the batch into the
+    1m/1h/1d rollups and write typed copies to devicedata_numeric. Returns the
+    row count.
+    """
+    if not rows:
+        return 0
+    for row in rows:
+        # Ids are assigned here so the numeric copies can share them
+        row.setdefault('id', uuid7())
+    db.execute(DeviceData.__table__.insert(), rows)
+    record_data(db, rows)
+    record_rollups(db, rows)
+    record_numeric(db, rows)
+    return len(rows)
@@ -0,0 +1,118 @@
+"""
+Per-device entryID allocation for DeviceData.
+
+IDs are reserved in blocks from the device_entry_sequences counter table and
+then handed out from memory, so most inserts never touch the database to get
+an entryID. Each reservation runs in a short transaction of its own and is
+committed immediately: a block that has been leased to one worker can never be
+handed to another, even if the request that triggered the reservation rolls
+back. The price is that unused IDs leave gaps (e.g. on restart), and IDs from
+different workers interleave rather than strictly following insert order.
+"""
+
+import os
+import threading
+from collections import defaultdict
+from sqlalchemy import select, update, insert, func
+from sqlalchemy.engine import Connection
+from sqlalchemy.exc import IntegrityError
+
+ENTRY_ID_BLOCK_SIZE = int(os.getenv("ENTRY_ID_BLOCK_SIZE", "100"))
+
+
+class EntryIDAllocator:
+    def __init__(self, block_size: int = ENTRY_ID_BLOCK_SIZE):
+        self.block_size = max(1, block_size)
+        # (database url, deviceID) -> [next free id, end of lease (exclusive)]
+        self._leases = {}
+        self._device_locks = defaultdict(threading.Lock)
+        self._lock = threading.Lock()
+
+    def allocate(self, db, device_id: int, count: int = 1) -> list:
+        """Return `count` unused entryIDs for a device, reserving a new block if needed."""
+        if count <= 0:
+            return []
+        bind = db.get_bind()
+        if isinstance(bind, Connection):
+            bind = bind.engine
+        key = (str(bind.url), device_id)
+        with self._lock:
+            device_lock = self._device_locks[key]
+
+        with device_lock:
+            ids = []
+            lease = self._leases.get(key)
+            if lease:
+                take = min(count, lease[1] - lease[0])
+                ids.extend(range(lease[0], lease[0] + take))
+                lease[0] += take
+            missing = count - len(ids)
+            if missing:
+                size = max(self.block_size, missing)
+                start = self._reserve(bind, device_id, size)
+                ids.extend(range(start, start + missing))
+                self._leases[key] = [start + missing, start + size]
+            return ids
+
+    def reset(self):
+        """Forget all in-memory leases (the reserved IDs are simply skipped)."""
+        with self._lock:
+            self._leases.clear()
+
+    def reserve_in_transaction(self, conn, device_id: int, count: int) -> list:
+        """
+        Advance the device counter inside the caller's transaction and return `count` ids.
+        Nothing is leased in memory, so a rollback simply returns the ids to the counter.
+        Used by writers that already hold the database write lock (e.g. SQLite backfills).
+        """
+        if count <= 0:
+            return []
+        start = self._advance(conn, device_id, count)
+        return list(range(start, start + count))
+
+    @classmethod
+    def _reserve(cls, bind, device_id: int, size: int) -> int:
+        """Atomically advance the device counter by `size` in its own transaction and return the first reserved id."""
+        for _ in range(3):
+            try:
+                with bind.begin() as conn:
+                    return cls._advance(conn, device_id, size)
+            except IntegrityError:
+                # Another worker seeded the counter first; retry against its row
+                continue
+        raise RuntimeError(f"Could not reserve entryIDs for device {device_id}")
+
+    @staticmethod
+    def _advance(conn, device_id: int, size: int) -> int:
+        from models.device_entry_sequence import DeviceEntrySequence
+        from utils.partitioning import source_for_range
+        seq = DeviceEntrySequence.__table__
+
+        if conn.dialect.update_returning:
+            new_next = conn.execute(
+                update(seq)
+                .where(seq.c.deviceID == device_id)
+                .values(next_entry_id=seq.c.next_entry_id + size)
+                .returning(seq.c.next_entry_id)
+            ).scalar()
+        else:
+            current = conn.execute(
+                select(seq.c.next_entry_id).where(seq.c.deviceID == device_id).with_for_update()
+            ).scalar()
+            new_next = None
+            if current is not None:
+                new_next = current + size
+                conn.execute(update(seq).where(seq.c.deviceID == device_id).values(next_entry_id=new_next))
+        if new_next is not None:
+            return new_next - size
+
+        # First reservation for this device: start after any rows that already exist, archived ones included
+        data = source_for_range(conn)
+        max_entry = conn.execute(
+            select(func.max(data.c.entryID)).where(data.c.deviceID == device_id)
+        ).scalar() or 0
+        conn.execute(insert(seq).values(deviceID=device_id, next_entry_id=max_entry + 1 + size))
+        return max_entry + 1
+
+
+entry_id_allocator = EntryIDAllocator()
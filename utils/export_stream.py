@@ -0,0 +1,67 @@
+"""
+Incremental encoders for history exports.
+
+Rows come in as partitions from a server-side cursor
+(execution_options(stream_results=True, yield_per=N)), and each partition is
+encoded and yielded as soon as it is read. Memory is therefore bounded by one
+chunk, whatever the size of the export.
+"""
+
+import csv
+import io
+import json
+import os
+import zlib
+from datetime import datetime
+
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", "5000"))
+EXPORT_FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+
+def stream_partitions(db, query, chunk_size: int = EXPORT_CHUNK_SIZE):
+    """Yield lists of row tuples read through a server-side cursor, chunk_size at a time."""
+    result = db.execute(query.execution_options(stream_results=True, yield_per=chunk_size))
+    try:
+        for partition in result.partitions(chunk_size):
+            yield partition
+    finally:
+        result.close()
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def encode_ndjson(header, partitions):
+    """One JSON object per row, keyed by header."""
+    dumps = json.JSONEncoder(default=_json_default, separators=(",", ":")).encode
+    for partition in partitions:
+        yield "".join(dumps(dict(zip(header, row))) + "\n" for row in partition).encode()
+
+
+def encode_csv(header, partitions):
+    """A header line, then the rows of each partition as one chunk."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    for partition in partitions:
+        writer.writerows(
+            [value.isoformat() if isinstance(value, datetime) else value for value in row] for row in partition
+        )
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+def gzip_stream(chunks, level: int = 6):
+    """Compress a byte stream into a single gzip member as it is produced."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
@@ -0,0 +1,64 @@
+"""
+Opt-in fast JSON path for hot endpoints (FAST_JSON=true).
+
+Responses: routes hand controller output they already trust to
+fast_response(), which returns it unchanged by default (FastAPI then runs
+response_model validation and jsonable_encoder as usual) or, with FAST_JSON,
+serializes it straight to bytes with orjson in a FastJSONResponse, skipping
+both. The JSON is the same either way (datetimes as ISO 8601, UUIDs as
+strings); only the response_model field order is not kept.
+
+Request bodies: parse_body() validates a raw ingest body against a TypeAdapter
+compiled once at import (schemas/device_data.py). With FAST_JSON the JSON is
+parsed and validated in one pass by pydantic-core; otherwise it is json.loads
+plus the same validation. Failures are FastAPI's usual 422.
+
+Without orjson installed FAST_JSON falls back to the default path.
+"""
+
+import json
+import os
+from fastapi.encoders import jsonable_encoder
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import JSONResponse
+from pydantic import TypeAdapter, ValidationError
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+FAST_JSON = os.getenv("FAST_JSON", "false").lower() in ("1", "true", "yes")
+if FAST_JSON and orjson is None:
+    print("⚠️ FAST_JSON is set but orjson is not installed; using the default JSON path")
+    FAST_JSON = False
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered by orjson; types orjson does not know go through jsonable_encoder."""
+
+    def render(self, content) -> bytes:
+        return orjson.dumps(content, default=jsonable_encoder)
+
+
+def fast_response(content, headers: dict = None):
+    """Return trusted controller output as-is, or pre-serialized (skipping response_model) with FAST_JSON."""
+    if not FAST_JSON:
+        return content
+    return FastJSONResponse(content, headers=headers)
+
+
+def parse_body(adapter: TypeAdapter, raw: bytes):
+    """Parse and validate a JSON request body with a precompiled TypeAdapter."""
+    try:
+        if FAST_JSON:
+            return adapter.validate_json(raw)
+        return adapter.validate_python(json.loads(raw))
+    except json.JSONDecodeError as e:
+        raise RequestValidationError([{
+            "type": "json_invalid", "loc": ("body", e.pos), "msg": "JSON decode error", "input": {}, "ctx": {"error": e.msg}
+        }])
+    except ValidationError as e:
+        raise RequestValidationError([
+            {**error, "loc": ("body", *error["loc"])} for error in e.errors(include_url=False)
+        ])
@@ -0,0 +1,224 @@
+"""
+Optional write-behind buffer for /device_data/update.
+
+When INGEST_WRITE_BEHIND is enabled, validated readings are acknowledged as
+soon as they are queued here and a background task writes them in batches
+(every INGEST_FLUSH_INTERVAL_MS, or sooner once INGEST_FLUSH_BATCH rows are
+waiting), one transaction per batch. When the buffer is full producers wait
+up to INGEST_ENQUEUE_TIMEOUT_MS for space and are then rejected, so clients
+see back-pressure instead of the process growing without bound. A batch
+that keeps failing (INGEST_FLUSH_RETRIES times) is bisected into smaller
+transactions so only the readings that fail on their own are dropped.
+
+Queued readings live only in process memory: a crash (as opposed to a normal
+shutdown, which flushes) loses whatever had not been written yet.
+"""
+
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from fastapi.concurrency import run_in_threadpool
+from utils.devicedata_writer import write_device_data_rows
+
+INGEST_WRITE_BEHIND = os.getenv("INGEST_WRITE_BEHIND", "false").lower() in ("1", "true", "yes")
+INGEST_BUFFER_SIZE = int(os.getenv("INGEST_BUFFER_SIZE", "10000"))
+INGEST_FLUSH_BATCH = int(os.getenv("INGEST_FLUSH_BATCH", "500"))
+INGEST_FLUSH_INTERVAL_MS = int(os.getenv("INGEST_FLUSH_INTERVAL_MS", "200"))
+INGEST_ENQUEUE_TIMEOUT_MS = int(os.getenv("INGEST_ENQUEUE_TIMEOUT_MS", "1000"))
+INGEST_FLUSH_RETRIES = 3
+
+
+class BufferFull(Exception):
+    """Raised when a reading cannot be queued before the enqueue timeout."""
+
+
+class IngestBuffer:
+    def __init__(
+        self,
+        session_factory,
+        enabled: bool = INGEST_WRITE_BEHIND,
+        max_size: int = INGEST_BUFFER_SIZE,
+        batch_size: int = INGEST_FLUSH_BATCH,
+        flush_interval_ms: int = INGEST_FLUSH_INTERVAL_MS,
+        enqueue_timeout_ms: int = INGEST_ENQUEUE_TIMEOUT_MS,
+    ):
+        self.session_factory = session_factory
+        self.enabled = enabled
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000
+        self.enqueue_timeout = enqueue_timeout_ms / 1000
+        self._rows = deque()
+        self._space = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._failed_attempts = 0
+        self._loop = None
+        self._wakeup = None
+        self._task = None
+        self._metrics = {
+            "enqueued": 0,
+            "flushed": 0,
+            "dropped": 0,
+            "rejected": 0,
+            "flushes": 0,
+            "failed_flushes": 0,
+            "max_queue_depth": 0,
+            "last_flush_rows": 0,
+            "last_flush_ms": 0.0,
+            "max_flush_ms": 0.0,
+            "total_flush_ms": 0.0,
+            "last_error": None,
+        }
+
+    def put(self, row: dict):
+        """Queue a copy of one reading (the caller may return it), waiting for space if the buffer is full."""
+        deadline = time.monotonic() + self.enqueue_timeout
+        with self._space:
+            while len(self._rows) >= self.max_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._metrics["rejected"] += 1
+                    raise BufferFull("Ingest buffer is full")
+                self._space.wait(remaining)
+            # The flusher fills in ids, so it must not share the dict a request handler responds with
+            self._rows.append(dict(row))
+            depth = len(self._rows)
+            self._metrics["enqueued"] += 1
+            self._metrics["max_queue_depth"] = max(self._metrics["max_queue_depth"], depth)
+        if depth >= self.batch_size and self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def flush(self) -> int:
+        """Write everything queued so far, one transaction per batch. Returns rows written."""
+        written = 0
+        with self._flush_lock:
+            while True:
+                with self._space:
+                    batch = [self._rows.popleft() for _ in range(min(self.batch_size, len(self._rows)))]
+                if not batch:
+                    return written
+                started = time.perf_counter()
+                try:
+                    self._write(batch)
+                except Exception as e:
+                    if not self._record_failure(batch, e):
+                        return written
+                    # Out of retries: write what can be written and drop only the rows that fail on their own
+                    written += self._write_isolating(batch)
+                    continue
+                self._failed_attempts = 0
+                written += len(batch)
+                self._record_flush(len(batch), (time.perf_counter() - started) * 1000)
+
+    def _write(self, batch: list):
+        db = self.session_factory()
+        try:
+            write_device_data_rows(db, batch)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+            with self._space:
+                self._space.notify_all()
+
+    def _write_isolating(self, batch: list) -> int:
+        """Bisect a failing batch, one transaction per half, until the failing rows are alone. Returns rows written."""
+        if len(batch) == 1:
+            try:
+                self._write(batch)
+            except Exception as e:
+                self._metrics["dropped"] += 1
+                self._metrics["last_error"] = str(e)
+                print(f"❌ Dropped reading {batch[0].get('deviceID')}/{batch[0].get('entryID')}: {e}")
+                return 0
+            self._record_flush(1, 0.0)
+            return 1
+        middle = len(batch) // 2
+        written = 0
+        for half in (batch[:middle], batch[middle:]):
+            started = time.perf_counter()
+            try:
+                self._write(half)
+            except Exception:
+                written += self._write_isolating(half)
+                continue
+            written += len(half)
+            self._record_flush(len(half), (time.perf_counter() - started) * 1000)
+        return written
+
+    def _record_flush(self, rows: int, elapsed_ms: float):
+        metrics = self._metrics
+        metrics["flushes"] += 1
+        metrics["flushed"] += rows
+        metrics["last_flush_rows"] = rows
+        metrics["last_flush_ms"] = round(elapsed_ms, 3)
+        metrics["max_flush_ms"] = round(max(metrics["max_flush_ms"], elapsed_ms), 3)
+        metrics["total_flush_ms"] += elapsed_ms
+
+    def _record_failure(self, batch: list, error: Exception) -> bool:
+        """Count a failed flush and requeue the batch; True once it has failed INGEST_FLUSH_RETRIES times."""
+        self._metrics["failed_flushes"] += 1
+        self._metrics["last_error"] = str(error)
+        self._failed_attempts += 1
+        if self._failed_attempts >= INGEST_FLUSH_RETRIES:
+            self._failed_attempts = 0
+            print(f"⚠️ Ingest flush failed {INGEST_FLUSH_RETRIES} times, writing {len(batch)} readings in smaller batches: {error}")
+            return True
+        print(f"⚠️ Ingest flush failed, will retry: {error}")
+        with self._space:
+            self._rows.extendleft(reversed(batch))
+        return False
+
+    def stats(self) -> dict:
+        with self._space:
+            depth = len(self._rows)
+        metrics = dict(self._metrics)
+        total_ms = metrics.pop("total_flush_ms")
+        metrics["avg_flush_ms"] = round(total_ms / metrics["flushes"], 3) if metrics["flushes"] else 0.0
+        return {
+            "enabled": self.enabled,
+            "queue_depth": depth,
+            "max_size": self.max_size,
+            "batch_size": self.batch_size,
+            "flush_interval_ms": int(self.flush_interval * 1000),
+            **metrics,
+        }
+
+    async def start(self):
+        """Start the background flusher on the running event loop."""
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the flusher and write out everything still queued."""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._loop = None
+        await run_in_threadpool(self.flush)
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await run_in_threadpool(self.flush)
+
+
+def _default_session_factory():
+    from utils.database_config import SessionLocal
+    return SessionLocal()
+
+
+ingest_buffer = IngestBuffer(_default_session_factory)
@@ -0,0 +1,148 @@
+"""
+Typed companion rows for readings (models/devicedata_numeric.py).
+
+A profile can declare a type for each field in Profiles.field_types: float,
+int, bool or string. Writers call record_numeric(db, rows) in the same
+transaction as the devicedata INSERT; for devices whose profile types at
+least one field as float/int/bool, each reading is parsed once and written to
+devicedata_numeric under the same id, so consumers can range-scan and
+aggregate in the database instead of re-parsing strings.
+
+Parsing is strict: float must be finite, int must be a whole number, bool
+accepts 1/0, true/false, on/off and yes/no. A value that does not parse is
+stored as NULL and counted, per row in parse_errors and in the process-wide
+counters returned by stats() (rebuilds are not counted there); the original
+text stays in devicedata.
+"""
+
+import math
+import os
+import threading
+from sqlalchemy import delete, select
+from models.devicedata_numeric import DeviceDataNumeric
+from utils.cache import field_type_cache
+from utils.partitioning import source_for_range
+
+NUMERIC_ENABLED = os.getenv("DEVICEDATA_NUMERIC", "true").lower() in ("1", "true", "yes")
+NUMERIC_REBUILD_CHUNK = 5000
+
+FIELDS = [f'field{i}' for i in range(1, 16)]
+_TRUE = {'1', 'true', 'on', 'yes'}
+_FALSE = {'0', 'false', 'off', 'no'}
+
+_lock = threading.Lock()
+_metrics = {"rows": 0, "values": 0, "parse_errors": 0}
+
+
+def parse_float(value) -> float:
+    number = float(value)
+    if not math.isfinite(number):
+        raise ValueError(f"{value!r} is not a finite number")
+    return number
+
+
+def parse_int(value) -> float:
+    number = parse_float(value)
+    if not number.is_integer():
+        raise ValueError(f"{value!r} is not a whole number")
+    return number
+
+
+def parse_bool(value) -> float:
+    if isinstance(value, bool):
+        return float(value)
+    text = str(value).strip().lower()
+    if text in _TRUE:
+        return 1.0
+    if text in _FALSE:
+        return 0.0
+    raise ValueError(f"{value!r} is not a boolean")
+
+
+PARSERS = {'float': parse_float, 'int': parse_int, 'bool': parse_bool}
+
+
+def typed_fields(types: tuple) -> list:
+    """[(field, parser)] for the slots typed float/int/bool; string and untyped slots are left out."""
+    return [(field, PARSERS[kind]) for field, kind in zip(FIELDS, types) if kind in PARSERS]
+
+
+def parse_row(row: dict, fields: list) -> dict:
+    """Numeric row for one devicedata insert dict, given its device's typed_fields()."""
+    numeric = {
+        'id': row['id'], 'entryID': row['entryID'], 'deviceID': row['deviceID'], 'created_at': row['created_at'],
+        'parse_errors': 0,
+    }
+    for field in FIELDS:
+        numeric[field] = None
+    for field, parse in fields:
+        value = row.get(field)
+        if value is None or value == '':
+            continue
+        try:
+            numeric[field] = parse(value)
+        except (TypeError, ValueError):
+            numeric['parse_errors'] += 1
+    return numeric
+
+
+def numeric_rows(db, rows: list) -> list:
+    types = field_type_cache.get_many(db, [row['deviceID'] for row in rows])
+    fields = {deviceID: typed_fields(slots) for deviceID, slots in types.items()}
+    return [parse_row(row, fields[row['deviceID']]) for row in rows if fields.get(row['deviceID'])]
+
+
+def record_numeric(db, rows: list):
+    """Write typed copies of devicedata insert dicts (which must carry their id) for devices with typed fields."""
+    if not NUMERIC_ENABLED or not rows:
+        return
+    _insert(db, numeric_rows(db, rows), count=True)
+
+
+def _insert(db, parsed: list, count: bool) -> int:
+    if not parsed:
+        return 0
+    db.execute(DeviceDataNumeric.__table__.insert(), parsed)
+    if count:
+        with _lock:
+            _metrics["rows"] += len(parsed)
+            _metrics["values"] += sum(1 for row in parsed for field in FIELDS if row[field] is not None)
+            _metrics["parse_errors"] += sum(row['parse_errors'] for row in parsed)
+    return len(parsed)
+
+
+def numeric_entries(db, deviceID: int, first_entry: int, last_entry: int, chunk_size: int = NUMERIC_REBUILD_CHUNK):
+    """Parse already-inserted readings deviceID/entryID in [first_entry, last_entry] (used after a COPY load)."""
+    if not NUMERIC_ENABLED:
+        return
+    source = source_for_range(db)
+    _numeric_query(db, select(source).where(
+        source.c.deviceID == deviceID,
+        source.c.entryID.between(first_entry, last_entry)
+    ), chunk_size, count=True)
+
+
+def rebuild_numeric(db, device_ids=None, chunk_size: int = NUMERIC_REBUILD_CHUNK) -> int:
+    """Re-parse raw readings into devicedata_numeric (all devices when device_ids is None). Returns rows written."""
+    statement = delete(DeviceDataNumeric)
+    if device_ids is not None:
+        statement = statement.where(DeviceDataNumeric.deviceID.in_(device_ids))
+    db.execute(statement)
+    source = source_for_range(db)
+    query = select(source).where(source.c.created_at.isnot(None))
+    if device_ids is not None:
+        query = query.where(source.c.deviceID.in_(device_ids))
+    return _numeric_query(db, query, chunk_size, count=False)
+
+
+def _numeric_query(db, query, chunk_size: int, count: bool) -> int:
+    total = 0
+    result = db.execute(query.execution_options(yield_per=chunk_size))
+    for partition in result.mappings().partitions(chunk_size):
+        total += _insert(db, numeric_rows(db, [dict(row) for row in partition]), count)
+    return total
+
+
+def stats() -> dict:
+    with _lock:
+        return {"enabled": NUMERIC_ENABLED, **_metrics}
@@ -0,0 +1,273 @@
+"""
+Monthly time partitioning of devicedata (opt-in with DEVICEDATA_PARTITIONING=true).
+
+PostgreSQL: devicedata becomes a native table PARTITION BY RANGE (created_at)
+with one partition per month (devicedata_pYYYYMM) plus a DEFAULT partition
+for out-of-range rows; convert_to_partitioned() does the one-off conversion
+(migrations/versions/0005) and the maintainer keeps PARTITION_MONTHS_AHEAD
+future months created. The planner prunes partitions for any query with a
+created_at range, so no reader changes are needed.
+
+SQLite has no partitioning, so it is emulated: devicedata keeps the open
+month(s) and the maintainer moves each closed month into its own
+devicedata_pYYYYMM table. Every devicedata reader selects from
+source_for_range(db, start, end), which is devicedata UNION ALL only the
+period tables overlapping the window (all of them when there is no window).
+
+Either way retention can drop whole months with drop_partitions_before().
+"""
+
+import asyncio
+import os
+import re
+from datetime import datetime
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import Column, Index, MetaData, Table, delete, func, insert, select, text, union_all
+from sqlalchemy.engine import Connection
+from models.devicedata_value import DeviceData
+
+DEVICEDATA_PARTITIONING = os.getenv("DEVICEDATA_PARTITIONING", "false").lower() in ("1", "true", "yes")
+PARTITION_MONTHS_AHEAD = int(os.getenv("PARTITION_MONTHS_AHEAD", "3"))
+# SQLite emulation: months (including the current one) left in devicedata before archiving
+PARTITION_LIVE_MONTHS = int(os.getenv("PARTITION_LIVE_MONTHS", "1"))
+PARTITION_MAINTENANCE_INTERVAL = int(os.getenv("PARTITION_MAINTENANCE_INTERVAL", str(6 * 3600)))
+
+TABLE = DeviceData.__table__
+_PERIOD_RE = re.compile(r'^devicedata_p(\d{4})(\d{2})$')
+_period_metadata = MetaData()
+
+
+def month_start(moment: datetime) -> datetime:
+    return moment.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def add_months(month: datetime, count: int) -> datetime:
+    index = month.year * 12 + month.month - 1 + count
+    return month.replace(year=index // 12, month=index % 12 + 1)
+
+
+def partition_name(month: datetime) -> str:
+    return f"devicedata_p{month:%Y%m}"
+
+
+def _partition_month(name: str):
+    match = _PERIOD_RE.match(name)
+    return datetime(int(match.group(1)), int(match.group(2)), 1) if match else None
+
+
+def period_table(name: str) -> Table:
+    """Table object for an emulated (SQLite) period table with devicedata's columns."""
+    if name in _period_metadata.tables:
+        return _period_metadata.tables[name]
+    columns = [Column(column.name, column.type, primary_key=column.primary_key) for column in TABLE.columns]
+    table = Table(name, _period_metadata, *columns)
+    Index(f"ix_{name}_device_entry", table.c.deviceID, table.c.entryID, unique=True)
+    Index(f"ix_{name}_device_created", table.c.deviceID, table.c.created_at)
+    return table
+
+
+def _dialect_name(db) -> str:
+    # Sessions, or a Connection for callers running in their own transaction (the entry id allocator)
+    return (db.dialect if isinstance(db, Connection) else db.get_bind().dialect).name
+
+
+def partitions(db) -> list:
+    """[(month, table name)] of existing monthly partitions / period tables, oldest first."""
+    if _dialect_name(db) == 'postgresql':
+        names = db.execute(text(
+            "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = to_regclass('devicedata')"
+        )).scalars()
+    else:
+        names = db.execute(text(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE 'devicedata_p%'"
+        )).scalars()
+    found = [(_partition_month(name), name) for name in names]
+    return sorted((month, name) for month, name in found if month is not None)
+
+
+def source_for_range(db, start: datetime = None, end: datetime = None):
+    """
+    What to select devicedata rows from for a created_at window: the devicedata
+    table itself unless SQLite emulation has archived months overlapping the
+    window, in which case a UNION ALL of devicedata and those period tables
+    (same column names, so callers use `.c.<column>`).
+    """
+    if not DEVICEDATA_PARTITIONING or _dialect_name(db) == 'postgresql':
+        return TABLE
+    periods = [
+        name for month, name in partitions(db)
+        if (end is None or month < end) and (start is None or add_months(month, 1) > start)
+    ]
+    if not periods:
+        return TABLE
+    return union_all(select(TABLE), *[select(period_table(name)) for name in periods]).subquery('devicedata')
+
+
+def is_partitioned(db) -> bool:
+    """True when devicedata is a native PostgreSQL partitioned table."""
+    if db.get_bind().dialect.name != 'postgresql':
+        return False
+    return db.execute(text("SELECT relkind FROM pg_class WHERE oid = to_regclass('devicedata')")).scalar() == 'p'
+
+
+def _create_partition_sql(month: datetime) -> str:
+    return (
+        f'CREATE TABLE IF NOT EXISTS "{partition_name(month)}" PARTITION OF devicedata '
+        f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{add_months(month, 1):%Y-%m-%d}')"
+    )
+
+
+def ensure_partitions(db, months_ahead: int = PARTITION_MONTHS_AHEAD, now: datetime = None) -> list:
+    """Create this month's and the next months_ahead partitions on PostgreSQL. Returns names created."""
+    if not is_partitioned(db):
+        return []
+    existing = {name for _, name in partitions(db)}
+    current = month_start(now or datetime.now())
+    created = []
+    for offset in range(months_ahead + 1):
+        month = add_months(current, offset)
+        if partition_name(month) in existing:
+            continue
+        try:
+            with db.begin_nested():
+                db.execute(text(_create_partition_sql(month)))
+            created.append(partition_name(month))
+        except Exception as e:
+            # Rows for that month already sit in the DEFAULT partition (e.g. a device with a wrong clock)
+            print(f"⚠️ Could not create partition {partition_name(month)}: {e}")
+    return created
+
+
+def convert_to_partitioned(db, months_ahead: int = PARTITION_MONTHS_AHEAD, now: datetime = None):
+    """
+    One-off: rebuild devicedata as a monthly range-partitioned table on PostgreSQL.
+    Copies every row and locks devicedata for the duration; run in a maintenance window.
+    PostgreSQL requires the partition key in every unique constraint, so the primary
+    key becomes (id, created_at) and the entry constraint (deviceID, entryID, created_at);
+    entryIDs stay unique per device through the entry id allocator.
+    """
+    if db.get_bind().dialect.name != 'postgresql' or is_partitioned(db):
+        return
+    db.execute(text("UPDATE devicedata SET created_at = now() WHERE created_at IS NULL"))
+    oldest = db.execute(text("SELECT min(created_at) FROM devicedata")).scalar()
+    current = month_start(now or datetime.now())
+    month = month_start(oldest) if oldest and oldest < current else current
+
+    db.execute(text("ALTER TABLE devicedata RENAME TO devicedata_unpartitioned"))
+    db.execute(text(
+        "CREATE TABLE devicedata (LIKE devicedata_unpartitioned INCLUDING DEFAULTS) PARTITION BY RANGE (created_at)"
+    ))
+    while month <= add_months(current, months_ahead):
+        db.execute(text(_create_partition_sql(month)))
+        month = add_months(month, 1)
+    db.execute(text("CREATE TABLE devicedata_default PARTITION OF devicedata DEFAULT"))
+    db.execute(text("INSERT INTO devicedata SELECT * FROM devicedata_unpartitioned"))
+    db.execute(text("DROP TABLE devicedata_unpartitioned"))
+    db.execute(text("ALTER TABLE devicedata ADD PRIMARY KEY (id, created_at)"))
+    db.execute(text(
+        'ALTER TABLE devicedata ADD CONSTRAINT unique_device_entry UNIQUE ("deviceID", "entryID", created_at)'
+    ))
+    db.execute(text(
+        'ALTER TABLE devicedata ADD FOREIGN KEY ("deviceID") REFERENCES devices ("deviceID")'
+    ))
+    db.execute(text('CREATE INDEX ix_devicedata_device_created ON devicedata ("deviceID", created_at DESC)'))
+
+
+def archive_closed_months(db, live_months: int = PARTITION_LIVE_MONTHS, now: datetime = None) -> list:
+    """SQLite emulation: move rows older than the live months into devicedata_pYYYYMM tables. Returns tables written."""
+    if db.get_bind().dialect.name == 'postgresql':
+        return []
+    cutoff = add_months(month_start(now or datetime.now()), -(max(live_months, 1) - 1))
+    oldest = db.execute(select(func.min(TABLE.c.created_at)).where(TABLE.c.created_at < cutoff)).scalar()
+    if oldest is None:
+        return []
+    connection = db.connection()
+    written = []
+    month = month_start(oldest)
+    while month < cutoff:
+        window = (TABLE.c.created_at >= month) & (TABLE.c.created_at < add_months(month, 1))
+        if db.execute(select(TABLE.c.id).where(window).limit(1)).first():
+            period = period_table(partition_name(month))
+            period.create(bind=connection, checkfirst=True)
+            db.execute(insert(period).from_select([column.name for column in TABLE.columns], select(TABLE).where(window)))
+            db.execute(delete(TABLE).where(window))
+            written.append(period.name)
+        month = add_months(month, 1)
+    return written
+
+
+def drop_partitions_before(db, cutoff: datetime) -> list:
+    """Drop every monthly partition / period table that ends on or before cutoff. Returns [(name, rows)]."""
+    dropped = []
+    postgres = db.get_bind().dialect.name == 'postgresql'
+    for month, name in partitions(db):
+        if add_months(month, 1) > cutoff:
+            break
+        rows = db.execute(text(f'SELECT count(*) FROM "{name}"')).scalar()
+        if postgres:
+            db.execute(text(f'ALTER TABLE devicedata DETACH PARTITION "{name}"'))
+        db.execute(text(f'DROP TABLE "{name}"'))
+        if name in _period_metadata.tables:
+            _period_metadata.remove(_period_metadata.tables[name])
+        dropped.append((name, rows))
+    return dropped
+
+
+class PartitionMaintainer:
+    """Background task: create upcoming partitions (PostgreSQL) or archive closed months (SQLite)."""
+
+    def __init__(self, session_factory, enabled: bool = DEVICEDATA_PARTITIONING,
+                 interval: int = PARTITION_MAINTENANCE_INTERVAL):
+        self.session_factory = session_factory
+        self.enabled = enabled
+        self.interval = interval
+        self._task = None
+        self._metrics = {"runs": 0, "created": [], "archived": [], "last_run": None, "last_error": None}
+
+    def run_once(self, now: datetime = None) -> dict:
+        db = self.session_factory()
+        try:
+            created = ensure_partitions(db, now=now)
+            archived = archive_closed_months(db, now=now)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            self._metrics["last_error"] = str(e)
+            print(f"❌ Partition maintenance failed: {e}")
+            return {"created": [], "archived": []}
+        finally:
+            db.close()
+        self._metrics["runs"] += 1
+        self._metrics["created"] = created
+        self._metrics["archived"] = archived
+        self._metrics["last_run"] = datetime.now().isoformat()
+        return {"created": created, "archived": archived}
+
+    async def _run(self):
+        while True:
+            await run_in_threadpool(self.run_once)
+            await asyncio.sleep(self.interval)
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> dict:
+        return {"enabled": self.enabled, **self._metrics}
+
+
+def _make_maintainer():
+    from utils.database_config import SessionLocal
+    return PartitionMaintainer(SessionLocal)
+
+
+partition_maintainer = _make_maintainer()
@@ -0,0 +1,92 @@
+"""
+Request body decompression (Content-Encoding: gzip / deflate).
+
+RequestDecompressionMiddleware wraps the ASGI receive channel so every
+handler, including ones that read request.stream() incrementally, sees the
+inflated body in chunks of at most INFLATE_CHUNK_BYTES; nothing is buffered
+here. Inflation is capped at REQUEST_MAX_INFLATED_BYTES (checked while
+decompressing, so a small bomb never expands past the limit) and answered
+with 413; corrupt or truncated streams get 400 and unknown encodings 415.
+"""
+
+import os
+import zlib
+from fastapi import HTTPException
+from starlette.responses import JSONResponse
+
+REQUEST_MAX_INFLATED_BYTES = int(os.getenv("REQUEST_MAX_INFLATED_BYTES", str(64 * 1024 * 1024)))
+# Most inflated bytes handed on per body message, so a highly compressible chunk doesn't expand in one go
+INFLATE_CHUNK_BYTES = 64 * 1024
+
+ENCODINGS = ("gzip", "x-gzip", "deflate")
+
+
+def _deflate_wbits(head: bytes) -> int:
+    # "deflate" should be zlib-wrapped (RFC 9110) but some clients send raw deflate
+    if len(head) >= 2 and head[0] & 0x0F == 8 and (head[0] << 8 | head[1]) % 31 == 0:
+        return zlib.MAX_WBITS
+    return -zlib.MAX_WBITS
+
+
+class _InflatingReceive:
+    """receive() replacement yielding decompressed http.request messages."""
+
+    def __init__(self, receive, encoding: str, max_size: int):
+        self.receive = receive
+        self.encoding = encoding
+        self.max_size = max_size
+        self.decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS) if encoding != "deflate" else None
+        self.inflated = 0
+        # Compressed input left over when a message hit INFLATE_CHUNK_BYTES, and whether more follows it
+        self.pending = b""
+        self.more_body = True
+
+    async def __call__(self):
+        if self.pending:
+            body, more_body = self.pending, self.more_body
+        else:
+            message = await self.receive()
+            if message["type"] != "http.request":
+                return message
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+        if self.decompressor is None:
+            if not body and more_body:
+                return {"type": "http.request", "body": b"", "more_body": True}
+            self.decompressor = zlib.decompressobj(_deflate_wbits(body))
+        try:
+            # Never inflate more than one byte past the limit, whatever the compression ratio
+            data = self.decompressor.decompress(body, min(INFLATE_CHUNK_BYTES, self.max_size - self.inflated + 1))
+            self.pending, self.more_body = self.decompressor.unconsumed_tail, more_body
+            if not more_body and not self.pending:
+                data += self.decompressor.flush()
+        except zlib.error as e:
+            raise HTTPException(status_code=400, detail=f"Invalid {self.encoding} request body: {e}")
+        self.inflated += len(data)
+        if self.inflated > self.max_size:
+            raise HTTPException(status_code=413, detail=f"Request body inflates past {self.max_size} bytes.")
+        if not more_body and not self.pending and not self.decompressor.eof:
+            raise HTTPException(status_code=400, detail=f"Truncated {self.encoding} request body.")
+        return {"type": "http.request", "body": data, "more_body": more_body or bool(self.pending)}
+
+
+class RequestDecompressionMiddleware:
+    def __init__(self, app, max_size: int = REQUEST_MAX_INFLATED_BYTES):
+        self.app = app
+        self.max_size = max_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        encoding = None
+        for name, value in scope["headers"]:
+            if name == b"content-encoding":
+                encoding = value.decode("latin-1").strip().lower()
+        if not encoding or encoding == "identity":
+            return await self.app(scope, receive, send)
+        if encoding not in ENCODINGS:
+            response = JSONResponse({"detail": f"Unsupported Content-Encoding '{encoding}'."}, status_code=415)
+            return await response(scope, receive, send)
+        # Handlers see a plain body of unknown length
+        headers = [(name, value) for name, value in scope["headers"] if name not in (b"content-encoding", b"content-length")]
+        await self.app(dict(scope, headers=headers), _InflatingReceive(receive, encoding, self.max_size), send)
@@ -0,0 +1,198 @@
+"""
+Per-profile retention, enforced by a background purger.
+
+Profiles.data_retention_days / metadata_retention_days drop readings (and
+their typed copies in devicedata_numeric) and metadata older than that many
+days, and config_history_limit keeps only the newest N config rows per device
+(never the one device_shadow points at). Unset values keep everything.
+
+Rows are deleted in batches of RETENTION_BATCH_SIZE, each
+`DELETE ... WHERE id IN (SELECT id ... LIMIT n)` committed on its own with a
+RETENTION_BATCH_PAUSE_MS pause in between, so locks stay short and ingest is
+never blocked behind a long purge. When devicedata is partitioned
+(utils/partitioning.py) and every device has a data retention, whole months
+older than the longest retention are dropped instead of deleted row by row.
+
+Each run reports rows removed and an estimate of the bytes reclaimed (rows x
+average row size sampled before deleting).
+"""
+
+import asyncio
+import os
+import time
+from datetime import datetime, timedelta
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import delete, func, literal_column, select
+from models.config_value import ConfigValues
+from models.device import Devices
+from models.device_shadow import DeviceShadow
+from models.devicedata_value import DeviceData
+from models.devicedata_numeric import DeviceDataNumeric
+from models.metadata_value import MetadataValues
+from models.profile import Profiles
+from utils import partitioning
+
+RETENTION_PURGE = os.getenv("RETENTION_PURGE", "false").lower() in ("1", "true", "yes")
+RETENTION_INTERVAL = int(os.getenv("RETENTION_INTERVAL", "3600"))
+RETENTION_BATCH_SIZE = int(os.getenv("RETENTION_BATCH_SIZE", "5000"))
+RETENTION_BATCH_PAUSE_MS = int(os.getenv("RETENTION_BATCH_PAUSE_MS", "200"))
+# deviceIDs per IN (...) list
+_DEVICE_CHUNK = 500
+_SIZE_SAMPLE = 1000
+TABLES = ("devicedata", "devicedata_numeric", "metadatavalues", "configvalues")
+
+
+def average_row_bytes(db, table) -> float:
+    """Average stored size of a sample of rows (pg_column_size on PostgreSQL, column lengths elsewhere)."""
+    sample = select(table).limit(_SIZE_SAMPLE).subquery('sample')
+    if db.get_bind().dialect.name == 'postgresql':
+        size = func.pg_column_size(literal_column('sample'))
+    else:
+        size = sum((func.coalesce(func.length(column), 0) for column in sample.c), literal_column("0"))
+    return float(db.execute(select(func.avg(size)).select_from(sample)).scalar() or 0)
+
+
+def retention_policies(db) -> dict:
+    """{'data': {days: [deviceIDs]}, 'metadata': {days: [...]}, 'config': {limit: [...]}, 'all_data_days': days or None}"""
+    rows = db.query(
+        Devices.deviceID, Profiles.data_retention_days, Profiles.metadata_retention_days, Profiles.config_history_limit
+    ).join(Profiles, Devices.profile == Profiles.id).all()
+    policies = {'data': {}, 'metadata': {}, 'config': {}}
+    for deviceID, data_days, metadata_days, config_limit in rows:
+        for kind, value in (('data', data_days), ('metadata', metadata_days), ('config', config_limit)):
+            if value:
+                policies[kind].setdefault(value, []).append(deviceID)
+    # Whole partitions can only go when no device keeps readings forever
+    everyone = db.query(func.count(Devices.deviceID)).scalar()
+    covered = sum(len(ids) for ids in policies['data'].values())
+    policies['all_data_days'] = max(policies['data']) if policies['data'] and covered == everyone else None
+    return policies
+
+
+class RetentionPurger:
+    def __init__(self, session_factory, enabled: bool = RETENTION_PURGE, interval: int = RETENTION_INTERVAL,
+                 batch_size: int = RETENTION_BATCH_SIZE, pause_ms: int = RETENTION_BATCH_PAUSE_MS):
+        self.session_factory = session_factory
+        self.enabled = enabled
+        self.interval = interval
+        self.batch_size = batch_size
+        self.pause = pause_ms / 1000
+        self._task = None
+        self._metrics = {"runs": 0, "rows": 0, "bytes": 0, "batches": 0, "last_run": None, "last_report": None, "last_error": None}
+
+    def _delete_batches(self, db, table, condition, report: dict):
+        """Delete matching rows batch by batch, one commit per batch. Adds to report['rows'/'bytes']."""
+        row_bytes = None
+        while True:
+            batch = select(table.c.id).where(condition).limit(self.batch_size)
+            if row_bytes is None:
+                if db.execute(batch.limit(1)).first() is None:
+                    return
+                row_bytes = average_row_bytes(db, table)
+            deleted = db.execute(delete(table).where(table.c.id.in_(batch))).rowcount
+            db.commit()
+            self._metrics["batches"] += 1
+            report["rows"] += deleted
+            report["bytes"] += int(deleted * row_bytes)
+            if deleted < self.batch_size:
+                return
+            time.sleep(self.pause)
+
+    def _purge_older_than(self, db, tables, policy: dict, now: datetime, report: dict):
+        for days, device_ids in policy.items():
+            cutoff = now - timedelta(days=days)
+            for start in range(0, len(device_ids), _DEVICE_CHUNK):
+                chunk = device_ids[start:start + _DEVICE_CHUNK]
+                for table in tables(cutoff):
+                    self._delete_batches(db, table, table.c.deviceID.in_(chunk) & (table.c.created_at < cutoff), report)
+
+    def _purge_config_history(self, db, policy: dict, report: dict):
+        table = ConfigValues.__table__
+        current = select(DeviceShadow.config_id).where(DeviceShadow.config_id.isnot(None))
+        for limit, device_ids in policy.items():
+            for start in range(0, len(device_ids), _DEVICE_CHUNK):
+                chunk = device_ids[start:start + _DEVICE_CHUNK]
+                ranked = select(
+                    table.c.id,
+                    func.row_number().over(partition_by=table.c.deviceID, order_by=table.c.created_at.desc()).label("rank")
+                ).where(table.c.deviceID.in_(chunk)).subquery()
+                stale = select(ranked.c.id).where(ranked.c.rank > limit)
+                self._delete_batches(db, table, table.c.id.in_(stale) & table.c.id.notin_(current), report)
+
+    def run_once(self, now: datetime = None) -> dict:
+        """Apply every profile's retention once. Returns {table: {'rows', 'bytes'}, 'partitions_dropped': [...]}."""
+        now = now or datetime.now()
+        report = {name: {"rows": 0, "bytes": 0} for name in TABLES}
+        report["partitions_dropped"] = []
+        db = self.session_factory()
+        try:
+            policies = retention_policies(db)
+            db.commit()
+            if partitioning.DEVICEDATA_PARTITIONING and policies['all_data_days']:
+                cutoff = now - timedelta(days=policies['all_data_days'])
+                row_bytes = average_row_bytes(db, DeviceData.__table__)
+                for name, rows in partitioning.drop_partitions_before(db, cutoff):
+                    report["partitions_dropped"].append(name)
+                    report["devicedata"]["rows"] += rows
+                    report["devicedata"]["bytes"] += int(rows * row_bytes)
+                db.commit()
+
+            def data_tables(cutoff):
+                # On SQLite the emulated period tables hold closed months outside devicedata
+                return [DeviceData.__table__] + ([] if db.get_bind().dialect.name == 'postgresql' else [
+                    partitioning.period_table(name) for month, name in partitioning.partitions(db) if month < cutoff
+                ])
+
+            self._purge_older_than(db, data_tables, policies['data'], now, report["devicedata"])
+            self._purge_older_than(db, lambda cutoff: [DeviceDataNumeric.__table__], policies['data'], now, report["devicedata_numeric"])
+            self._purge_older_than(db, lambda cutoff: [MetadataValues.__table__], policies['metadata'], now, report["metadatavalues"])
+            self._purge_config_history(db, policies['config'], report["configvalues"])
+        except Exception as e:
+            db.rollback()
+            self._metrics["last_error"] = str(e)
+            print(f"❌ Retention purge failed: {e}")
+            raise
+        finally:
+            db.close()
+
+        rows = sum(report[name]["rows"] for name in TABLES)
+        reclaimed = sum(report[name]["bytes"] for name in TABLES)
+        self._metrics["runs"] += 1
+        self._metrics["rows"] += rows
+        self._metrics["bytes"] += reclaimed
+        self._metrics["last_run"] = now.isoformat()
+        self._metrics["last_report"] = report
+        if rows:
+            print(f"✅ Retention purge removed {rows} rows (~{reclaimed} bytes)")
+        return report
+
+    async def _run(self):
+        while True:
+            try:
+                await run_in_threadpool(self.run_once)
+            except Exception:
+                pass  # already logged; try again next interval
+            await asyncio.sleep(self.interval)
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> dict:
+        return {"enabled": self.enabled, **self._metrics}
+
+
+def _default_session_factory():
+    from utils.database_config import SessionLocal
+    return SessionLocal()
+
+
+retention_purger = RetentionPurger(_default_session_factory)
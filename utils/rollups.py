@@ -0,0 +1,215 @@
+"""
+Continuous 1m / 1h / 1d rollups of device readings (models/devicedata_rollup.py).
+
+Writers call record_rollups(db, rows) in the same transaction as the
+devicedata INSERT. The batch is folded in Python into one partial per
+(device, field, bucket), then merged with a single
+INSERT ... ON CONFLICT DO UPDATE per resolution: counts and sums add,
+min/max widen, and `last` moves only to a newer (created_at, entryID).
+Merging is order-independent, so late or backdated rows (bulk_update,
+backfill) update the right buckets without a watermark. Values that are not
+finite numbers are left out of the rollups.
+"""
+
+import math
+import os
+from datetime import datetime, timedelta
+from sqlalchemy import case, delete, select
+from models.devicedata_rollup import DeviceDataRollup1m, DeviceDataRollup1h, DeviceDataRollup1d
+from utils.partitioning import source_for_range
+from utils.upsert import upsert
+
+ROLLUPS_ENABLED = os.getenv("DEVICEDATA_ROLLUPS", "true").lower() in ("1", "true", "yes")
+ROLLUP_MAX_POINTS = int(os.getenv("ROLLUP_MAX_POINTS", "1000"))
+ROLLUP_REBUILD_CHUNK = 5000
+
+# resolution -> (model, bucket width)
+ROLLUPS = {
+    '1m': (DeviceDataRollup1m, timedelta(minutes=1)),
+    '1h': (DeviceDataRollup1h, timedelta(hours=1)),
+    '1d': (DeviceDataRollup1d, timedelta(days=1)),
+}
+FIELDS = [f'field{i}' for i in range(1, 16)]
+
+
+def bucket_start(created_at: datetime, resolution: str) -> datetime:
+    if resolution == '1m':
+        return created_at.replace(second=0, microsecond=0)
+    if resolution == '1h':
+        return created_at.replace(minute=0, second=0, microsecond=0)
+    return created_at.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _number(value):
+    if value is None:
+        return None
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return number if math.isfinite(number) else None
+
+
+def _fold(rows: list) -> dict:
+    """(deviceID, field, 1m bucket) -> partial rollup for the numeric values in rows."""
+    partials = {}
+    for row in rows:
+        created_at = row['created_at']
+        minute = bucket_start(created_at, '1m')
+        newness = (created_at, row['entryID'])
+        for field in FIELDS:
+            value = _number(row.get(field))
+            if value is None:
+                continue
+            key = (row['deviceID'], field, minute)
+            partial = partials.get(key)
+            if partial is None:
+                partials[key] = [1, value, value, value, value, newness]
+                continue
+            partial[0] += 1
+            partial[1] += value
+            partial[2] = min(partial[2], value)
+            partial[3] = max(partial[3], value)
+            if newness >= partial[5]:
+                partial[4], partial[5] = value, newness
+    return partials
+
+
+def _coarsen(partials: dict, resolution: str) -> dict:
+    """Combine 1m partials into wider buckets."""
+    combined = {}
+    for (deviceID, field, minute), partial in partials.items():
+        key = (deviceID, field, bucket_start(minute, resolution))
+        current = combined.get(key)
+        if current is None:
+            combined[key] = list(partial)
+            continue
+        current[0] += partial[0]
+        current[1] += partial[1]
+        current[2] = min(current[2], partial[2])
+        current[3] = max(current[3], partial[3])
+        if partial[5] >= current[5]:
+            current[4], current[5] = partial[4], partial[5]
+    return combined
+
+
+def _merge(db, model, partials: dict):
+    table = model.__table__
+
+    def merged(excluded):
+        newer = (excluded.last_at > table.c.last_at) | (
+            (excluded.last_at == table.c.last_at) & (excluded.last_entry_id >= table.c.last_entry_id)
+        )
+        return {
+            'count': table.c.count + excluded.count,
+            'sum': table.c.sum + excluded.sum,
+            'min': case((excluded.min < table.c.min, excluded.min), else_=table.c.min),
+            'max': case((excluded.max > table.c.max, excluded.max), else_=table.c.max),
+            'last': case((newer, excluded.last), else_=table.c.last),
+            'last_entry_id': case((newer, excluded.last_entry_id), else_=table.c.last_entry_id),
+            'last_at': case((newer, excluded.last_at), else_=table.c.last_at),
+        }
+
+    upsert(db, table, [
+        {
+            'deviceID': deviceID, 'field': field, 'bucket_start': start,
+            'count': count, 'sum': total, 'min': low, 'max': high,
+            'last': last, 'last_at': newness[0], 'last_entry_id': newness[1],
+        }
+        for (deviceID, field, start), (count, total, low, high, last, newness) in partials.items()
+    ], [table.c.deviceID, table.c.field, table.c.bucket_start], merged)
+
+
+def record_rollups(db, rows: list):
+    """Merge devicedata insert dicts (deviceID, entryID, created_at, field1..15) into every rollup table."""
+    if not ROLLUPS_ENABLED or not rows:
+        return
+    _merge_all(db, rows)
+
+
+def rollup_entries(db, deviceID: int, first_entry: int, last_entry: int, chunk_size: int = ROLLUP_REBUILD_CHUNK):
+    """Fold already-inserted readings deviceID/entryID in [first_entry, last_entry] into the rollups
+    (used after a COPY load, which cannot run other statements while it streams)."""
+    if not ROLLUPS_ENABLED:
+        return
+    source = source_for_range(db)
+    _rollup_query(db, select(source).where(
+        source.c.deviceID == deviceID,
+        source.c.entryID.between(first_entry, last_entry)
+    ), chunk_size)
+
+
+def rebuild_rollups(db, device_ids=None, chunk_size: int = ROLLUP_REBUILD_CHUNK, source=None) -> int:
+    """
+    Recompute rollups from raw devicedata (all devices when device_ids is None). Returns readings folded.
+    `source` defaults to devicedata and any archived period tables; migrations pass an sa.table() snapshot of its columns.
+    """
+    for model, _ in ROLLUPS.values():
+        statement = delete(model)
+        if device_ids is not None:
+            statement = statement.where(model.deviceID.in_(device_ids))
+        db.execute(statement)
+    source = source if source is not None else source_for_range(db)
+    query = select(source).where(source.c.created_at.isnot(None))
+    if device_ids is not None:
+        query = query.where(source.c.deviceID.in_(device_ids))
+    return _rollup_query(db, query.order_by(source.c.deviceID, source.c.entryID), chunk_size)
+
+
+def _rollup_query(db, query, chunk_size: int) -> int:
+    total = 0
+    result = db.execute(query.execution_options(yield_per=chunk_size))
+    for partition in result.mappings().partitions(chunk_size):
+        rows = [dict(row) for row in partition]
+        _merge_all(db, rows)
+        total += len(rows)
+    return total
+
+
+def _merge_all(db, rows: list):
+    minute_partials = _fold(rows)
+    if not minute_partials:
+        return
+    for resolution, (model, _) in ROLLUPS.items():
+        _merge(db, model, minute_partials if resolution == '1m' else _coarsen(minute_partials, resolution))
+
+
+def pick_resolution(start: datetime, end: datetime) -> str:
+    """Finest resolution that keeps the window within ROLLUP_MAX_POINTS buckets."""
+    if start is None or end is None:
+        return '1d'
+    span = end - start
+    for resolution, (_, width) in ROLLUPS.items():
+        if span / width <= ROLLUP_MAX_POINTS:
+            return resolution
+    return '1d'
+
+
+def read_rollups(db, deviceID: int, resolution: str, fields: list, start: datetime = None, end: datetime = None) -> dict:
+    """Columnar rollups: bucket_start plus count/sum/min/max/mean/last arrays per field, aligned on bucket_start."""
+    model, _ = ROLLUPS[resolution]
+    query = select(model.bucket_start, model.field, model.count, model.sum, model.min, model.max, model.last).where(
+        model.deviceID == deviceID,
+        model.field.in_(fields)
+    )
+    if start is not None:
+        query = query.where(model.bucket_start >= bucket_start(start, resolution))
+    if end is not None:
+        query = query.where(model.bucket_start < end)
+    rows = db.execute(query.order_by(model.bucket_start)).all()
+
+    buckets = sorted({row.bucket_start for row in rows})
+    slots = {bucket: index for index, bucket in enumerate(buckets)}
+    stats = ('count', 'sum', 'min', 'max', 'mean', 'last')
+    columns = {field: {stat: [None] * len(buckets) for stat in stats} for field in fields}
+    for row in rows:
+        column, slot = columns[row.field], slots[row.bucket_start]
+        column['count'][slot] = row.count
+        column['sum'][slot] = row.sum
+        column['min'][slot] = row.min
+        column['max'][slot] = row.max
+        column['mean'][slot] = row.sum / row.count
+        column['last'][slot] = row.last
+    for column in columns.values():
+        column['count'] = [count or 0 for count in column['count']]
+    return {'resolution': resolution, 'bucket_start': buckets, 'fields': columns}
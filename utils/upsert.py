@@ -0,0 +1,59 @@
+"""
+INSERT ... ON CONFLICT DO UPDATE for the tables writers merge into on every
+ingest (device_shadow, the devicedata rollups).
+
+PostgreSQL and SQLite get one native statement for the whole batch. Other
+backends fall back to a SELECT and then an UPDATE or INSERT per row, the
+INSERT in a savepoint so a row another writer added first is updated instead.
+That is slower, but readings are still written.
+"""
+
+from sqlalchemy import and_, literal, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+
+_NATIVE = {'postgresql': postgresql.insert, 'sqlite': sqlite.insert}
+
+
+class _Excluded:
+    """Fallback stand-in for `excluded`: each column is the incoming row's value as a bound literal."""
+
+    def __init__(self, table, row: dict):
+        self._table = table
+        self._row = row
+
+    def __getattr__(self, name):
+        return self[name]
+
+    def __getitem__(self, name):
+        return literal(self._row.get(name), type_=self._table.c[name].type)
+
+
+def upsert(db, table, rows: list, index_elements: list, set_, where=None):
+    """
+    Insert `rows` into `table`, updating the existing row on a conflict over `index_elements`.
+    `set_(excluded)` maps column -> new value and `where(excluded)` limits which rows are updated,
+    both built from the incoming row as `excluded`.
+    """
+    insert = _NATIVE.get(db.get_bind().dialect.name)
+    if insert is not None:
+        statement = insert(table)
+        excluded = statement.excluded
+        db.execute(statement.on_conflict_do_update(
+            index_elements=index_elements,
+            set_=set_(excluded),
+            where=where(excluded) if where is not None else None,
+        ), rows)
+        return
+    for row in rows:
+        key = and_(*[column == row[column.name] for column in index_elements])
+        if db.execute(select(*index_elements).where(key)).first() is None:
+            try:
+                with db.begin_nested():
+                    db.execute(table.insert(), [row])
+                continue
+            except IntegrityError:
+                pass
+        excluded = _Excluded(table, row)
+        condition = key if where is None else and_(key, where(excluded))
+        db.execute(table.update().where(condition).values(set_(excluded)))